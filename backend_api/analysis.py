@@ -0,0 +1,148 @@
+"""
+Lógica de negocio compartida por la API (main.py) y la ingesta por lotes (batch_ingest.py):
+propuesta de datos a partir de la extracción y aplicación de un análisis confirmado.
+"""
+import datetime
+import logging
+from typing import List, Optional
+
+from lab_trends import LabTrendStore
+from models import ClinicalEvent, ExtractedData, Medication, PatientSummary, RiskScores, SubmitAnalysisRequest
+from scoring import calculate_scores, safe_bool, score_alerts
+
+logger = logging.getLogger("hce_vision_backend.analysis")
+
+
+def propose_risk_scores(summary: PatientSummary, antecedents: Optional[dict], labs: Optional[dict]) -> RiskScores:
+    """Scores propuestos a partir de lo extraído (vacíos si el cálculo falla)."""
+    try:
+        scores_data = calculate_scores(
+            summary.demographics.age, 
+            summary.demographics.sex, 
+            antecedents or {},
+            labs or {}
+        )
+        
+        return RiskScores(
+            chads2vasc=scores_data["scores"].get("chads2vasc"),
+            has_bled=scores_data["scores"].get("has_bled"),
+            score2=scores_data["scores"].get("score2"),
+            details=scores_data["details"],
+            lipid_management=scores_data["scores"].get("lipid_management")
+        )
+    except Exception as e:
+        logger.error(f"⚠️ Error calculando scores: {e}", exc_info=True)
+        return RiskScores()
+
+def build_extracted_data(summary: PatientSummary, raw_data: dict, filenames: Optional[List[str]] = None) -> ExtractedData:
+    """Convierte el JSON crudo del modelo en la propuesta (ExtractedData) para revisión médica."""
+    # Crear evento temporal principal (Cardio)
+    temp_event = ClinicalEvent(
+        id="temp_id", 
+        date=raw_data["date"] or datetime.date.today().isoformat(),
+        type=raw_data["type"] or "otro",
+        title=raw_data["title"] or "Documentos Analizados",
+        description=raw_data["description"] or "",
+        labs=raw_data["labs"],
+        diagnostics=[d.get("normalized_name") or d.get("label_raw") for d in raw_data.get("diagnostics_detected", [])],
+        source="IA (Pendiente)",
+        # Nuevos campos
+        raw_text=raw_data.get("raw_text"),
+        lab_table_full=raw_data.get("lab_table_full"),
+        imaging_findings=raw_data.get("imaging_findings"),
+        procedures=raw_data.get("procedures"),
+        vital_signs=raw_data.get("vital_signs"),
+        medication_changes=raw_data.get("medication_changes"),
+        document_metadata=raw_data.get("document_metadata"),
+        digital_report_draft=raw_data.get("digital_report_draft")
+    )
+
+    # Calcular scores cardio
+    proposed_scores = propose_risk_scores(summary, raw_data["antecedents"], raw_data["labs"])
+
+    logger.info("✅ Extracción multi-imagen completada.")
+
+    # Sanitize antecedents to ensure all values are booleans
+    sanitized_antecedents = {}
+    if raw_data.get("antecedents"):
+        for k, v in raw_data["antecedents"].items():
+            sanitized_antecedents[k] = safe_bool(v)
+
+    return ExtractedData(
+        event=temp_event,
+        medications=raw_data["medications"] or [],
+        antecedents=sanitized_antecedents,
+        risk_scores=proposed_scores,
+        historical_data=raw_data.get("historical_data", []),
+        document_errors=[
+            {**err, "filename": filenames[err["index"]] if filenames else None}
+            for err in raw_data.get("document_errors", [])
+        ]
+    )
+
+def apply_analysis(
+    summary: PatientSummary,
+    data: SubmitAnalysisRequest,
+    source: str = "IA + Revisión Médica",
+    event_id: Optional[str] = None,
+) -> PatientSummary:
+    """
+    Incorpora al paciente un análisis confirmado: evento, medicación, scores, tendencias y alertas.
+    Compartido por /submit_analysis y la ingesta por lotes (batch_ingest.py).
+    event_id: id del evento nuevo (por defecto, el timestamp actual).
+    """
+    new_event = data.event
+    new_event.id = event_id or str(datetime.datetime.now().timestamp())
+    new_event.source = source
+    
+    summary.timeline.insert(0, new_event)
+    
+    # Actualizar Medicaciones
+    existing_meds = {m.name.lower() for m in summary.medications}
+    for med_name in data.medications:
+        if med_name.lower() not in existing_meds:
+            summary.medications.append(Medication(name=med_name))
+            
+    # Calcular scores finales
+    scores_data = calculate_scores(
+        summary.demographics.age, 
+        summary.demographics.sex, 
+        data.antecedents,
+        new_event.labs or {}
+    )
+    
+    scores_values = scores_data["scores"]
+    
+    summary.risk_scores = RiskScores(
+        chads2vasc=scores_values.get("chads2vasc"),
+        has_bled=scores_values.get("has_bled"),
+        score2=scores_values.get("score2"),
+        details=scores_data["details"],
+        lipid_management=scores_values.get("lipid_management")
+    )
+    
+    summary.antecedents = data.antecedents
+    
+    # --- ACTUALIZAR TENDENCIAS DE LABORATORIO ---
+    logger.info(f"📦 Submit Payload received. Historical Data count: {len(data.historical_data)}")
+    trends = LabTrendStore(summary.lab_trends)
+
+    # 1. Datos históricos extraídos (tablas, múltiples fechas)
+    for hist_item in data.historical_data:
+        trends.add_labs(hist_item.date, hist_item.labs)
+
+    # 2. Evento actual (fecha principal) y su tabla completa; los duplicados se saltean
+    trends.add_labs(new_event.date, new_event.labs)
+    trends.add_table(new_event.date, new_event.lab_table_full)
+
+    # 3. Normalizar nombres/unidades de todo el lote e insertar
+    trends.flush()
+
+    logger.info(f"📈 Tendencias: {trends.added} valores nuevos, {trends.duplicates} duplicados.")
+
+    # Alertas
+    lipid_mgmt = scores_values.get("lipid_management")
+    summary.alerts = score_alerts(scores_values.get("chads2vasc"), lipid_mgmt.risk_category if lipid_mgmt else None)
+
+    summary.clinical_summary = f"Paciente con {len(summary.timeline)} eventos. Último: {new_event.title}."
+    return summary
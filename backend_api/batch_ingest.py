@@ -0,0 +1,348 @@
+"""
+Ingesta por lotes de documentos en papel digitalizados (back-office).
+
+Entrada: un directorio con una carpeta por paciente (<dir>/<patient_id>/<archivos>)
+o un manifiesto JSON/JSONL con entradas {"patient_id", "files", "priority", "id"}
+(rutas relativas al manifiesto; mayor priority se procesa antes).
+
+Uso (CLI, respeta DATABASE_URL y las variables de extracción):
+    python batch_ingest.py escaneos/ --checkpoint escaneos.ckpt.jsonl --concurrency 4
+    python batch_ingest.py manifiesto.jsonl --checkpoint m.ckpt.jsonl --auto-submit --output revisar/
+
+El checkpoint registra cada entrada terminada: al relanzar con el mismo archivo se
+retoma donde quedó. Con --auto-submit los resultados que pasan la validación se
+guardan en la historia del paciente; el resto queda en --output para revisión manual.
+Los fallos de la IA (proveedor caído, datos simulados, todos los documentos con error)
+quedan como failed, para reintentarlos con --retry-failed.
+"""
+import argparse
+import asyncio
+import contextlib
+import datetime
+import hashlib
+import logging
+import mimetypes
+import os
+import sys
+import time
+
+from starlette.concurrency import run_in_threadpool
+
+import serialization
+from analysis import apply_analysis, build_extracted_data
+from database import SessionLocal, init_db, load_patient_summary, save_patient_db
+from extraction.executor import EXTRACTION_MAX_CONCURRENCY
+from extraction.pipeline import extract_documents
+from models import SubmitAnalysisRequest
+from uploads import map_file
+
+logger = logging.getLogger("hce_vision_backend.batch")
+
+BATCH_SOURCE = "IA (Ingesta por lotes)"
+# Estados finales de una entrada en el checkpoint
+SUBMITTED, EXTRACTED, NEEDS_REVIEW, FAILED = "submitted", "extracted", "needs_review", "failed"
+# Registro previo al guardado: si es el último de la entrada, el guardado quedó a medias
+SUBMITTING = "submitting"
+
+
+# --- Manifiesto ---
+
+def _entry_id(patient_id: str, files) -> str:
+    h = hashlib.sha1(patient_id.encode("utf-8"))
+    for path in sorted(files):
+        h.update(b"\0" + os.path.abspath(path).encode("utf-8"))
+    return h.hexdigest()[:16]
+
+
+def _entry(patient_id: str, files, priority: int = 0, entry_id: str = None) -> dict:
+    return {
+        "id": entry_id or _entry_id(patient_id, files),
+        "patient_id": patient_id,
+        "files": list(files),
+        "priority": int(priority or 0),
+    }
+
+
+def load_manifest(source: str):
+    """Lista de entradas {id, patient_id, files, priority} desde un directorio o manifiesto."""
+    if os.path.isdir(source):
+        entries = []
+        for patient_id in sorted(os.listdir(source)):
+            folder = os.path.join(source, patient_id)
+            if not os.path.isdir(folder):
+                continue
+            files = [os.path.join(folder, name) for name in sorted(os.listdir(folder))
+                     if os.path.isfile(os.path.join(folder, name)) and not name.startswith(".")]
+            if files:
+                entries.append(_entry(patient_id, files))
+        return entries
+
+    base = os.path.dirname(os.path.abspath(source))
+    with open(source, "rb") as f:
+        if source.endswith(".jsonl"):
+            raw_entries = [serialization.loads(line) for line in f if line.strip()]
+        else:
+            raw_entries = serialization.loads(f.read())
+    return [
+        _entry(
+            item["patient_id"],
+            [path if os.path.isabs(path) else os.path.join(base, path) for path in item["files"]],
+            item.get("priority", 0),
+            item.get("id"),
+        )
+        for item in raw_entries
+    ]
+
+
+def load_checkpoint(path: str) -> dict:
+    """{entry_id: registro} de las entradas ya terminadas (la última línea de cada id gana)."""
+    done = {}
+    if path and os.path.exists(path):
+        with open(path, "rb") as f:
+            for line in f:
+                try:
+                    record = serialization.loads(line)
+                except ValueError:
+                    continue  # línea cortada por un crash a mitad de escritura
+                done[record["id"]] = record
+    return done
+
+
+# --- Validación para el auto-submit ---
+
+def validate_extraction(raw_data: dict) -> list:
+    """Motivos por los que un resultado necesita revisión humana (vacío = se puede guardar solo)."""
+    problems = []
+    if raw_data.get("simulated"):
+        problems.append("datos simulados (IA no disponible)")
+    if raw_data.get("document_errors"):
+        problems.append(f"{len(raw_data['document_errors'])} documentos con error")
+    try:
+        datetime.date.fromisoformat(raw_data.get("date") or "")
+    except ValueError:
+        problems.append("fecha del documento ausente o inválida")
+    if not raw_data.get("title"):
+        problems.append("sin título")
+    if not raw_data.get("labs") and not raw_data.get("medications") and not raw_data.get("historical_data"):
+        problems.append("sin datos clínicos extraídos")
+    return problems
+
+
+# --- Ejecución ---
+
+def _call_db(fn, *args):
+    db = SessionLocal()
+    try:
+        return fn(db, *args)
+    finally:
+        db.close()
+
+
+def _map_files(paths, stack: contextlib.ExitStack):
+    """files_data sobre los archivos mapeados en memoria (sin leerlos enteros), válidos mientras dure stack."""
+    files_data = []
+    for path in paths:
+        f = stack.enter_context(open(path, "rb"))
+        files_data.append((map_file(f, stack), mimetypes.guess_type(path)[0] or "application/octet-stream"))
+    return files_data
+
+
+class BatchIngestor:
+    def __init__(
+        self,
+        entries,
+        checkpoint: str = None,
+        concurrency: int = EXTRACTION_MAX_CONCURRENCY,
+        auto_submit: bool = False,
+        output_dir: str = None,
+        mode: str = None,
+        retry_failed: bool = False,
+    ):
+        self.checkpoint = checkpoint
+        self.concurrency = max(1, concurrency)
+        self.auto_submit = auto_submit
+        self.output_dir = output_dir
+        self.mode = mode
+
+        done = {k: v for k, v in load_checkpoint(checkpoint).items() if v["status"] != SUBMITTING}
+        if retry_failed:
+            done = {k: v for k, v in done.items() if v["status"] != FAILED}
+        self.entries = [e for e in entries if e["id"] not in done]
+        self.skipped = len(entries) - len(self.entries)
+        self.counts = {SUBMITTED: 0, EXTRACTED: 0, NEEDS_REVIEW: 0, FAILED: 0}
+        self.documents = 0
+        self.started_at = None
+        self.finished_at = None
+        self._checkpoint_lock = asyncio.Lock()
+        self._submit_lock = asyncio.Lock()  # leer-modificar-guardar del paciente, de a una entrada
+
+    @property
+    def docs_per_minute(self) -> float:
+        if not self.started_at:
+            return 0.0
+        elapsed = (self.finished_at or time.monotonic()) - self.started_at
+        return round(self.documents * 60 / elapsed, 1) if elapsed > 0 else 0.0
+
+    def stats(self) -> dict:
+        return {
+            "total": len(self.entries) + self.skipped,
+            "skipped": self.skipped,
+            "processed": sum(self.counts.values()),
+            **self.counts,
+            "documents": self.documents,
+            "docs_per_minute": self.docs_per_minute,
+            "running": self.started_at is not None and self.finished_at is None,
+        }
+
+    async def _write_checkpoint(self, entry: dict, status: str, **extra):
+        if not self.checkpoint:
+            return
+        record = {"id": entry["id"], "patient_id": entry["patient_id"], "status": status,
+                  "documents": len(entry["files"]), **extra}
+        line = serialization.dumps_text(record) + "\n"
+        async with self._checkpoint_lock:
+            await run_in_threadpool(_append_line, self.checkpoint, line)
+
+    async def _record(self, entry: dict, status: str, **extra):
+        self.counts[status] += 1
+        await self._write_checkpoint(entry, status, **extra)
+        stats = self.stats()
+        logger.info(
+            f"📄 [{stats['processed']}/{len(self.entries)}] {entry['patient_id']}: {status} "
+            f"({self.documents} docs, {stats['docs_per_minute']} docs/min)"
+        )
+
+    async def _process(self, entry: dict):
+        summary = await run_in_threadpool(_call_db, load_patient_summary, entry["patient_id"])
+        if not summary:
+            raise ValueError("Paciente no encontrado")
+        with contextlib.ExitStack() as stack:
+            files_data = await run_in_threadpool(_map_files, entry["files"], stack)
+            raw_data = await extract_documents(files_data, mode=self.mode)
+        self.documents += len(entry["files"])
+        if raw_data.get("simulated"):
+            raise ValueError("IA no disponible: la extracción devolvió datos simulados")
+        extracted = build_extracted_data(summary, raw_data, [os.path.basename(p) for p in entry["files"]])
+
+        problems = validate_extraction(raw_data)
+        if self.auto_submit and not problems:
+            request = SubmitAnalysisRequest(patient_id=entry["patient_id"], **extracted.dict(
+                include={"event", "medications", "antecedents", "historical_data", "global_timeline_events"}
+            ))
+            # Releer y guardar juntos: otra entrada del mismo paciente pudo terminar antes
+            async with self._submit_lock:
+                await self._write_checkpoint(entry, SUBMITTING)
+                await run_in_threadpool(_submit, entry["patient_id"], request, batch_event_id(entry))
+            return SUBMITTED, {}
+
+        if self.output_dir:
+            path = os.path.join(self.output_dir, f"{entry['id']}.json")
+            payload = {"entry": entry, "problems": problems, "extracted": extracted.dict()}
+            await run_in_threadpool(_write_json, path, payload)
+        return (NEEDS_REVIEW if self.auto_submit else EXTRACTED), ({"problems": problems} if problems else {})
+
+    async def _worker(self, queue: asyncio.PriorityQueue):
+        while True:
+            _, _, entry = await queue.get()
+            try:
+                status, extra = await self._process(entry)
+            except Exception as e:
+                logger.warning(f"❌ Entrada {entry['id']} ({entry['patient_id']}) falló: {e}")
+                status, extra = FAILED, {"error": str(e) or type(e).__name__}
+            try:
+                await self._record(entry, status, **extra)
+            finally:
+                queue.task_done()
+
+    async def run(self) -> dict:
+        if self.output_dir:
+            os.makedirs(self.output_dir, exist_ok=True)
+        queue = asyncio.PriorityQueue()
+        for seq, entry in enumerate(self.entries):
+            queue.put_nowait((-entry["priority"], seq, entry))
+
+        logger.info(f"🚚 Ingesta por lotes: {len(self.entries)} entradas ({self.skipped} ya hechas), "
+                    f"{self.concurrency} en paralelo.")
+        self.started_at = time.monotonic()
+        workers = [asyncio.create_task(self._worker(queue)) for _ in range(self.concurrency)]
+        try:
+            await queue.join()
+        finally:
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            self.finished_at = time.monotonic()
+        stats = self.stats()
+        logger.info(f"✅ Ingesta terminada: {stats}")
+        return stats
+
+
+def _append_line(path: str, line: str):
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(line)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def _write_json(path: str, payload: dict):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(serialization.dumps_text(payload))
+
+
+def batch_event_id(entry: dict) -> str:
+    """Id del evento que guarda la entrada: el mismo en cada reintento."""
+    return f"batch-{entry['id']}"
+
+
+def _submit(patient_id: str, request: SubmitAnalysisRequest, event_id: str) -> bool:
+    """
+    Guarda el análisis como evento event_id. Si el paciente ya lo tiene (un guardado previo
+    se completó pero el checkpoint no llegó a registrarlo) no hace nada y devuelve False.
+    """
+    db = SessionLocal()
+    try:
+        summary = load_patient_summary(db, patient_id)
+        if any(event.id == event_id for event in summary.timeline):
+            logger.info(f"↩️ {patient_id}: el evento {event_id} ya estaba guardado.")
+            return False
+        apply_analysis(summary, request, source=BATCH_SOURCE, event_id=event_id)
+        save_patient_db(db, summary)
+        return True
+    finally:
+        db.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Ingesta por lotes de documentos (directorio o manifiesto)")
+    parser.add_argument("source", help="Directorio <dir>/<patient_id>/<archivos> o manifiesto .json/.jsonl")
+    parser.add_argument("--checkpoint", help="Archivo JSONL de progreso (para retomar)")
+    parser.add_argument("--concurrency", type=int, default=EXTRACTION_MAX_CONCURRENCY)
+    parser.add_argument("--auto-submit", action="store_true", help="Guardar los resultados que pasan la validación")
+    parser.add_argument("--output", help="Directorio para los resultados a revisar")
+    parser.add_argument("--mode", choices=["single", "per_document"])
+    parser.add_argument("--retry-failed", action="store_true", help="Reintentar las entradas que fallaron")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    init_db()
+    ingestor = BatchIngestor(
+        load_manifest(args.source),
+        checkpoint=args.checkpoint,
+        concurrency=args.concurrency,
+        auto_submit=args.auto_submit,
+        output_dir=args.output,
+        mode=args.mode,
+        retry_failed=args.retry_failed,
+    )
+    stats = asyncio.run(ingestor.run())
+    print(
+        f"✅ {stats['processed']} entradas ({stats['documents']} documentos, {stats['docs_per_minute']} docs/min): "
+        f"{stats['submitted']} guardadas, {stats['extracted']} extraídas, "
+        f"{stats['needs_review']} a revisar, {stats['failed']} con error.",
+        file=sys.stderr,
+    )
+    return 1 if stats["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,130 @@
+"""
+Exportación NDJSON en streaming e importación por lotes de pacientes.
+
+Uso (CLI, respeta DATABASE_URL):
+    python bulk.py export pacientes.ndjson
+    python bulk.py import pacientes.ndjson --batch-size 500
+
+Para migrar una clínica de SQLite a PostgreSQL: exportar con el DATABASE_URL
+de origen e importar con el de destino.
+"""
+import argparse
+import logging
+import sys
+
+from pydantic import ValidationError
+
+import serialization
+from database import SessionLocal, init_db, iter_patient_documents_db, save_patients_batch_db
+from models import PatientSummary
+
+logger = logging.getLogger("hce_vision_backend.bulk")
+
+EXPORT_BATCH_SIZE = 200
+IMPORT_BATCH_SIZE = 500
+
+
+def export_ndjson(db, batch_size: int = EXPORT_BATCH_SIZE):
+    """Genera una línea JSON (bytes) por paciente."""
+    for document in iter_patient_documents_db(db, batch_size=batch_size):
+        yield serialization.dumps(document) + b"\n"
+
+
+def export_ndjson_stream(batch_size: int = EXPORT_BATCH_SIZE):
+    """Igual que export_ndjson pero con su propia sesión (para StreamingResponse)."""
+    db = SessionLocal()
+    try:
+        yield from export_ndjson(db, batch_size)
+    finally:
+        db.close()
+
+
+def import_ndjson(db, lines, batch_size: int = IMPORT_BATCH_SIZE) -> dict:
+    """
+    Valida e inserta pacientes desde líneas NDJSON (str o bytes).
+    Cada lote se escribe en una transacción; un lote fallido no afecta a los demás.
+    """
+    stats = {"imported": 0, "failed": []}
+    batch = []  # (número de línea, PatientSummary)
+
+    def flush():
+        if not batch:
+            return
+        try:
+            rejected = save_patients_batch_db(db, [summary for _, summary in batch])
+        except Exception as e:
+            db.rollback()
+            logger.error(f"❌ Lote de importación fallido ({len(batch)} pacientes): {e}")
+            stats["failed"].extend({"line": line_no, "error": str(e)} for line_no, _ in batch)
+        else:
+            for line_no, summary in batch:
+                if summary.patient_id in rejected:
+                    stats["failed"].append({"line": line_no, "error": rejected[summary.patient_id]})
+                else:
+                    stats["imported"] += 1
+        batch.clear()
+
+    for line_no, line in enumerate(lines, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            batch.append((line_no, PatientSummary(**serialization.loads(line))))
+        except (ValueError, TypeError, ValidationError) as e:
+            stats["failed"].append({"line": line_no, "error": str(e)})
+        if len(batch) >= batch_size:
+            flush()
+    flush()
+    return stats
+
+
+def import_ndjson_file(fileobj, batch_size: int = IMPORT_BATCH_SIZE) -> dict:
+    db = SessionLocal()
+    try:
+        return import_ndjson(db, fileobj, batch_size)
+    finally:
+        db.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Exportación/importación masiva de pacientes (NDJSON)")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    exp = sub.add_parser("export", help="Exporta todos los pacientes a NDJSON")
+    exp.add_argument("output", nargs="?", default="-", help="Archivo destino ('-' = stdout)")
+    exp.add_argument("--batch-size", type=int, default=EXPORT_BATCH_SIZE)
+
+    imp = sub.add_parser("import", help="Importa pacientes desde NDJSON")
+    imp.add_argument("input", help="Archivo NDJSON ('-' = stdin)")
+    imp.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE)
+
+    args = parser.parse_args(argv)
+    init_db()
+
+    if args.command == "export":
+        out = sys.stdout.buffer if args.output == "-" else open(args.output, "wb")
+        try:
+            count = 0
+            for line in export_ndjson_stream(args.batch_size):
+                out.write(line)
+                count += 1
+        finally:
+            if out is not sys.stdout.buffer:
+                out.close()
+        print(f"✅ {count} pacientes exportados.", file=sys.stderr)
+    else:
+        src = sys.stdin.buffer if args.input == "-" else open(args.input, "rb")
+        try:
+            stats = import_ndjson_file(src, args.batch_size)
+        finally:
+            if src is not sys.stdin.buffer:
+                src.close()
+        print(f"✅ {stats['imported']} pacientes importados, {len(stats['failed'])} con error.", file=sys.stderr)
+        for failure in stats["failed"]:
+            print(f"   ❌ Línea {failure['line']}: {failure['error']}", file=sys.stderr)
+        return 1 if stats["failed"] else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
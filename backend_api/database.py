@@ -1,8 +1,27 @@
-from sqlalchemy import create_engine, Column, String, Text, Integer
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import create_engine, event, Column, String, Text, Integer, Float, LargeBinary, ForeignKey, Index, inspect, text, tuple_, update, bindparam, func
+from sqlalchemy.ext.declarative import declarative_base, declared_attr
+from sqlalchemy.orm import sessionmaker, load_only, Session
+from sqlalchemy.exc import IntegrityError
+from starlette.concurrency import run_in_threadpool
+import base64
+import datetime
+import hashlib
 import json
+import logging
 import os
+import time
+import zlib
+
+try:
+    import zstandard
+except ImportError:  # zstd es opcional; sin él se comprime con zlib
+    zstandard = None
+
+from models import PatientSummary
+from patient_cache import patient_cache
+import serialization
+
+logger = logging.getLogger("hce_vision_backend.database")
 
 # --- Configuración de la Base de Datos ---
 # En local usa SQLite. En la nube usará PostgreSQL (se lee de la variable de entorno)
@@ -12,12 +31,85 @@ DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./hce_vision.db")
 if DATABASE_URL.startswith("postgres://"):
     DATABASE_URL = DATABASE_URL.replace("postgres://", "postgresql://", 1)
 
-engine = create_engine(
-    DATABASE_URL, 
-    connect_args={"check_same_thread": False} if "sqlite" in DATABASE_URL else {}
-)
+IS_SQLITE = DATABASE_URL.startswith("sqlite")
+
+# --- Perfil de SQLite (se aplica en cada conexión nueva) ---
+# SQLITE_PROFILE=production (por defecto) activa WAL y pragmas para escrituras concurrentes;
+# SQLITE_PROFILE=off deja los valores por defecto de SQLite. Cada pragma se puede sobreescribir.
+SQLITE_PROFILE = os.getenv("SQLITE_PROFILE", "production").lower()
+SQLITE_PRAGMAS = {
+    "journal_mode": os.getenv("SQLITE_JOURNAL_MODE", "WAL"),
+    "synchronous": os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),
+    "mmap_size": int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024))),
+    "cache_size": int(os.getenv("SQLITE_CACHE_SIZE", "-64000")), # negativo = KiB (64 MB)
+    "busy_timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000")),
+}
+
+# --- Pool de conexiones (SQLite y PostgreSQL) ---
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5" if IS_SQLITE else "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10" if IS_SQLITE else "20"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+
+def _engine_kwargs(url: str) -> dict:
+    kwargs = {}
+    if ":memory:" in url or url.rstrip("/").endswith("sqlite:"):
+        # SQLite en memoria usa su propio pool de una conexión
+        return kwargs
+    kwargs.update(
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+    )
+    if not IS_SQLITE:
+        kwargs["pool_pre_ping"] = True
+    return kwargs
+
+def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    try:
+        for pragma, value in SQLITE_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {pragma}={value}")
+    finally:
+        cursor.close()
+
+def _configure_engine(sync_engine):
+    if IS_SQLITE and SQLITE_PROFILE != "off":
+        event.listen(sync_engine, "connect", _apply_sqlite_pragmas)
+    return sync_engine
+
+engine = _configure_engine(create_engine(
+    DATABASE_URL,
+    connect_args={"check_same_thread": False} if IS_SQLITE else {},
+    **_engine_kwargs(DATABASE_URL)
+))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# --- Acceso asíncrono (no bloquea el event loop de uvicorn) ---
+# aiosqlite para SQLite, asyncpg para PostgreSQL. Con DB_ASYNC=0, o si el driver
+# no está instalado, los helpers *_async ejecutan la sesión síncrona en el threadpool.
+DB_ASYNC = os.getenv("DB_ASYNC", "1").lower() in ("1", "true", "yes")
+
+def _async_database_url(url: str) -> str:
+    if url.startswith("sqlite:"):
+        return url.replace("sqlite:", "sqlite+aiosqlite:", 1)
+    if url.startswith("postgresql:"):
+        return url.replace("postgresql:", "postgresql+asyncpg:", 1)
+    return url
+
+def _create_async_engine():
+    if not DB_ASYNC:
+        return None
+    try:
+        from sqlalchemy.ext.asyncio import create_async_engine
+        async_engine = create_async_engine(_async_database_url(DATABASE_URL), **_engine_kwargs(DATABASE_URL))
+        _configure_engine(async_engine.sync_engine)
+        return async_engine
+    except ImportError as e:
+        logger.warning(f"Driver asíncrono no disponible ({e}). Se usará la sesión síncrona en threadpool.")
+        return None
+
 Base = declarative_base()
 
 # --- Modelo de Base de Datos ---
@@ -26,11 +118,250 @@ class PatientDB(Base):
 
     id = Column(String, primary_key=True, index=True)
     name = Column(String, index=True)
-    data = Column(Text) # Guardamos el JSON completo del PatientSummary aquí
+    normalized_name = Column(String) # name.lower().strip(), único (deduplicación en POST /patients)
+    data = Column(Text, default="") # LEGACY: JSON completo del PatientSummary (se migra en init_db); "" ya migrado
+    core = Column(Text) # JSON pequeño: demografía, scores, antecedentes, alertas, resumen
+    version = Column(Integer, default=0) # Se incrementa en cada guardado (invalida la caché)
+
+    # Columnas desnormalizadas para el listado (GET /patients no toca los documentos)
+    age = Column(Integer)
+    sex = Column(String)
+    alerts = Column(Text) # JSON (lista de strings)
+    risk_scores = Column(Text) # JSON: {chads2vasc, has_bled, score2} (LIST_SCORE_FIELDS)
+    last_event_date = Column(String, default="") # "" si no hay eventos (facilita la paginación por cursor)
+
+    __table_args__ = (
+        Index("ix_patients_name_id", "name", "id"),
+        Index("ix_patients_age_id", "age", "id"),
+        Index("ix_patients_last_event_id", "last_event_date", "id"),
+        Index("ix_patients_normalized_name", "normalized_name", unique=True),
+    )
+
+
+class _PatientChildMixin:
+    """
+    Columnas comunes de las tablas hijas normalizadas.
+    - row_key: identidad estable de la fila dentro del paciente (para escribir solo lo que cambió).
+    - position: orden dentro de la colección original.
+    - checksum: hash del contenido; si no cambia, la fila no se reescribe.
+    """
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    row_key = Column(String, nullable=False)
+    position = Column(Integer, nullable=False)
+    checksum = Column(String(40), nullable=False)
+
+    @declared_attr
+    def patient_id(cls):
+        return Column(String, ForeignKey("patients.id", ondelete="CASCADE"), nullable=False, index=True)
+
+    @declared_attr
+    def __table_args__(cls):
+        return (Index(f"ix_{cls.__tablename__}_patient_row", "patient_id", "row_key", unique=True),)
+
+
+class TimelineEventDB(_PatientChildMixin, Base):
+    __tablename__ = "timeline_events"
+
+    event_id = Column(String, index=True)
+    date = Column(String, index=True)
+    type = Column(String)
+    data = Column(Text) # JSON del ClinicalEvent
+
+
+class LabResultDB(_PatientChildMixin, Base):
+    __tablename__ = "lab_results"
+
+    analyte = Column(String, nullable=False, index=True)
+    date = Column(String, index=True)
+    value = Column(Float)
+    unit = Column(String)
+
+    __table_args__ = (
+        Index("ix_lab_results_patient_row", "patient_id", "row_key", unique=True),
+        # Serie de un analito por rango de fechas (GET /patients/{id}/labs/{analyte})
+        Index("ix_lab_results_patient_analyte_date", "patient_id", "analyte", "date"),
+    )
+
+
+class BloodPressureDB(_PatientChildMixin, Base):
+    __tablename__ = "blood_pressure_readings"
+
+    date = Column(String, index=True)
+    time = Column(String)
+    systolic = Column(Integer)
+    diastolic = Column(Integer)
+    heart_rate = Column(Integer)
+
+
+class MedicationDB(_PatientChildMixin, Base):
+    __tablename__ = "medications"
+
+    name = Column(String, index=True)
+    dose = Column(String)
+    schedule = Column(String)
+    route = Column(String)
+
+
+class GlobalEventDB(_PatientChildMixin, Base):
+    __tablename__ = "global_events"
+
+    date = Column(String, index=True)
+    category = Column(String)
+    description = Column(Text)
+
+
+class EventPayloadDB(Base):
+    """
+    Campos pesados de un ClinicalEvent (OCR, tabla completa, borrador de informe)
+    guardados fuera de línea y comprimidos. Se cargan solo cuando se piden.
+    """
+    __tablename__ = "event_payloads"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    patient_id = Column(String, ForeignKey("patients.id", ondelete="CASCADE"), nullable=False, index=True)
+    row_key = Column(String, nullable=False) # "<row_key del evento>|<campo>"
+    event_id = Column(String, index=True)
+    field = Column(String, nullable=False)
+    codec = Column(String, nullable=False) # "zlib" | "zstd"
+    size = Column(Integer) # bytes sin comprimir
+    checksum = Column(String(40), nullable=False)
+    payload = Column(LargeBinary)
+
+    __table_args__ = (Index("ix_event_payloads_patient_row", "patient_id", "row_key", unique=True),)
+
+
+# Scores que se copian a la fila del paciente para el listado
+LIST_SCORE_FIELDS = ("chads2vasc", "has_bled", "score2")
+
+# Campos de ClinicalEvent que se guardan fuera de línea
+HEAVY_EVENT_FIELDS = ("raw_text", "lab_table_full", "digital_report_draft")
+EVENT_PAYLOAD_CODEC = os.getenv("EVENT_PAYLOAD_CODEC", "zstd" if zstandard else "zlib")
+
+
+class ExtractionJobDB(Base):
+    """Trabajos de extracción asíncronos (POST /extract_jobs)."""
+    __tablename__ = "extraction_jobs"
+
+    id = Column(String, primary_key=True)
+    patient_id = Column(String, index=True, nullable=False)
+    status = Column(String, index=True, nullable=False) # queued | running | done | failed
+    created_at = Column(String, nullable=False)
+    updated_at = Column(String, nullable=False)
+    files = Column(Text) # JSON: [[ruta, mime_type], ...] mientras el trabajo está pendiente
+    options = Column(Text) # JSON: opciones de extracción (bypass_cache, ...)
+    result = Column(Text) # JSON del ExtractedData
+    error = Column(Text)
+    owner = Column(String) # worker que lo está procesando (running)
+    lease_until = Column(Float) # epoch: vencido el plazo, otro worker puede recuperarlo
+
+
+class DuplicatePatientNameError(ValueError):
+    """Ya existe otro paciente con el mismo nombre normalizado."""
+
+
+# Colecciones del PatientSummary que viven fuera de la fila principal
+CHILD_COLLECTIONS = ("timeline", "lab_trends", "blood_pressure_history", "medications", "global_timeline")
+CHILD_MODELS = (TimelineEventDB, LabResultDB, BloodPressureDB, MedicationDB, GlobalEventDB, EventPayloadDB)
 
 # --- Funciones Helper ---
 def init_db():
     Base.metadata.create_all(bind=engine)
+    _add_missing_columns()
+    _migrate_legacy_documents()
+    _backfill_list_columns()
+    _backfill_normalized_names()
+    _create_missing_indexes()
+
+def _add_missing_columns():
+    """Agrega columnas nuevas a tablas existentes (create_all no altera tablas ya creadas)."""
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {c["name"] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    col_type = column.type.compile(dialect=engine.dialect)
+                    conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN "{column.name}" {col_type}'))
+
+def _create_missing_indexes():
+    """Crea los índices declarados que falten en tablas ya existentes."""
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(bind=conn, checkfirst=True)
+
+def _migrate_legacy_documents():
+    """
+    Pasa los pacientes guardados como un único blob JSON al esquema normalizado.
+    El blob se valida con PatientSummary: lo migrado queda igual a lo que escribe save_patient_db.
+    data queda en "" (las tablas viejas pueden tener la columna como NOT NULL).
+    """
+    db = SessionLocal()
+    try:
+        legacy_ids = [
+            row.id for row in db.query(PatientDB.id)
+            .filter(PatientDB.core.is_(None), PatientDB.data.isnot(None), PatientDB.data != "")
+        ]
+        for patient_id in legacy_ids:
+            db_patient = db.get(PatientDB, patient_id)
+            try:
+                data = PatientSummary(**serialization.loads(db_patient.data)).dict()
+            except (ValueError, TypeError) as e:
+                logger.error(f"❌ Paciente legacy {patient_id} no migrado (documento inválido): {e}")
+                continue
+            taken = _normalized_name_taken(db, normalize_name(data["demographics"]["name"]), patient_id)
+            _write_patient(db, db_patient, data, index_name=not taken)
+            db_patient.data = ""
+            db.commit()
+    finally:
+        db.close()
+
+def _backfill_list_columns():
+    """Completa las columnas del listado en filas guardadas antes de que existieran."""
+    db = SessionLocal()
+    try:
+        pending = db.query(PatientDB).filter(
+            PatientDB.core.isnot(None), PatientDB.age.is_(None) | PatientDB.risk_scores.is_(None)
+        ).all()
+        for db_patient in pending:
+            dates = [
+                row.date for row in db.query(TimelineEventDB.date)
+                .filter(TimelineEventDB.patient_id == db_patient.id)
+            ]
+            _set_list_columns(db_patient, serialization.loads(db_patient.core), dates)
+        db.commit()
+    finally:
+        db.close()
+
+def _backfill_normalized_names():
+    """
+    Completa normalized_name en filas existentes. Si hay nombres repetidos de antes
+    de la deduplicación, solo el primero queda indexado (los demás quedan en NULL).
+    """
+    db = SessionLocal()
+    try:
+        taken = {
+            row.normalized_name for row in db.query(PatientDB.normalized_name)
+            .filter(PatientDB.normalized_name.isnot(None))
+        }
+        pending = (
+            db.query(PatientDB)
+            .filter(PatientDB.normalized_name.is_(None), PatientDB.name.isnot(None))
+            .order_by(PatientDB.id)
+            .all()
+        )
+        for db_patient in pending:
+            normalized = normalize_name(db_patient.name)
+            if normalized in taken:
+                logger.warning(f"Nombre duplicado sin indexar: {db_patient.name} ({db_patient.id})")
+                continue
+            db_patient.normalized_name = normalized
+            taken.add(normalized)
+        db.commit()
+    finally:
+        db.close()
 
 def get_db():
     db = SessionLocal()
@@ -39,49 +370,795 @@ def get_db():
     finally:
         db.close()
 
+async_engine = _create_async_engine()
+if async_engine is not None:
+    from sqlalchemy.ext.asyncio import async_sessionmaker
+    AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+else:
+    AsyncSessionLocal = None
+
+async def get_async_db():
+    """Dependencia para endpoints async: AsyncSession si hay driver, si no una Session síncrona."""
+    if AsyncSessionLocal is not None:
+        async with AsyncSessionLocal() as db:
+            yield db
+    else:
+        db = SessionLocal()
+        try:
+            yield db
+        finally:
+            await run_in_threadpool(db.close)
+
+async def _run(db, fn, *args, **kwargs):
+    """Ejecuta un helper CRUD síncrono sin bloquear el event loop."""
+    if AsyncSessionLocal is not None and not isinstance(db, Session):
+        return await db.run_sync(fn, *args, **kwargs)
+    return await run_in_threadpool(fn, db, *args, **kwargs)
+
+# --- Serialización por tabla ---
+
+def _dumps(obj) -> str:
+    return serialization.dumps_text(obj)
+
+def _checksum(payload) -> str:
+    if isinstance(payload, str):
+        payload = payload.encode("utf-8")
+    return hashlib.sha1(payload).hexdigest()
+
+def _keyed(rows):
+    """Asigna row_key a partir del contenido (desambiguando repetidos con un sufijo)."""
+    seen = {}
+    for row in rows:
+        base = row.pop("_key")
+        n = seen.get(base, 0)
+        seen[base] = n + 1
+        row["row_key"] = f"{base}#{n}"
+    return rows
+
+def _compress(data: bytes):
+    if EVENT_PAYLOAD_CODEC == "zstd" and zstandard is not None:
+        return "zstd", zstandard.ZstdCompressor(level=3).compress(data)
+    return "zlib", zlib.compress(data, 6)
+
+def _decompress(codec: str, payload: bytes):
+    if codec == "zstd":
+        data = zstandard.ZstdDecompressor().decompress(payload)
+    else:
+        data = zlib.decompress(payload)
+    return serialization.loads(data)
+
+def _sync_event_payloads(db, patient_id: str, timeline, row_keys):
+    """
+    Guarda los campos pesados de cada evento en event_payloads.
+    Un campo en None que figura en detached_fields conserva lo ya guardado (los eventos
+    leídos sin expandir vuelven así al guardarse); un None sin esa marca lo borra.
+    Los payloads se identifican por el row_key del evento (ids repetidos no se pisan).
+    Devuelve, por evento, la lista de campos que quedaron fuera de línea.
+    """
+    existing = {
+        r.row_key: r
+        for r in db.query(EventPayloadDB)
+        .options(load_only(EventPayloadDB.id, EventPayloadDB.row_key, EventPayloadDB.checksum))
+        .filter(EventPayloadDB.patient_id == patient_id)
+    }
+    detached = []
+    for event, event_key in zip(timeline, row_keys):
+        fields = []
+        marked = set(event.get("detached_fields") or ())
+        for field in HEAVY_EVENT_FIELDS:
+            payload_key = f"{event_key}|{field}"
+            current = existing.pop(payload_key, None)
+            value = event.get(field)
+            if value is None:
+                if current is not None:
+                    if field in marked:
+                        fields.append(field)
+                    else:
+                        db.delete(current)
+                continue
+
+            raw = serialization.dumps(value)
+            checksum = _checksum(raw)
+            if current is None or current.checksum != checksum:
+                codec, payload = _compress(raw)
+                values = {
+                    "event_id": event.get("id"), "field": field, "codec": codec,
+                    "size": len(raw), "checksum": checksum, "payload": payload,
+                }
+                if current is None:
+                    db.add(EventPayloadDB(patient_id=patient_id, row_key=payload_key, **values))
+                else:
+                    for k, v in values.items():
+                        setattr(current, k, v)
+            fields.append(field)
+        detached.append(fields)
+
+    for stale in existing.values():
+        db.delete(stale)
+    return detached
+
+def timeline_row_keys(event_ids) -> list:
+    """row_key de cada evento del timeline, en orden (identifica también sus campos pesados)."""
+    return [row["row_key"] for row in _keyed([{"_key": str(event_id)} for event_id in event_ids])]
+
+def _timeline_rows(db, patient_id: str, timeline):
+    rows = [{"row_key": key} for key in timeline_row_keys(event.get("id") for event in timeline)]
+    detached = _sync_event_payloads(db, patient_id, timeline, [r["row_key"] for r in rows])
+    for row, event, fields in zip(rows, timeline, detached):
+        light = dict(event)
+        for field in HEAVY_EVENT_FIELDS:
+            light[field] = None
+        light["detached_fields"] = fields or None
+        payload = _dumps(light)
+        row.update({
+            "checksum": _checksum(payload),
+            "event_id": event.get("id"),
+            "date": event.get("date"),
+            "type": event.get("type"),
+            "data": payload,
+        })
+    return rows, detached
+
+def _content_rows(items, fields, prefix=()):
+    """Filas cuyo contenido es pequeño: la clave es el propio contenido."""
+    rows = []
+    for item in items:
+        values = tuple(prefix) + tuple(item.get(f) for f in fields)
+        digest = _checksum(_dumps(values))
+        row = {f: item.get(f) for f in fields}
+        row.update({"_key": digest, "checksum": digest})
+        rows.append(row)
+    return rows
+
+def _lab_rows(lab_trends):
+    rows = []
+    for analyte, history in lab_trends.items():
+        for row in _content_rows(history, ("date", "value", "unit"), prefix=(analyte,)):
+            row["analyte"] = analyte
+            rows.append(row)
+    return _keyed(rows)
+
+def _sync_children(db, model, patient_id: str, rows, newest_first: bool = False):
+    """
+    Sincroniza las filas hijas de un paciente escribiendo solo las diferencias.
+    Con newest_first las posiciones se cuentan desde el final, así insertar al
+    principio (timeline, TA) no desplaza las filas existentes.
+    """
+    existing = {
+        r.row_key: r
+        for r in db.query(model)
+        .options(load_only(model.id, model.row_key, model.position, model.checksum))
+        .filter(model.patient_id == patient_id)
+    }
+    total = len(rows)
+    for index, row in enumerate(rows):
+        position = total - 1 - index if newest_first else index
+        current = existing.pop(row["row_key"], None)
+        if current is None:
+            db.add(model(patient_id=patient_id, position=position, **row))
+        elif current.checksum != row["checksum"]:
+            for field, value in row.items():
+                setattr(current, field, value)
+            current.position = position
+        elif current.position != position:
+            current.position = position
+
+    for stale in existing.values():
+        db.delete(stale)
+
+def normalize_name(name: str) -> str:
+    return name.lower().strip()
+
+def _normalized_name_taken(db, normalized: str, patient_id: str) -> bool:
+    return db.query(PatientDB.id).filter(
+        PatientDB.normalized_name == normalized, PatientDB.id != patient_id
+    ).first() is not None
+
+def _write_patient(db, db_patient, data: dict, index_name: bool = True):
+    """
+    Escribe un PatientSummary (como dict) en el esquema normalizado.
+    Devuelve, por evento del timeline, los campos pesados guardados fuera de línea.
+    """
+    patient_id = db_patient.id
+    core = {k: v for k, v in data.items() if k not in CHILD_COLLECTIONS}
+    core_json = _dumps(core)
+    if db_patient.core != core_json:
+        db_patient.core = core_json
+    name = data["demographics"]["name"]
+    if db_patient.name != name:
+        db_patient.name = name
+    normalized = normalize_name(name) if index_name else None
+    if db_patient.normalized_name != normalized:
+        db_patient.normalized_name = normalized
+    _set_list_columns(db_patient, data, [e.get("date") for e in data.get("timeline", [])])
+
+    timeline_rows, detached = _timeline_rows(db, patient_id, data.get("timeline", []))
+    _sync_children(db, TimelineEventDB, patient_id, timeline_rows, newest_first=True)
+    _sync_children(db, LabResultDB, patient_id, _lab_rows(data.get("lab_trends", {})))
+    _sync_children(
+        db, BloodPressureDB, patient_id,
+        _keyed(_content_rows(data.get("blood_pressure_history", []), ("date", "time", "systolic", "diastolic", "heart_rate"))),
+        newest_first=True,
+    )
+    _sync_children(
+        db, MedicationDB, patient_id,
+        _keyed(_content_rows(data.get("medications", []), ("name", "dose", "schedule", "route"))),
+    )
+    _sync_children(
+        db, GlobalEventDB, patient_id,
+        _keyed(_content_rows(data.get("global_timeline", []), ("date", "category", "description"))),
+    )
+    return detached
+
+def _list_risk_scores(risk_scores) -> str:
+    return _dumps({field: (risk_scores or {}).get(field) for field in LIST_SCORE_FIELDS})
+
+def _set_list_columns(db_patient, data: dict, event_dates):
+    demographics = data["demographics"]
+    values = {
+        "age": demographics.get("age"),
+        "sex": demographics.get("sex"),
+        "alerts": _dumps(data.get("alerts", [])),
+        "risk_scores": _list_risk_scores(data.get("risk_scores")),
+        "last_event_date": max((d for d in event_dates if d), default=""),
+    }
+    for field, value in values.items():
+        if getattr(db_patient, field) != value:
+            setattr(db_patient, field, value)
+
+def _read_children(db, patient_id: str):
+    """
+    Lee las colecciones hijas. El timeline se devuelve como fragmentos JSON tal
+    cual están guardados (sin parsear); el resto como listas/dicts.
+    """
+    events = (
+        db.query(TimelineEventDB.data)
+        .filter(TimelineEventDB.patient_id == patient_id)
+        .order_by(TimelineEventDB.position.desc())
+    )
+    timeline_fragments = [e.data for e in events]
+
+    lab_trends = {}
+    labs = (
+        db.query(LabResultDB.analyte, LabResultDB.date, LabResultDB.value, LabResultDB.unit)
+        .filter(LabResultDB.patient_id == patient_id)
+        .order_by(LabResultDB.position)
+    )
+    for lab in labs:
+        lab_trends.setdefault(lab.analyte, []).append({"date": lab.date, "value": lab.value, "unit": lab.unit})
+
+    bps = (
+        db.query(BloodPressureDB.date, BloodPressureDB.time, BloodPressureDB.systolic, BloodPressureDB.diastolic, BloodPressureDB.heart_rate)
+        .filter(BloodPressureDB.patient_id == patient_id)
+        .order_by(BloodPressureDB.position.desc())
+    )
+    meds = (
+        db.query(MedicationDB.name, MedicationDB.dose, MedicationDB.schedule, MedicationDB.route)
+        .filter(MedicationDB.patient_id == patient_id)
+        .order_by(MedicationDB.position)
+    )
+    global_events = (
+        db.query(GlobalEventDB.date, GlobalEventDB.category, GlobalEventDB.description)
+        .filter(GlobalEventDB.patient_id == patient_id)
+        .order_by(GlobalEventDB.position)
+    )
+    collections = {
+        "lab_trends": lab_trends,
+        "blood_pressure_history": [bp._asdict() for bp in bps],
+        "medications": [m._asdict() for m in meds],
+        "global_timeline": [g._asdict() for g in global_events],
+    }
+    return timeline_fragments, collections
+
+def _read_patient(db, db_patient) -> dict:
+    """Reconstruye el dict del PatientSummary desde las tablas normalizadas."""
+    data = serialization.loads(db_patient.core)
+    timeline_fragments, collections = _read_children(db, db_patient.id)
+    data["timeline"] = [serialization.loads(fragment) for fragment in timeline_fragments]
+    data.update(collections)
+    return data
+
+def _read_patient_json(db, db_patient) -> bytes:
+    """
+    Arma el JSON del PatientSummary concatenando los fragmentos guardados,
+    sin parsear ni validar (ya se validaron al escribir).
+    """
+    timeline_fragments, collections = _read_children(db, db_patient.id)
+    core = db_patient.core.encode("utf-8")
+    parts = [core[:-1], b',"timeline":[', ",".join(timeline_fragments).encode("utf-8"), b"]"]
+    for name, value in collections.items():
+        parts.append(b',"' + name.encode("ascii") + b'":')
+        parts.append(serialization.dumps(value))
+    parts.append(b"}")
+    return b"".join(parts)
+
 # --- Funciones de Acceso a Datos (CRUD) ---
 # Ahora aceptan una sesión de DB como argumento
 
+def _is_duplicate_name(error: IntegrityError) -> bool:
+    """Violación del índice único de normalized_name (SQLite nombra la columna; PostgreSQL, el índice)."""
+    message = str(error.orig)
+    return "ix_patients_normalized_name" in message or "patients.normalized_name" in message
+
 def save_patient_db(db, patient_summary):
-    # Serializar a JSON
-    patient_json = patient_summary.json()
-    
     # Buscar si existe
     db_patient = db.query(PatientDB).filter(PatientDB.id == patient_summary.patient_id).first()
-    
-    if db_patient:
-        db_patient.name = patient_summary.demographics.name
-        db_patient.data = patient_json
-    else:
+
+    if not db_patient:
         db_patient = PatientDB(
             id=patient_summary.patient_id,
             name=patient_summary.demographics.name,
-            data=patient_json
         )
         db.add(db_patient)
-    
-    db.commit()
+
+    # Solo se escriben las filas que cambiaron
+    detached = _write_patient(db, db_patient, patient_summary.dict())
+    _bump_version(db_patient)
+
+    try:
+        # La versión se lee dentro de la transacción: la caché queda con la de este guardado
+        db.flush()
+        version = db_patient.version
+        db.commit()
+    except IntegrityError as e:
+        db.rollback()
+        patient_cache.invalidate(patient_summary.patient_id)
+        if _is_duplicate_name(e):
+            raise DuplicatePatientNameError(f"Ya existe un paciente llamado {patient_summary.demographics.name}") from e
+        raise
     db.refresh(db_patient)
+    patient_cache.put(db_patient.id, version, _detached_copy(patient_summary, detached))
     return db_patient
 
+def _bump_version(db_patient):
+    """version + 1 calculado en el UPDATE (dos guardados concurrentes nunca repiten versión)."""
+    if inspect(db_patient).pending:
+        db_patient.version = 1
+    else:
+        db_patient.version = func.coalesce(PatientDB.version, 0) + 1
+
+def _detached_copy(patient_summary, detached):
+    """Copia del summary tal como queda en la BD: sin campos pesados, con sus referencias."""
+    light_events = [
+        event.copy(update={**{f: None for f in HEAVY_EVENT_FIELDS}, "detached_fields": fields or None})
+        for event, fields in zip(patient_summary.timeline, detached)
+    ]
+    return patient_summary.copy(update={"timeline": light_events}).copy(deep=True)
+
+def create_patient_db(db, patient_summary):
+    """
+    Inserta un paciente nuevo. Si en paralelo otro request creó el mismo nombre,
+    el índice único lo rechaza y se devuelve el paciente ganador (dict).
+    Devuelve None si se insertó el nuevo.
+    """
+    try:
+        save_patient_db(db, patient_summary)
+        return None
+    except DuplicatePatientNameError:
+        return find_patient_by_name_db(db, patient_summary.demographics.name)
+
+def find_patient_by_name_db(db, name: str):
+    """Búsqueda indexada por nombre normalizado."""
+    row = db.query(PatientDB.id).filter(PatientDB.normalized_name == normalize_name(name)).first()
+    if row:
+        return get_patient_db(db, row.id)
+    return None
+
 def get_patient_db(db, patient_id: str):
     db_patient = db.query(PatientDB).filter(PatientDB.id == patient_id).first()
     if db_patient:
-        # Deserializar JSON a Diccionario (Pydantic lo convertirá a Objeto luego)
-        return json.loads(db_patient.data)
+        if db_patient.core is None and db_patient.data:
+            # Fila legacy todavía no migrada
+            return serialization.loads(db_patient.data)
+        # Diccionario (Pydantic lo convertirá a Objeto luego)
+        return _read_patient(db, db_patient)
     return None
 
+def get_patient_json_db(db, patient_id: str):
+    """JSON del PatientSummary como bytes, listo para enviar al cliente (o None)."""
+    db_patient = db.query(PatientDB).filter(PatientDB.id == patient_id).first()
+    if db_patient is None:
+        return None
+    if db_patient.core is None and db_patient.data:
+        # Fila legacy no migrada: se valida para devolver lo mismo que el camino validado
+        return serialization.dumps(PatientSummary(**serialization.loads(db_patient.data)).dict())
+    return _read_patient_json(db, db_patient)
+
+def load_patient_summary(db, patient_id: str):
+    """
+    Devuelve el PatientSummary validado usando la caché en memoria.
+    Solo consulta la versión de la fila; si coincide con la cacheada no relee
+    ni revalida el documento. Devuelve una copia: el llamador puede modificarla.
+    """
+    row = db.query(PatientDB.version).filter(PatientDB.id == patient_id).first()
+    if row is None:
+        patient_cache.invalidate(patient_id)
+        return None
+    version = row.version or 0
+
+    summary = patient_cache.get(patient_id, version)
+    if summary is None:
+        summary = PatientSummary(**get_patient_db(db, patient_id))
+        patient_cache.put(patient_id, version, summary)
+    return summary.copy(deep=True)
+
+def load_event_payloads(db, patient_id: str, fields=HEAVY_EVENT_FIELDS, event_keys=None):
+    """
+    Lee y descomprime campos pesados. Devuelve {row_key del evento: {campo: valor}}
+    (ver timeline_row_keys); event_keys limita la lectura a esos eventos.
+    """
+    fields = list(fields)
+    query = db.query(EventPayloadDB.row_key, EventPayloadDB.field, EventPayloadDB.codec, EventPayloadDB.payload).filter(
+        EventPayloadDB.patient_id == patient_id, EventPayloadDB.field.in_(fields)
+    )
+    if event_keys is not None:
+        query = query.filter(EventPayloadDB.row_key.in_([f"{key}|{field}" for key in event_keys for field in fields]))
+    result = {}
+    for row in query:
+        result.setdefault(row.row_key.rsplit("|", 1)[0], {})[row.field] = _decompress(row.codec, row.payload)
+    return result
+
+def expand_event_fields(db, summary, fields=HEAVY_EVENT_FIELDS):
+    """Reinserta en el summary los campos pesados pedidos (modifica el objeto)."""
+    fields = [f for f in fields if f in HEAVY_EVENT_FIELDS]
+    keys = timeline_row_keys(e.id for e in summary.timeline)
+    wanted = [
+        key for key, e in zip(keys, summary.timeline)
+        if e.detached_fields and set(fields) & set(e.detached_fields)
+    ]
+    if not wanted:
+        return summary
+    payloads = load_event_payloads(db, summary.patient_id, fields, wanted)
+    for event, key in zip(summary.timeline, keys):
+        loaded = payloads.get(key, {})
+        for field, value in loaded.items():
+            setattr(event, field, value)
+        if event.detached_fields:
+            event.detached_fields = [f for f in event.detached_fields if f not in loaded] or None
+    return summary
+
 def get_all_patients_db(db):
     patients = db.query(PatientDB).all()
     result = {}
     for p in patients:
-        result[p.id] = json.loads(p.data)
+        result[p.id] = serialization.loads(p.data) if p.core is None and p.data else _read_patient(db, p)
     return result
 
+# Tamaño de página de GET /patients cuando se pagina con cursor pero sin limit
+PATIENT_LIST_PAGE_SIZE = 100
+
+PATIENT_LIST_SORTS = {
+    "name": PatientDB.name,
+    "age": PatientDB.age,
+    "last_event_date": PatientDB.last_event_date,
+}
+
+def _encode_cursor(sort_value, patient_id: str) -> str:
+    raw = json.dumps([sort_value, patient_id]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+def _decode_cursor(cursor: str):
+    try:
+        sort_value, patient_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Cursor inválido: {cursor}") from e
+    return sort_value, patient_id
+
+def list_patients_page_db(db, limit: int = PATIENT_LIST_PAGE_SIZE, cursor: str = None, sort: str = "name", order: str = "asc"):
+    """
+    Listado liviano de pacientes con paginación por cursor (keyset).
+    Lee solo las columnas desnormalizadas, nunca los documentos completos.
+    Devuelve (items, next_cursor); next_cursor es None en la última página.
+    limit=None devuelve todos (listado sin paginar).
+    """
+    if sort not in PATIENT_LIST_SORTS:
+        raise ValueError(f"Orden no soportado: {sort}")
+    sort_col = PATIENT_LIST_SORTS[sort]
+    descending = order == "desc"
+
+    query = db.query(
+        PatientDB.id, PatientDB.name, PatientDB.age, PatientDB.sex, PatientDB.alerts, PatientDB.risk_scores,
+        PatientDB.last_event_date,
+    ).filter(PatientDB.core.isnot(None))
+
+    if cursor:
+        sort_value, last_id = _decode_cursor(cursor)
+        key = tuple_(sort_col, PatientDB.id)
+        query = query.filter(key < (sort_value, last_id) if descending else key > (sort_value, last_id))
+
+    if descending:
+        query = query.order_by(sort_col.desc(), PatientDB.id.desc())
+    else:
+        query = query.order_by(sort_col.asc(), PatientDB.id.asc())
+
+    rows = query.limit(limit + 1).all() if limit is not None else query.all()
+    next_cursor = None
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = _encode_cursor(getattr(last, sort), last.id)
+
+    items = [
+        {
+            "patient_id": r.id,
+            "demographics": {"name": r.name, "age": r.age, "sex": r.sex},
+            "alerts": serialization.loads(r.alerts) if r.alerts else [],
+            "risk_scores": serialization.loads(r.risk_scores) if r.risk_scores else {},
+            "last_event_date": r.last_event_date or None,
+        }
+        for r in rows
+    ]
+    return items, next_cursor
+
 def delete_patient_db(db, patient_id: str):
     db_patient = db.query(PatientDB).filter(PatientDB.id == patient_id).first()
     if db_patient:
+        for model in CHILD_MODELS:
+            db.query(model).filter(model.patient_id == patient_id).delete(synchronize_session=False)
         db.delete(db_patient)
         db.commit()
+        patient_cache.invalidate(patient_id)
         return True
     return False
+
+# --- Exportación / importación masiva ---
+
+def iter_patient_documents_db(db, batch_size: int = 200):
+    """
+    Recorre todos los pacientes como dicts completos (campos pesados incluidos),
+    con cursor del lado del servidor (yield_per): la memoria no crece con el registro.
+    """
+    ids = db.query(PatientDB.id).order_by(PatientDB.id).yield_per(batch_size)
+    for row in ids:
+        db_patient = db.get(PatientDB, row.id)
+        if db_patient.core is None and db_patient.data:
+            data = serialization.loads(db_patient.data)
+        else:
+            data = _read_patient(db, db_patient)
+            payloads = load_event_payloads(db, row.id)
+            keys = timeline_row_keys(event.get("id") for event in data["timeline"])
+            for event, key in zip(data["timeline"], keys):
+                event.update(payloads.get(key, {}))
+                event["detached_fields"] = None
+        db.expunge(db_patient)
+        yield data
+
+def save_patients_batch_db(db, summaries):
+    """
+    Inserta/actualiza varios PatientSummary en UNA sola transacción.
+    Los que chocan con un nombre existente se saltean.
+    Devuelve {patient_id: error} de los rechazados.
+    """
+    rejected = {}
+    batch_names = set()
+    written = []
+    for summary in summaries:
+        normalized = normalize_name(summary.demographics.name)
+        if normalized in batch_names or _normalized_name_taken(db, normalized, summary.patient_id):
+            rejected[summary.patient_id] = f"Ya existe un paciente llamado {summary.demographics.name}"
+            continue
+        batch_names.add(normalized)
+
+        db_patient = db.get(PatientDB, summary.patient_id)
+        if db_patient is None:
+            db_patient = PatientDB(id=summary.patient_id, name=summary.demographics.name)
+            db.add(db_patient)
+        _write_patient(db, db_patient, summary.dict())
+        _bump_version(db_patient)
+        written.append(summary.patient_id)
+
+    db.commit()
+    for patient_id in written:
+        patient_cache.invalidate(patient_id)
+    return rejected
+
+# --- Recálculo masivo de scores (scoring.py) ---
+
+def count_scorable_patients_db(db) -> int:
+    return db.query(func.count(PatientDB.id)).filter(PatientDB.core.isnot(None)).scalar()
+
+def iter_score_inputs_db(db, batch_size: int = 2000):
+    """
+    Recorre el registro por lotes (paginación por id) con lo que necesitan los scores:
+    [(id, versión, core, último LDL o None), ...]. No arma el PatientSummary: el core
+    trae demografía y antecedentes, y el LDL sale de lab_results (el último por fecha).
+    """
+    last_id = None
+    while True:
+        query = db.query(PatientDB.id, PatientDB.version, PatientDB.core).filter(PatientDB.core.isnot(None))
+        if last_id is not None:
+            query = query.filter(PatientDB.id > last_id)
+        rows = query.order_by(PatientDB.id).limit(batch_size).all()
+        if not rows:
+            return
+        ldl = {}
+        labs = (
+            db.query(LabResultDB.patient_id, LabResultDB.value)
+            .filter(
+                LabResultDB.patient_id.between(rows[0].id, rows[-1].id),
+                LabResultDB.analyte == "ldl",
+                LabResultDB.value.isnot(None),
+            )
+            .order_by(LabResultDB.patient_id, LabResultDB.date, LabResultDB.position)
+        )
+        for lab in labs:
+            ldl[lab.patient_id] = lab.value
+        yield [(r.id, r.version or 0, serialization.loads(r.core), ldl.get(r.id)) for r in rows]
+        last_id = rows[-1].id
+
+def write_risk_scores_db(db, updates) -> int:
+    """
+    Escribe en bloque (un executemany) [(id, versión leída, core, alertas), ...].
+    Solo toca las filas cuya versión no cambió desde la lectura (un guardado concurrente
+    gana); incrementa la versión e invalida la caché. Devuelve cuántas filas se escribieron.
+    """
+    table = PatientDB.__table__
+    stmt = (
+        update(table)
+        .where(table.c.id == bindparam("b_id"), func.coalesce(table.c.version, 0) == bindparam("b_version"))
+        .values(
+            core=bindparam("b_core"), alerts=bindparam("b_alerts"), risk_scores=bindparam("b_risk_scores"),
+            version=bindparam("b_new_version"),
+        )
+    )
+    params = [
+        {"b_id": patient_id, "b_version": version, "b_new_version": version + 1,
+         "b_core": _dumps(core), "b_alerts": _dumps(alerts), "b_risk_scores": _list_risk_scores(core.get("risk_scores"))}
+        for patient_id, version, core, alerts in updates
+    ]
+    result = db.execute(stmt, params)
+    db.commit()
+    for patient_id, *_ in updates:
+        patient_cache.invalidate(patient_id)
+    return result.rowcount
+
+# --- Series de laboratorio ---
+
+def load_lab_series_db(db, patient_id: str, analyte: str, date_from: str = None, date_to: str = None):
+    """
+    [(fecha, valor, unidad), ...] de un analito ordenado por fecha, directo de lab_results
+    (sin armar el PatientSummary). None si el paciente no existe.
+    """
+    query = (
+        db.query(LabResultDB.date, LabResultDB.value, LabResultDB.unit)
+        .filter(LabResultDB.patient_id == patient_id, LabResultDB.analyte == analyte)
+    )
+    if date_from:
+        query = query.filter(LabResultDB.date >= date_from)
+    if date_to:
+        query = query.filter(LabResultDB.date <= date_to)
+    rows = [tuple(row) for row in query.order_by(LabResultDB.date, LabResultDB.position)]
+    if not rows and db.query(PatientDB.id).filter(PatientDB.id == patient_id).first() is None:
+        return None
+    return rows
+
+# --- Trabajos de extracción ---
+
+def _job_to_dict(job) -> dict:
+    return {
+        "job_id": job.id,
+        "patient_id": job.patient_id,
+        "status": job.status,
+        "created_at": job.created_at,
+        "updated_at": job.updated_at,
+        "files": serialization.loads(job.files) if job.files else [],
+        "options": serialization.loads(job.options) if job.options else {},
+        "result": serialization.loads(job.result) if job.result else None,
+        "error": job.error,
+    }
+
+def create_extraction_job_db(db, job_id: str, patient_id: str, files, options=None) -> dict:
+    now = datetime.datetime.now().isoformat()
+    job = ExtractionJobDB(
+        id=job_id, patient_id=patient_id, status="queued", created_at=now, updated_at=now,
+        files=_dumps(files), options=_dumps(options or {}),
+    )
+    db.add(job)
+    db.commit()
+    return _job_to_dict(job)
+
+def claim_extraction_job_db(db, job_id: str, owner: str, lease_seconds: float):
+    """
+    Pasa el trabajo de 'queued' a 'running' a nombre de owner con un UPDATE condicional.
+    Devuelve el trabajo si este worker lo tomó, None si ya lo tenía otro.
+    """
+    claimed = db.execute(
+        update(ExtractionJobDB)
+        .where(ExtractionJobDB.id == job_id, ExtractionJobDB.status == "queued")
+        .values(
+            status="running", owner=owner, lease_until=time.time() + lease_seconds,
+            updated_at=datetime.datetime.now().isoformat(),
+        )
+    ).rowcount
+    db.commit()
+    return get_extraction_job_db(db, job_id) if claimed == 1 else None
+
+def renew_extraction_job_lease_db(db, job_id: str, owner: str, lease_seconds: float) -> bool:
+    """Extiende el plazo de un trabajo que este worker sigue procesando."""
+    renewed = db.execute(
+        update(ExtractionJobDB)
+        .where(ExtractionJobDB.id == job_id, ExtractionJobDB.status == "running", ExtractionJobDB.owner == owner)
+        .values(lease_until=time.time() + lease_seconds)
+    ).rowcount
+    db.commit()
+    return renewed == 1
+
+def requeue_expired_extraction_jobs_db(db) -> int:
+    """Vuelve a 'queued' los trabajos 'running' cuyo plazo venció (el worker que los tenía murió)."""
+    requeued = db.execute(
+        update(ExtractionJobDB)
+        .where(
+            ExtractionJobDB.status == "running",
+            (ExtractionJobDB.lease_until.is_(None)) | (ExtractionJobDB.lease_until < time.time()),
+        )
+        .values(status="queued", owner=None, lease_until=None, updated_at=datetime.datetime.now().isoformat())
+    ).rowcount
+    db.commit()
+    return requeued
+
+def update_extraction_job_db(db, job_id: str, status: str, result=None, error: str = None, clear_files: bool = False):
+    job = db.get(ExtractionJobDB, job_id)
+    if job is None:
+        return None
+    job.status = status
+    job.updated_at = datetime.datetime.now().isoformat()
+    if status != "running":
+        job.owner = None
+        job.lease_until = None
+    if result is not None:
+        job.result = _dumps(result)
+    if error is not None:
+        job.error = error
+    if clear_files:
+        job.files = None
+    db.commit()
+    return _job_to_dict(job)
+
+def get_extraction_job_db(db, job_id: str):
+    job = db.get(ExtractionJobDB, job_id)
+    return _job_to_dict(job) if job else None
+
+def list_unfinished_extraction_jobs_db(db):
+    """Trabajos en cola para re-encolar al iniciar (los 'running' vencidos se recuperan antes)."""
+    jobs = (
+        db.query(ExtractionJobDB)
+        .filter(ExtractionJobDB.status == "queued")
+        .order_by(ExtractionJobDB.created_at)
+    )
+    return [_job_to_dict(job) for job in jobs]
+
+# --- Versiones async de los helpers CRUD ---
+# Reutilizan la lógica síncrona (AsyncSession.run_sync) para no duplicar el mapeo.
+
+async def save_patient_db_async(db, patient_summary):
+    return await _run(db, save_patient_db, patient_summary)
+
+async def get_patient_db_async(db, patient_id: str):
+    return await _run(db, get_patient_db, patient_id)
+
+async def load_lab_series_db_async(db, patient_id: str, analyte: str, date_from: str = None, date_to: str = None):
+    return await _run(db, load_lab_series_db, patient_id, analyte, date_from, date_to)
+
+async def get_patient_json_db_async(db, patient_id: str):
+    return await _run(db, get_patient_json_db, patient_id)
+
+async def load_patient_summary_async(db, patient_id: str):
+    return await _run(db, load_patient_summary, patient_id)
+
+async def load_event_payloads_async(db, patient_id: str, fields=HEAVY_EVENT_FIELDS, event_keys=None):
+    return await _run(db, load_event_payloads, patient_id, fields, event_keys)
+
+async def expand_event_fields_async(db, summary, fields=HEAVY_EVENT_FIELDS):
+    return await _run(db, expand_event_fields, summary, fields)
+
+async def delete_patient_db_async(db, patient_id: str):
+    return await _run(db, delete_patient_db, patient_id)
+
+async def list_patients_page_db_async(db, **kwargs):
+    return await _run(db, list_patients_page_db, **kwargs)
+
+async def create_patient_db_async(db, patient_summary):
+    return await _run(db, create_patient_db, patient_summary)
+
+async def find_patient_by_name_db_async(db, name: str):
+    return await _run(db, find_patient_by_name_db, name)
@@ -0,0 +1,51 @@
+import os
+import threading
+
+from extraction.base import Extractor
+from extraction.gemini import EXTRACTION_TIMEOUT_SECONDS, GeminiExtractor
+from extraction.resilience import CircuitBreaker, ResilientExtractor, TokenBucket
+from extraction.stub import HttpStubExtractor, StubExtractor
+
+# --- Registro de backends de extracción ---
+# EXTRACTOR_BACKEND elige el backend (gemini | stub | http_stub). Cada uno se crea una
+# sola vez, envuelto con el límite de cuota, los reintentos y el circuit breaker.
+
+BACKENDS = {
+    "gemini": GeminiExtractor,
+    "stub": StubExtractor,
+    "http_stub": HttpStubExtractor,
+}
+
+EXTRACTOR_RATE_PER_MINUTE = float(os.getenv("EXTRACTOR_RATE_PER_MINUTE", "60"))
+EXTRACTOR_BURST = float(os.getenv("EXTRACTOR_BURST", "10"))
+EXTRACTOR_MAX_RETRIES = int(os.getenv("EXTRACTOR_MAX_RETRIES", "3"))
+EXTRACTOR_BACKOFF_BASE = float(os.getenv("EXTRACTOR_BACKOFF_BASE", "1.0"))
+EXTRACTOR_BACKOFF_MAX = float(os.getenv("EXTRACTOR_BACKOFF_MAX", "20"))
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RESET_SECONDS = float(os.getenv("CIRCUIT_RESET_SECONDS", "30"))
+
+_instances = {}
+_lock = threading.Lock()
+
+
+def current_backend_name() -> str:
+    return os.getenv("EXTRACTOR_BACKEND", "gemini").lower()
+
+
+def get_extractor_backend(name: str = None) -> Extractor:
+    name = name or current_backend_name()
+    if name not in BACKENDS:
+        raise ValueError(f"EXTRACTOR_BACKEND desconocido: {name} (opciones: {', '.join(BACKENDS)})")
+    with _lock:
+        extractor = _instances.get(name)
+        if extractor is None:
+            extractor = _instances[name] = ResilientExtractor(
+                BACKENDS[name](),
+                limiter=TokenBucket(EXTRACTOR_RATE_PER_MINUTE / 60.0, EXTRACTOR_BURST),
+                breaker=CircuitBreaker(CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_SECONDS),
+                max_retries=EXTRACTOR_MAX_RETRIES,
+                backoff_base=EXTRACTOR_BACKOFF_BASE,
+                backoff_max=EXTRACTOR_BACKOFF_MAX,
+                deadline=EXTRACTION_TIMEOUT_SECONDS,
+            )
+        return extractor
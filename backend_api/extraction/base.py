@@ -0,0 +1,25 @@
+import json
+
+
+class Extractor:
+    """
+    Interfaz de los backends de extracción (Gemini, stub local, stub HTTP).
+    extract() recibe [(contenido, mime_type), ...] y devuelve el JSON del modelo;
+    si la llamada falla levanta la excepción (el fallback lo decide quien llama).
+    timeout: segundos máximos de la llamada al proveedor (None: el del backend).
+    """
+
+    name = "base"
+
+    def warm(self):
+        """Crea clientes/conexiones antes del primer request (opcional)."""
+
+    def extract(self, files_data, timeout: float = None) -> dict:
+        raise NotImplementedError
+
+    def extract_stream(self, files_data, timeout: float = None):
+        """Genera el texto JSON de la respuesta a medida que llega (por defecto, de una vez)."""
+        yield json.dumps(self.extract(files_data, timeout=timeout), ensure_ascii=False)
+
+    def stats(self) -> dict:
+        return {"backend": self.name}
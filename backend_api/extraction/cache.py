@@ -0,0 +1,121 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+
+from extraction.gemini import PROMPT_VERSION
+
+logger = logging.getLogger("hce_vision_backend.extraction")
+
+# --- Caché de extracciones por contenido ---
+# Clave: SHA-256 del conjunto de archivos subidos + versión del prompt.
+# Valor: el JSON ya parseado que devolvió el modelo. Se guarda en disco (un archivo
+# por clave) con desalojo LRU por tamaño total (usa el mtime como último acceso).
+
+EXTRACTION_CACHE_ENABLED = os.getenv("EXTRACTION_CACHE_ENABLED", "1").lower() in ("1", "true", "yes")
+EXTRACTION_CACHE_DIR = os.getenv("EXTRACTION_CACHE_DIR", os.path.join(os.path.dirname(__file__), "cache"))
+EXTRACTION_CACHE_MAX_BYTES = int(os.getenv("EXTRACTION_CACHE_MAX_BYTES", str(200 * 1024 * 1024)))
+
+
+def extraction_cache_key(files_data, prompt_version: str = PROMPT_VERSION) -> str:
+    """Clave independiente del orden de los archivos."""
+    digests = sorted(
+        f"{mime}:{hashlib.sha256(content).hexdigest()}" for content, mime in files_data
+    )
+    h = hashlib.sha256(prompt_version.encode("utf-8"))
+    for digest in digests:
+        h.update(b"\0" + digest.encode("ascii"))
+    return h.hexdigest()
+
+
+class ExtractionCache:
+    def __init__(self, directory: str = EXTRACTION_CACHE_DIR, max_bytes: int = EXTRACTION_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._total_bytes = None  # se calcula la primera vez que hace falta
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key: str):
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                result = json.loads(f.read())
+            os.utime(path)  # marca de último acceso para el LRU
+        except (OSError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return result
+
+    def put(self, key: str, result: dict):
+        os.makedirs(self.directory, exist_ok=True)
+        data = json.dumps(result, ensure_ascii=False).encode("utf-8")
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        path = self._path(key)
+        previous = os.path.getsize(path) if os.path.exists(path) else 0
+        os.replace(tmp_path, path)
+        with self._lock:
+            self.writes += 1
+            if self._total_bytes is not None:
+                self._total_bytes += len(data) - previous
+            self._evict_if_needed()
+
+    def _scan(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".json"):
+                continue
+            try:
+                st = os.stat(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, name))
+        return entries
+
+    def _evict_if_needed(self):
+        if self._total_bytes is None:
+            self._total_bytes = sum(size for _, size, _ in self._scan())
+        if self._total_bytes <= self.max_bytes:
+            return
+        entries = sorted(self._scan())  # más viejo primero
+        self._total_bytes = sum(size for _, size, _ in entries)
+        for _, size, name in entries:
+            if self._total_bytes <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            self._total_bytes -= size
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "enabled": EXTRACTION_CACHE_ENABLED,
+                "directory": self.directory,
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "writes": self.writes,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / total, 3) if total else 0.0,
+            }
+
+
+extraction_cache = ExtractionCache()
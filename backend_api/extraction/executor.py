@@ -0,0 +1,54 @@
+import asyncio
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from extraction.gemini import EXTRACTION_TIMEOUT_SECONDS
+
+logger = logging.getLogger("hce_vision_backend.extraction")
+
+# --- Ejecución de extracciones fuera del event loop ---
+# Las llamadas al LLM son síncronas y tardan segundos: se ejecutan en un pool de
+# hilos acotado para que el worker de uvicorn siga atendiendo otros requests.
+
+EXTRACTION_MAX_CONCURRENCY = int(os.getenv("EXTRACTION_MAX_CONCURRENCY", "4"))
+
+# Los hilos del pool son los turnos: una llamada que venció el timeout sigue ocupando el
+# suyo hasta que termina (por eso los backends cortan la llamada con su propio timeout)
+_executor = ThreadPoolExecutor(max_workers=EXTRACTION_MAX_CONCURRENCY, thread_name_prefix="extraction")
+
+
+class ExtractionTimeoutError(Exception):
+    """La extracción superó el tiempo máximo permitido."""
+
+
+async def run_extraction(fn, *args, timeout: float = EXTRACTION_TIMEOUT_SECONDS, **kwargs):
+    """
+    Ejecuta fn(*args) en el pool de extracción.
+    Como máximo EXTRACTION_MAX_CONCURRENCY llamadas a la vez; el resto espera en la cola
+    del pool sin bloquear el event loop. El timeout cuenta desde que un hilo empieza a
+    ejecutar la llamada (no incluye la espera en la cola). Al vencer se deja de esperar,
+    pero el hilo queda ocupado hasta que fn vuelve: fn debe cortar por su cuenta.
+    """
+    loop = asyncio.get_running_loop()
+    started = asyncio.Event()
+
+    def call():
+        loop.call_soon_threadsafe(started.set)
+        return fn(*args, **kwargs)
+
+    future = loop.run_in_executor(_executor, call)
+    waiting = asyncio.ensure_future(started.wait())
+    try:
+        await asyncio.wait((future, waiting), return_when=asyncio.FIRST_COMPLETED)
+    except asyncio.CancelledError:
+        future.cancel()  # si todavía no empezó, sale de la cola del pool
+        raise
+    finally:
+        waiting.cancel()
+
+    try:
+        return await asyncio.wait_for(future, timeout)
+    except asyncio.TimeoutError as e:
+        logger.error(f"⏱️ Extracción cancelada tras {timeout}s")
+        raise ExtractionTimeoutError(f"La extracción superó {timeout:.0f} segundos") from e
@@ -0,0 +1,214 @@
+import datetime
+import json
+import logging
+import os
+import threading
+from typing import List
+
+import google.generativeai as genai
+
+from extraction.base import Extractor
+
+logger = logging.getLogger("hce_vision_backend.extraction")
+
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "models/gemini-flash-latest")
+
+# Versión del prompt: forma parte de la clave de la caché de extracciones.
+# Cambiarla cada vez que se modifique EXTRACTION_PROMPT (el modelo ya va incluido).
+PROMPT_VERSION = f"{GEMINI_MODEL.rsplit('/', 1)[-1]}/v1"
+
+# Timeout por llamada al modelo (segundos)
+EXTRACTION_TIMEOUT_SECONDS = float(os.getenv("EXTRACTION_TIMEOUT_SECONDS", "120"))
+
+EXTRACTION_PROMPT = """
+        Eres un modelo clínico experto en cardiología e internista. Tu tarea es extraer datos de DOCUMENTOS MÉDICOS para una Historia Clínica Electrónica.
+        
+        🚨 INSTRUCCIÓN CRÍTICA: DIGITALIZACIÓN COMPLETA 🚨
+        Tu objetivo no es solo extraer un resumen, sino CAPTURAR TODA la información del documento para crear una versión digital fidedigna y estructurada.
+        
+        Debes devolver un JSON VÁLIDO con la siguiente estructura COMPLETA:
+
+        {
+            "date": "YYYY-MM-DD", // Fecha del documento. Usar null si no se encuentra.
+            "type": "laboratorio" | "imagen" | "medicacion" | "epicrisis" | "procedimiento" | "consulta" | "otro",
+            "title": "Título descriptivo del documento",
+            "description": "Resumen clínico conciso del contenido.",
+
+            "antecedents": {
+                "hta": boolean, "diabetes": boolean, "heart_failure": boolean, "atrial_fibrillation": boolean,
+                "acs_history": boolean, "stroke": boolean, "vascular_disease": boolean, "renal_disease": boolean,
+                "liver_disease": boolean, "bleeding_history": boolean, "labile_inr": boolean, "alcohol_drugs": boolean,
+                "smoking": boolean, "obesity": boolean, "sedentary": boolean, "dyslipidemia": boolean
+            },
+
+            "labs": { 
+                // AQUÍ SOLO VA LA COLUMNA MÁS RECIENTE DETECTADA
+                "ldl": { "value": number, "unit": "mg/dL" },
+                // ... (resto de laboratorios igual que antes)
+                "creatinine": { "value": number, "unit": "mg/dL" },
+                # INCLUIR TODOS LOS LABS PREVIOS: bnp, ntprobnp, troponin, hemoglobin, hba1c, glucose, potassium, sodium, etc.
+            },
+
+            "historical_data": [
+                 { "date": "YYYY-MM-DD", "labs": { ... } } // Columnas anteriores de tablas evolutivas
+            ],
+
+            "medications": [ "Nombre medicamento 1", "Nombre medicamento 2" ],
+
+            // --- NUEVOS CAMPOS DE DIGITALIZACIÓN COMPLETA ---
+            
+            "raw_text": "TEXTO CRUDO COMPLETO DEL INFORME (OCR)",
+
+            "lab_table_full": [
+                {
+                    "row_raw": "texto completo de la fila",
+                    "test_name_raw": "nombre original",
+                    "normalized_test_name": "nombre estandarizado si es posible",
+                    "value_raw": "valor tal como aparece",
+                    "value": number | null,
+                    "unit": "unidades",
+                    "reference_range_raw": "rango de referencia si aparece",
+                    "flag_raw": "indicador H/L/*"
+                }
+            ],
+
+            "diagnostics_detected": [
+                 { "label_raw": "texto hallazgo", "category": "diagnostico_principal | secundario | hallazgo" }
+            ],
+
+            "imaging_findings": [
+                 { 
+                    "section": "Sección (ej: VI)", 
+                    "text": "Hallazgo textual",
+                    "structured": { "lvef": number, "severity": "leve|mod|sev" }
+                 }
+            ],
+
+            "procedures": [
+                 { "date": "YYYY-MM-DD", "type": "...", "description": "..." }
+            ],
+
+            "vital_signs": {
+                 "blood_pressure": { "systolic": number, "diastolic": number, "unit": "mmHg" },
+                 "heart_rate": { "value": number, "unit": "lpm" },
+                 "weight": { "value": number, "unit": "kg" },
+                 "height": { "value": number, "unit": "cm" },
+                 "bmi": number
+            },
+
+            "medication_changes": [
+                 { "name_raw": "...", "action": "iniciar|suspender|ajustar", "dose_raw": "..." }
+            ],
+
+            "document_metadata": {
+                 "institution": "...", "service": "...", "physician": "..."
+            },
+
+            "digital_report_draft": {
+                "format": "markdown",
+                "content": "Genera aquí un reporte LEGIBLE en Markdown que replique el informe original. \nEstructura SUGERIDA:\n# [Institución] - [Tipo de Informe]\n**Fecha:** [Fecha] | **Paciente:** [Nombre si hay]\n\n## Resumen / Motivo\n...\n\n## Hallazgos / Laboratorio\n(Tabla o lista bonita)\n\n## Conclusiones\n...\n\nRecrea el formato visual del papel lo mejor posible usando Markdown."
+            }
+        }
+
+        REGLAS:
+        1. SOLO JSON VÁLIDO.
+        2. Si hay tablas evolutivas, usa 'historical_data'.
+        3. 'raw_text' debe contener todo el texto extraído.
+        4. Sé exhaustivo con 'lab_table_full' para capturar valores que no encajan en 'labs'.
+        """
+
+def fake_llm_extract(text: str) -> dict:
+    logger.info("🤖 Usando Extracción Simulada (Fallback)")
+    return {
+        "simulated": True, # Marca para no cachear ni auto-guardar datos de ejemplo
+        "date": datetime.date.today().isoformat(),
+        "type": "laboratorio",
+        "title": "Análisis Simulado (Fallback)",
+        "description": "No se pudo conectar con la IA real. Se muestran datos de ejemplo.",
+        "antecedents": {"hta": True, "diabetes": False},
+        "labs": {},
+        "medications": [],
+        "global_timeline_events": [],
+        # Simulación de nuevos campos
+        "raw_text": "Texto simulado del informe...",
+        "lab_table_full": [],
+        "imaging_findings": [],
+        "procedures": [],
+        "vital_signs": None,
+        "medication_changes": [],
+        "document_metadata": {"institution": "Simulated Hospital"},
+        "digital_report_draft": {
+            "format": "markdown",
+            "content": "# Informe Simulado\n\nEste es un informe generado porque no hay conexión con IA."
+        }
+    }
+
+class GeminiExtractor(Extractor):
+    """
+    Envía MÚLTIPLES documentos (imágenes o PDFs) a Gemini para extracción estructurada.
+    El GenerativeModel se crea una sola vez (warm) y se reutiliza entre llamadas.
+    """
+
+    name = "gemini"
+
+    def __init__(self, model_name: str = GEMINI_MODEL):
+        self.model_name = model_name
+        self._model = None
+        self._lock = threading.Lock()
+
+    def warm(self):
+        if self._model is None and os.environ.get("GEMINI_API_KEY"):
+            with self._lock:
+                if self._model is None:
+                    self._model = genai.GenerativeModel(self.model_name)
+                    logger.info(f"🧠 Cliente Gemini listo ({self.model_name}).")
+
+    @staticmethod
+    def _content_parts(files_data) -> list:
+        # Construir el payload con Prompt + Todos los archivos (con su mime type)
+        content_parts = [EXTRACTION_PROMPT]
+        for content, mime in files_data:
+            if mime == "text/plain":
+                # Texto ya extraído de un PDF digital: va como texto, sin tokens de visión
+                content_parts.append("Texto extraído de un PDF:\n" + bytes(content).decode("utf-8"))
+                continue
+            # El SDK necesita bytes: recién acá se copia el buffer (mmap/memoryview)
+            content_parts.append({'mime_type': mime, 'data': bytes(content)})
+        return content_parts
+
+    def extract(self, files_data: List[tuple[bytes, str]], timeout: float = None) -> dict:
+        """
+        files_data: Lista de tuplas (contenido, mime_type); el contenido puede ser bytes, mmap o memoryview
+        Si la llamada falla levanta la excepción (sin API key devuelve datos simulados).
+        """
+        if not os.environ.get("GEMINI_API_KEY"):
+            return fake_llm_extract("simulated")
+        self.warm()
+
+        logger.info(f"🧠 Enviando {len(files_data)} documentos a Gemini ({self.model_name})...")
+        content_parts = self._content_parts(files_data)
+        response = self._model.generate_content(
+            content_parts, request_options={"timeout": timeout or EXTRACTION_TIMEOUT_SECONDS}
+        )
+
+        text_response = response.text.strip()
+        if text_response.startswith("```json"):
+            text_response = text_response[7:]
+        if text_response.endswith("```"):
+            text_response = text_response[:-3]
+
+        logger.info("✅ Respuesta de Gemini recibida y parseada.")
+        return json.loads(text_response)
+
+    def extract_stream(self, files_data, timeout: float = None):
+        """Misma llamada que extract, con stream=True: genera el texto a medida que llega."""
+        if not os.environ.get("GEMINI_API_KEY"):
+            yield json.dumps(fake_llm_extract("simulated"), ensure_ascii=False)
+            return
+        self.warm()
+        logger.info(f"🧠 Enviando {len(files_data)} documentos a Gemini en streaming ({self.model_name})...")
+        response = self._model.generate_content(
+            self._content_parts(files_data), stream=True, request_options={"timeout": timeout or EXTRACTION_TIMEOUT_SECONDS}
+        )
+        for chunk in response:
+            yield chunk.text
@@ -0,0 +1,69 @@
+import json
+
+# --- Parser JSON incremental ---
+# El modelo genera el objeto JSON de a fragmentos. Este parser recibe esos fragmentos y
+# devuelve cada miembro de primer nivel ("title", "labs", ...) apenas se cierra, sin
+# esperar al resto del documento (raw_text, digital_report_draft, que son los más largos).
+
+
+class IncrementalJSONObjectParser:
+    def __init__(self):
+        self._started = False  # ya se vio la '{' raíz
+        self._finished = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._member = []  # texto del miembro de primer nivel en curso
+        self.result = {}
+
+    def feed(self, chunk: str):
+        """Procesa un fragmento. Devuelve [(clave, valor), ...] de los miembros completados."""
+        completed = []
+        for ch in chunk:
+            if self._finished:
+                break
+            if not self._started:
+                if ch == "{":  # se ignora lo anterior (p. ej. el ```json del modelo)
+                    self._started = True
+                    self._depth = 1
+                continue
+
+            if self._in_string:
+                self._member.append(ch)
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                continue
+
+            if ch == '"':
+                self._in_string = True
+            elif ch in "{[":
+                self._depth += 1
+            elif ch in "}]":
+                self._depth -= 1
+                if self._depth == 0:  # cierre del objeto raíz
+                    self._finished = True
+                    self._flush(completed)
+                    break
+            elif ch == "," and self._depth == 1:
+                self._flush(completed)
+                continue
+            self._member.append(ch)
+        return completed
+
+    def _flush(self, completed):
+        text = "".join(self._member).strip()
+        self._member = []
+        if not text:
+            return
+        member = json.loads("{" + text + "}")
+        for key, value in member.items():
+            self.result[key] = value
+            completed.append((key, value))
+
+    @property
+    def finished(self) -> bool:
+        return self._finished
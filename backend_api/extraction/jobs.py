@@ -0,0 +1,209 @@
+import asyncio
+import contextlib
+import logging
+import os
+import shutil
+import socket
+import uuid
+
+from starlette.concurrency import run_in_threadpool
+
+from uploads import map_file
+from database import (
+    SessionLocal,
+    claim_extraction_job_db,
+    create_extraction_job_db,
+    update_extraction_job_db,
+    get_extraction_job_db,
+    list_unfinished_extraction_jobs_db,
+    renew_extraction_job_lease_db,
+    requeue_expired_extraction_jobs_db,
+)
+
+logger = logging.getLogger("hce_vision_backend.extraction")
+
+# --- Cola de trabajos de extracción ---
+# POST /extract_jobs devuelve un job_id al instante; un pool de workers asyncio procesa
+# los trabajos en segundo plano. El estado vive en la tabla extraction_jobs (sobrevive a
+# reinicios) y los archivos subidos se guardan en disco hasta que el trabajo termina.
+# Cada worker toma un trabajo con un UPDATE condicional (queued -> running) y lo retiene
+# con un plazo (lease) que renueva mientras procesa; si el proceso muere, al vencer el
+# plazo otro proceso lo recupera al iniciar.
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+JOB_FINISHED = (JOB_DONE, JOB_FAILED)
+
+EXTRACTION_JOB_WORKERS = int(os.getenv("EXTRACTION_JOB_WORKERS", "2"))
+EXTRACTION_JOB_LEASE_SECONDS = float(os.getenv("EXTRACTION_JOB_LEASE_SECONDS", "300"))
+EXTRACTION_JOBS_DIR = os.getenv("EXTRACTION_JOBS_DIR", os.path.join(os.path.dirname(__file__), "job_files"))
+
+
+def _call_db(fn, *args, **kwargs):
+    db = SessionLocal()
+    try:
+        return fn(db, *args, **kwargs)
+    finally:
+        db.close()
+
+
+class ExtractionJobQueue:
+    """
+    handler: corrutina (patient_id, files_data, options) -> dict con el resultado.
+    Si levanta una excepción el trabajo queda como 'failed' con el mensaje de error.
+    """
+
+    def __init__(
+        self, handler, workers: int = EXTRACTION_JOB_WORKERS, directory: str = EXTRACTION_JOBS_DIR,
+        lease_seconds: float = EXTRACTION_JOB_LEASE_SECONDS,
+    ):
+        self.handler = handler
+        self.workers = workers
+        self.directory = directory
+        self.lease_seconds = lease_seconds
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._queue = None
+        self._tasks = []
+        self._listeners = {}  # job_id -> {asyncio.Event}
+
+    # --- Archivos de cada trabajo ---
+
+    def _save_files(self, job_id: str, files_data):
+        job_dir = os.path.join(self.directory, job_id)
+        os.makedirs(job_dir, exist_ok=True)
+        stored = []
+        for i, (content, mime) in enumerate(files_data):
+            path = os.path.join(job_dir, str(i))
+            with open(path, "wb") as f:
+                f.write(content)
+            stored.append([path, mime])
+        return stored
+
+    @staticmethod
+    def _load_files(stored, stack: contextlib.ExitStack):
+        files_data = []
+        for path, mime in stored:
+            f = stack.enter_context(open(path, "rb"))
+            files_data.append((map_file(f, stack), mime))
+        return files_data
+
+    def _remove_files(self, job_id: str):
+        shutil.rmtree(os.path.join(self.directory, job_id), ignore_errors=True)
+
+    # --- Ciclo de vida ---
+
+    async def start(self):
+        if self._queue is not None:
+            return
+        self._queue = asyncio.Queue()
+        # Re-encolar lo pendiente y lo que quedó a medias con el plazo vencido; los 'running'
+        # vigentes los está procesando otro proceso
+        await run_in_threadpool(_call_db, requeue_expired_extraction_jobs_db)
+        for job in await run_in_threadpool(_call_db, list_unfinished_extraction_jobs_db):
+            self._queue.put_nowait(job["job_id"])
+        if self._queue.qsize():
+            logger.info(f"🔁 {self._queue.qsize()} trabajos de extracción re-encolados.")
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._queue = None
+
+    async def submit(self, patient_id: str, files_data, options: dict = None) -> dict:
+        await self.start()
+        job_id = str(uuid.uuid4())
+        stored = await run_in_threadpool(self._save_files, job_id, files_data)
+        job = await run_in_threadpool(_call_db, create_extraction_job_db, job_id, patient_id, stored, options)
+        self._queue.put_nowait(job_id)
+        logger.info(f"📨 Trabajo de extracción {job_id} encolado ({len(files_data)} archivos).")
+        return job
+
+    async def get(self, job_id: str):
+        return await run_in_threadpool(_call_db, get_extraction_job_db, job_id)
+
+    # --- Workers ---
+
+    async def _set_status(self, job_id: str, status: str, **kwargs):
+        job = await run_in_threadpool(_call_db, update_extraction_job_db, job_id, status, **kwargs)
+        self._notify(job_id)
+        return job
+
+    async def _worker(self):
+        while True:
+            job_id = await self._queue.get()
+            try:
+                await self._process(job_id)
+            except Exception as e:
+                logger.error(f"🔥 Error inesperado en el worker de extracción ({job_id}): {e}", exc_info=True)
+            finally:
+                self._queue.task_done()
+
+    def _notify(self, job_id: str):
+        for event in self._listeners.get(job_id, ()):
+            event.set()
+
+    async def _renew_lease(self, job_id: str):
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            renewed = await run_in_threadpool(
+                _call_db, renew_extraction_job_lease_db, job_id, self.owner, self.lease_seconds
+            )
+            if not renewed:
+                logger.warning(f"⚠️ Se perdió el plazo del trabajo de extracción {job_id}.")
+                return
+
+    async def _process(self, job_id: str):
+        job = await run_in_threadpool(_call_db, claim_extraction_job_db, job_id, self.owner, self.lease_seconds)
+        if job is None:
+            return  # terminado, inexistente o tomado por otro worker
+        self._notify(job_id)
+        lease = asyncio.create_task(self._renew_lease(job_id))
+        try:
+            with contextlib.ExitStack() as stack:
+                files_data = self._load_files(job["files"], stack)
+                result = await self.handler(job["patient_id"], files_data, job["options"])
+        except Exception as e:
+            error = getattr(e, "detail", None) or str(e) or type(e).__name__
+            logger.warning(f"❌ Trabajo de extracción {job_id} falló: {error}")
+            await self._set_status(job_id, JOB_FAILED, error=str(error), clear_files=True)
+        else:
+            logger.info(f"✅ Trabajo de extracción {job_id} completado.")
+            await self._set_status(job_id, JOB_DONE, result=result, clear_files=True)
+        finally:
+            lease.cancel()
+        await run_in_threadpool(self._remove_files, job_id)
+
+    async def watch(self, job_id: str, poll_interval: float = 1.0):
+        """
+        Genera el estado del trabajo cada vez que cambia, hasta que termina.
+        Además de las notificaciones locales consulta la base cada poll_interval,
+        así también ve trabajos procesados por otro worker de uvicorn.
+        """
+        last_status = None
+        while True:
+            event = asyncio.Event()
+            self._listeners.setdefault(job_id, set()).add(event)
+            try:
+                job = await self.get(job_id)
+                if job is None:
+                    return
+                if job["status"] != last_status:
+                    last_status = job["status"]
+                    yield job
+                if job["status"] in JOB_FINISHED:
+                    return
+                try:
+                    await asyncio.wait_for(event.wait(), poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+            finally:
+                listeners = self._listeners.get(job_id)
+                if listeners is not None:
+                    listeners.discard(event)
+                    if not listeners:
+                        del self._listeners[job_id]
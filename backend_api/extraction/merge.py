@@ -0,0 +1,86 @@
+import json
+
+# --- Unión de extracciones por documento ---
+# En el modo por documento cada archivo se extrae por separado y acá se combinan los
+# JSON en uno solo con la misma forma que devuelve el modelo. El resultado no depende
+# del orden en que terminaron las llamadas: solo del índice de cada documento y su fecha.
+
+LIST_FIELDS = (
+    "historical_data",
+    "lab_table_full",
+    "global_timeline_events",
+    "diagnostics_detected",
+    "imaging_findings",
+    "procedures",
+    "medication_changes",
+)
+
+
+def _key(value) -> str:
+    return json.dumps(value, sort_keys=True, ensure_ascii=False, default=str)
+
+
+def _unique(items, key=_key):
+    seen = set()
+    result = []
+    for item in items:
+        k = key(item)
+        if k not in seen:
+            seen.add(k)
+            result.append(item)
+    return result
+
+
+def merge_extractions(results) -> dict:
+    """
+    results: [(índice_documento, dict), ...]. Reglas:
+    - date/type/title/document_metadata: del primer documento que los tenga.
+    - labs y vital_signs: gana el documento más reciente (fecha, y a igual fecha el último índice).
+    - antecedentes: True si algún documento lo marca.
+    - listas: concatenadas en orden de documento, sin duplicados exactos.
+    - medicamentos: sin duplicados (sin distinguir mayúsculas).
+    """
+    by_index = [data for _, data in sorted(results, key=lambda r: r[0])]
+    by_recency = [data for _, data in sorted(results, key=lambda r: (r[1].get("date") or "", r[0]))]
+
+    def first(field):
+        return next((d[field] for d in by_index if d.get(field)), None)
+
+    merged = {
+        "date": first("date"),
+        "type": first("type"),
+        "title": first("title"),
+        "description": "\n\n".join(_unique(d["description"] for d in by_index if d.get("description"))),
+        "document_metadata": first("document_metadata"),
+        "simulated": any(d.get("simulated") for d in by_index),
+    }
+    if len(by_index) > 1 and merged["title"]:
+        merged["title"] = f"{merged['title']} (+{len(by_index) - 1} documentos)"
+
+    antecedents = {}
+    for data in by_index:
+        for name, value in (data.get("antecedents") or {}).items():
+            antecedents[name] = antecedents.get(name, False) or value is True or str(value).lower() in ("true", "si", "sí", "1")
+    merged["antecedents"] = antecedents
+
+    labs = {}
+    vital_signs = None
+    for data in by_recency:
+        labs.update(data.get("labs") or {})
+        vital_signs = data.get("vital_signs") or vital_signs
+    merged["labs"] = labs
+    merged["vital_signs"] = vital_signs
+
+    for field in LIST_FIELDS:
+        merged[field] = _unique(item for d in by_index for item in (d.get(field) or []))
+    merged["historical_data"].sort(key=lambda h: h.get("date") or "")
+    merged["medications"] = _unique(
+        (m for d in by_index for m in (d.get("medications") or [])),
+        key=lambda m: str(m).strip().lower(),
+    )
+
+    merged["raw_text"] = "\n\n".join(d["raw_text"] for d in by_index if d.get("raw_text")) or None
+    reports = [d["digital_report_draft"]["content"] for d in by_index
+               if (d.get("digital_report_draft") or {}).get("content")]
+    merged["digital_report_draft"] = {"format": "markdown", "content": "\n\n---\n\n".join(reports)} if reports else None
+    return merged
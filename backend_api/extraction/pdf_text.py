@@ -0,0 +1,89 @@
+import hashlib
+import io
+import logging
+import os
+
+try:
+    from pypdf import PdfReader, PdfWriter
+except ImportError:  # pypdf es opcional: sin él los PDFs van al LLM tal cual
+    PdfReader = None
+
+logger = logging.getLogger("hce_vision_backend.extraction")
+
+# --- Vía rápida para PDFs digitales ---
+# La mayoría de los PDFs de laboratorio ya traen capa de texto. En vez de mandar el PDF
+# al modelo multimodal (tokens de visión por página) se manda el texto extraído, página
+# por página. Solo las páginas escaneadas (imágenes con poco o ningún texto) siguen
+# viajando como PDF. Las páginas vacías (sin texto ni imágenes) y las duplicadas se descartan.
+
+PDF_TEXT_ENABLED = os.getenv("PDF_TEXT_ENABLED", "1").lower() in ("1", "true", "yes")
+PDF_TEXT_MIN_CHARS = int(os.getenv("PDF_TEXT_MIN_CHARS", "40"))  # menos que esto = página escaneada
+
+
+def _fingerprint(text: str) -> str:
+    return hashlib.sha1(" ".join(text.split()).encode("utf-8")).hexdigest()
+
+
+def _image_fingerprint(page):
+    """Hash del contenido y las imágenes de una página sin texto; None si está vacía."""
+    resources = page.get("/Resources")
+    xobjects = resources.get_object().get("/XObject") if resources else None
+    if not xobjects:
+        return None
+    h = hashlib.sha1()
+    for name in sorted(xobjects.get_object()):
+        obj = xobjects.get_object()[name].get_object()
+        try:
+            h.update(obj.get_data())
+        except Exception:
+            h.update(name.encode("utf-8"))
+    return h.hexdigest()
+
+
+def split_pdf(content: bytes, min_chars: int = PDF_TEXT_MIN_CHARS):
+    """
+    Devuelve (partes, info). partes: [(contenido, mime_type), ...] con el texto de las
+    páginas digitales ("text/plain") y, si quedan, un PDF con las páginas escaneadas.
+    Si el PDF no se puede leer se devuelve tal cual.
+    """
+    reader = PdfReader(io.BytesIO(content))
+    if reader.is_encrypted:
+        return [(content, "application/pdf")], {"pages": 0, "text_pages": 0, "dropped_pages": 0}
+
+    texts = []
+    scanned = PdfWriter()
+    seen = set()
+    dropped = 0
+    for number, page in enumerate(reader.pages, 1):
+        text = (page.extract_text() or "").strip()
+        if len(text) >= min_chars:
+            key = "t" + _fingerprint(text)
+        else:
+            # Poco texto: si hay imágenes es una página escaneada; si no, el texto corto
+            # (p. ej. "Troponina: 45 ng/L") se manda igual. Vacía solo sin texto ni imágenes.
+            image_key = _image_fingerprint(page)
+            if image_key:
+                key = "i" + image_key
+            else:
+                key = "t" + _fingerprint(text) if text else None
+        if key is None or key in seen:
+            dropped += 1  # página vacía o repetida
+            continue
+        seen.add(key)
+        if key[0] == "t":
+            texts.append(f"[Página {number}]\n{text}")
+        else:
+            scanned.add_page(page)
+
+    info = {"pages": len(reader.pages), "text_pages": len(texts), "dropped_pages": dropped}
+    if not texts and not dropped:
+        return [(content, "application/pdf")], info  # todo escaneado: no hace falta reescribirlo
+
+    parts = []
+    if texts:
+        parts.append(("\n\n".join(texts).encode("utf-8"), "text/plain"))
+    if len(scanned.pages):
+        out = io.BytesIO()
+        scanned.write(out)
+        parts.append((out.getvalue(), "application/pdf"))
+    return parts, info
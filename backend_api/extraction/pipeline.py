@@ -0,0 +1,171 @@
+import asyncio
+import logging
+import os
+
+from starlette.concurrency import run_in_threadpool
+
+from extraction.cache import extraction_cache, extraction_cache_key, EXTRACTION_CACHE_ENABLED
+from extraction.executor import run_extraction
+from extraction.backends import get_extractor_backend
+from extraction.gemini import PROMPT_VERSION
+from extraction.incremental import IncrementalJSONObjectParser
+from extraction.merge import merge_extractions
+from extraction.preprocess import preprocess_document, preprocess_documents
+from extraction.resilience import CircuitOpenError, ExtractionProviderError, RateLimitError
+
+logger = logging.getLogger("hce_vision_backend.extraction")
+
+
+# 'single': todos los archivos en una sola llamada al modelo.
+# 'per_document': una llamada por archivo (en paralelo) y unión determinística de los resultados.
+EXTRACTION_MODE = os.getenv("EXTRACTION_MODE", "single")
+
+
+class DocumentExtractionError(Exception):
+    """En modo 'per_document' fallaron todos los documentos (errors: [{index, error}])."""
+
+    def __init__(self, errors):
+        detail = "; ".join(f"[{e['index']}] {e['error']}" for e in errors)
+        super().__init__(f"Falló la extracción de los {len(errors)} documentos: {detail}")
+        self.errors = errors
+
+
+def get_extractor(strict: bool = False):
+    """
+    Función de extracción del backend configurado (EXTRACTOR_BACKEND).
+    strict: los errores se propagan tal cual. Si no, los errores del modelo se levantan como
+    ExtractionProviderError (502/503); CircuitOpenError y RateLimitError se propagan siempre.
+    Nunca se devuelven datos simulados por un error: eso queda para el stub y la falta de API key.
+    """
+    backend = get_extractor_backend()
+    if strict:
+        return backend.extract
+
+    def extract_or_simulate(files_data):
+        try:
+            return backend.extract(files_data)
+        except (CircuitOpenError, RateLimitError):
+            raise
+        except Exception as e:
+            logger.error(f"❌ Error llamando a {backend.name}: {e}", exc_info=True)
+            raise ExtractionProviderError(backend.name, e) from e
+
+    return extract_or_simulate
+
+
+async def _extract_per_document(files_data) -> dict:
+    """
+    Una extracción por documento (acotadas por el pool de extracción) y unión de los resultados.
+    Si fallan todos levanta DocumentExtractionError con el error de cada uno.
+    """
+    groups = await asyncio.gather(*(
+        preprocess_document(content, mime, i) for i, (content, mime) in enumerate(files_data)
+    ))
+    extractor = get_extractor(strict=True)
+    outcomes = await asyncio.gather(
+        *(run_extraction(extractor, parts) for parts in groups),
+        return_exceptions=True,
+    )
+
+    results, errors = [], []
+    for index, outcome in enumerate(outcomes):
+        if isinstance(outcome, Exception):
+            logger.warning(f"❌ Falló la extracción del documento {index}: {outcome}")
+            errors.append({"index": index, "error": str(outcome) or type(outcome).__name__})
+        else:
+            results.append((index, outcome))
+
+    if not results:
+        raise DocumentExtractionError(errors)
+    raw_data = merge_extractions(results)
+    raw_data["document_errors"] = errors
+    logger.info(f"🧩 Extracción por documento: {len(results)} ok, {len(errors)} con error.")
+    return raw_data
+
+
+async def extract_documents(files_data, bypass_cache: bool = False, mode: str = None) -> dict:
+    """
+    Punto de entrada de la extracción: caché por contenido + preprocesamiento de imágenes
+    + llamada al LLM en el pool.
+    files_data: lista de (contenido, mime_type). La clave de caché usa los archivos originales.
+    Con bypass_cache se ignora la caché al leer (el resultado nuevo igual se guarda).
+    mode: 'single' o 'per_document' (por defecto EXTRACTION_MODE).
+    """
+    mode = mode or EXTRACTION_MODE
+    prompt_version = PROMPT_VERSION if mode == "single" else f"{PROMPT_VERSION}/{mode}"
+    key = await run_in_threadpool(extraction_cache_key, files_data, prompt_version) if EXTRACTION_CACHE_ENABLED else None
+
+    if key and not bypass_cache:
+        cached = await run_in_threadpool(extraction_cache.get, key)
+        if cached is not None:
+            logger.info(f"⚡ Extracción servida desde caché ({key[:12]}...)")
+            return cached
+
+    if mode == "per_document":
+        raw_data = await _extract_per_document(files_data)
+    else:
+        files_data = await preprocess_documents(files_data)
+        raw_data = await run_extraction(get_extractor(), files_data)
+
+    # Los datos simulados (stub o sin API key) y los parciales nunca se cachean
+    if key and not raw_data.get("simulated") and not raw_data.get("document_errors"):
+        await run_in_threadpool(extraction_cache.put, key, raw_data)
+    return raw_data
+
+
+async def stream_extraction(files_data, bypass_cache: bool = False, mode: str = None):
+    """
+    Igual que extract_documents, pero genera (clave, valor) por cada sección de primer
+    nivel del JSON apenas el modelo la termina de escribir.
+    Con un hit de caché, o en modo 'per_document' (el resultado es la fusión de varias
+    llamadas), las secciones salen todas juntas al final.
+    """
+    if (mode or EXTRACTION_MODE) == "per_document":
+        for item in (await extract_documents(files_data, bypass_cache=bypass_cache, mode="per_document")).items():
+            yield item
+        return
+
+    key = await run_in_threadpool(extraction_cache_key, files_data) if EXTRACTION_CACHE_ENABLED else None
+    if key and not bypass_cache:
+        cached = await run_in_threadpool(extraction_cache.get, key)
+        if cached is not None:
+            logger.info(f"⚡ Extracción servida desde caché ({key[:12]}...)")
+            for item in cached.items():
+                yield item
+            return
+
+    files_data = await preprocess_documents(files_data)
+    backend = get_extractor_backend()
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+
+    def produce():
+        # Corre en el pool de extracción; los fragmentos cruzan al event loop por la cola
+        for chunk in backend.extract_stream(files_data):
+            loop.call_soon_threadsafe(queue.put_nowait, ("chunk", chunk))
+        loop.call_soon_threadsafe(queue.put_nowait, ("end", None))
+
+    def on_done(task):
+        if not task.cancelled() and task.exception() is not None:
+            queue.put_nowait(("error", task.exception()))
+
+    task = asyncio.ensure_future(run_extraction(produce))
+    task.add_done_callback(on_done)
+    parser = IncrementalJSONObjectParser()
+    try:
+        while True:
+            kind, payload = await queue.get()
+            if kind == "error":
+                raise payload
+            if kind == "end":
+                break
+            for item in parser.feed(payload):
+                yield item
+    finally:
+        if not task.done():
+            task.cancel()  # el cliente se desconectó: dejar de esperar al modelo
+
+    if not parser.finished:
+        raise ValueError("La respuesta del modelo terminó antes de cerrar el JSON")
+    if key and not parser.result.get("simulated"):
+        await run_in_threadpool(extraction_cache.put, key, parser.result)
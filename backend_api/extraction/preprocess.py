@@ -0,0 +1,191 @@
+import asyncio
+import io
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    from PIL import Image, ImageChops, ImageOps
+except ImportError:  # Pillow es opcional: sin él las imágenes van al LLM tal cual
+    Image = None
+
+from extraction.pdf_text import PDF_TEXT_ENABLED, PdfReader, split_pdf
+
+logger = logging.getLogger("hce_vision_backend.extraction")
+
+# --- Preprocesamiento de imágenes antes del LLM ---
+# Las fotos del celular llegan a resolución completa de cámara. Antes de mandarlas al
+# modelo se reducen (dimensión máxima), se recortan los bordes, se pasan a escala de
+# grises/JPEG y se descarta el EXIF. Corre en un pool de procesos para no competir por
+# el GIL con el event loop. Los PDFs pasan por la vía de texto (extraction/pdf_text.py).
+
+IMAGE_PREPROCESS_ENABLED = os.getenv("IMAGE_PREPROCESS_ENABLED", "1").lower() in ("1", "true", "yes")
+IMAGE_MAX_DIMENSION = int(os.getenv("IMAGE_MAX_DIMENSION", "2048"))
+IMAGE_JPEG_QUALITY = int(os.getenv("IMAGE_JPEG_QUALITY", "80"))
+IMAGE_GRAYSCALE = os.getenv("IMAGE_GRAYSCALE", "1").lower() in ("1", "true", "yes")
+IMAGE_AUTOCROP = os.getenv("IMAGE_AUTOCROP", "1").lower() in ("1", "true", "yes")
+IMAGE_PREPROCESS_WORKERS = int(os.getenv("IMAGE_PREPROCESS_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Los workers no se crean con fork: el proceso de la API tiene hilos (pools de extracción
+# y de la base) y un fork puede heredar sus locks tomados
+IMAGE_PREPROCESS_START_METHOD = os.getenv(
+    "IMAGE_PREPROCESS_START_METHOD",
+    "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn",
+)
+
+AUTOCROP_THRESHOLD = 24  # diferencia de gris con el color del borde que ya cuenta como contenido
+AUTOCROP_MIN_AREA = 0.2  # no recortar si el contenido detectado es menos del 20% de la imagen
+
+PREPROCESS_MIME_TYPES = ("image/jpeg", "image/png", "image/webp", "image/bmp", "image/tiff")
+
+
+def _autocrop(image):
+    """Recorta los márgenes del color de la esquina superior izquierda (fondo/mesa/papel)."""
+    gray = image.convert("L")
+    background = Image.new("L", gray.size, gray.getpixel((0, 0)))
+    mask = ImageChops.difference(gray, background).point(lambda p: 255 if p > AUTOCROP_THRESHOLD else 0)
+    bbox = mask.getbbox()
+    if not bbox:
+        return image
+    area = (bbox[2] - bbox[0]) * (bbox[3] - bbox[1])
+    if area < AUTOCROP_MIN_AREA * image.width * image.height:
+        return image
+    return image.crop(bbox)
+
+
+def preprocess_image(
+    content: bytes,
+    max_dimension: int = IMAGE_MAX_DIMENSION,
+    quality: int = IMAGE_JPEG_QUALITY,
+    grayscale: bool = IMAGE_GRAYSCALE,
+    autocrop: bool = IMAGE_AUTOCROP,
+) -> bytes:
+    """Devuelve la imagen procesada como JPEG (sin EXIF). Corre en el proceso worker."""
+    with Image.open(io.BytesIO(content)) as original:
+        image = ImageOps.exif_transpose(original)  # aplicar la rotación antes de tirar el EXIF
+        if autocrop:
+            image = _autocrop(image)
+        image.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+        image = image.convert("L" if grayscale else "RGB")
+        out = io.BytesIO()
+        image.save(out, format="JPEG", quality=quality, optimize=True)
+        return out.getvalue()
+
+
+class PreprocessStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.documents = 0
+        self.skipped = 0
+        self.errors = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.seconds = 0.0
+        self.pdf_pages = 0
+        self.pdf_text_pages = 0
+        self.pdf_dropped_pages = 0
+
+    def record_pdf(self, info: dict):
+        with self._lock:
+            self.pdf_pages += info["pages"]
+            self.pdf_text_pages += info["text_pages"]
+            self.pdf_dropped_pages += info["dropped_pages"]
+
+    def record_skipped(self):
+        with self._lock:
+            self.skipped += 1
+
+    def record_error(self):
+        with self._lock:
+            self.errors += 1
+
+    def record(self, bytes_in: int, bytes_out: int, seconds: float):
+        with self._lock:
+            self.documents += 1
+            self.bytes_in += bytes_in
+            self.bytes_out += bytes_out
+            self.seconds += seconds
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "enabled": IMAGE_PREPROCESS_ENABLED and Image is not None,
+                "documents": self.documents,
+                "skipped": self.skipped,
+                "errors": self.errors,
+                "bytes_in": self.bytes_in,
+                "bytes_out": self.bytes_out,
+                "bytes_saved": self.bytes_in - self.bytes_out,
+                "avg_latency_ms": round(1000 * self.seconds / self.documents, 1) if self.documents else 0.0,
+                "pdf_text_enabled": PDF_TEXT_ENABLED and PdfReader is not None,
+                "pdf_pages": self.pdf_pages,
+                "pdf_text_pages": self.pdf_text_pages,
+                "pdf_dropped_pages": self.pdf_dropped_pages,
+            }
+
+
+preprocess_stats = PreprocessStats()
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=IMAGE_PREPROCESS_WORKERS,
+                mp_context=multiprocessing.get_context(IMAGE_PREPROCESS_START_METHOD),
+            )
+        return _executor
+
+
+def _image_enabled(mime: str) -> bool:
+    return IMAGE_PREPROCESS_ENABLED and Image is not None and mime in PREPROCESS_MIME_TYPES
+
+
+def _pdf_enabled(mime: str) -> bool:
+    return PDF_TEXT_ENABLED and PdfReader is not None and mime == "application/pdf"
+
+
+async def preprocess_document(content, mime: str, index: int):
+    """Lista de partes [(contenido, mime_type)] que reemplazan al documento."""
+    if not _image_enabled(mime) and not _pdf_enabled(mime):
+        preprocess_stats.record_skipped()
+        return [(content, mime)]
+
+    loop = asyncio.get_running_loop()
+    started = time.perf_counter()
+    try:
+        # Al proceso worker solo pueden viajar bytes (se copia el mmap/memoryview)
+        if _pdf_enabled(mime):
+            parts, info = await loop.run_in_executor(_get_executor(), split_pdf, bytes(content))
+            preprocess_stats.record_pdf(info)
+        else:
+            parts = [(await loop.run_in_executor(_get_executor(), preprocess_image, bytes(content)), "image/jpeg")]
+    except Exception as e:
+        preprocess_stats.record_error()
+        logger.warning(f"⚠️ No se pudo preprocesar el documento {index} ({mime}): {e}")
+        return [(content, mime)]
+    elapsed = time.perf_counter() - started
+
+    size = sum(len(part) for part, _ in parts)
+    preprocess_stats.record(len(content), size, elapsed)
+    logger.info(
+        f"🖼️ Documento {index} ({mime}): {len(content) / 1024:.0f} KB → {size / 1024:.0f} KB "
+        f"en {elapsed * 1000:.0f} ms"
+    )
+    return parts
+
+
+async def preprocess_documents(files_data):
+    """
+    files_data [(contenido, mime_type), ...] con las imágenes reducidas y los PDFs digitales
+    convertidos a texto (en paralelo). Un PDF puede quedar en dos partes: texto + páginas escaneadas.
+    """
+    results = await asyncio.gather(*(
+        preprocess_document(content, mime, i) for i, (content, mime) in enumerate(files_data)
+    ))
+    return [part for parts in results for part in parts]
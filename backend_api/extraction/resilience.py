@@ -0,0 +1,248 @@
+import logging
+import random
+import threading
+import time
+
+from extraction.base import Extractor
+
+try:
+    from google.api_core import exceptions as google_exceptions
+except ImportError:
+    google_exceptions = None
+
+logger = logging.getLogger("hce_vision_backend.extraction")
+
+# --- Límite de cuota, reintentos y circuit breaker ---
+# Envuelven a cualquier backend de extracción. Corren dentro de los hilos del pool de
+# extracción, así que las esperas son bloqueantes (time.sleep) a propósito.
+
+TRANSIENT_STATUS_CODES = (408, 429, 500, 502, 503, 504)
+
+
+class CircuitOpenError(Exception):
+    """El proveedor de IA viene fallando: se rechaza la llamada sin intentarla."""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"Servicio de IA no disponible, reintentar en {retry_after:.0f} s")
+        self.retry_after = retry_after
+
+
+class RateLimitError(Exception):
+    """No hay cuota disponible dentro del tiempo máximo de espera."""
+
+
+class ExtractionProviderError(Exception):
+    """El proveedor de IA falló o devolvió una respuesta inválida (transient: vale la pena reintentar)."""
+
+    def __init__(self, backend: str, error: Exception):
+        super().__init__(f"Error del servicio de IA ({backend}): {error or type(error).__name__}")
+        self.transient = is_transient(error)
+
+
+def is_transient(exc: Exception) -> bool:
+    """Errores que vale la pena reintentar: cuota, timeouts, 5xx y fallas de conexión."""
+    if isinstance(exc, (ConnectionError, TimeoutError)):
+        return True
+    if google_exceptions is not None and isinstance(exc, (
+        google_exceptions.ResourceExhausted,
+        google_exceptions.ServiceUnavailable,
+        google_exceptions.DeadlineExceeded,
+        google_exceptions.InternalServerError,
+        google_exceptions.TooManyRequests,
+    )):
+        return True
+    response = getattr(exc, "response", None)
+    status = getattr(response, "status_code", None) or getattr(exc, "code", None)
+    try:
+        return int(status) in TRANSIENT_STATUS_CODES
+    except (TypeError, ValueError):
+        return type(exc).__name__ in ("ConnectError", "ReadTimeout", "ConnectTimeout", "RemoteProtocolError")
+
+
+class TokenBucket:
+    """rate tokens por segundo, hasta capacity acumulados (ráfaga)."""
+
+    def __init__(self, rate: float, capacity: float, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._clock = clock
+        self._sleep = sleep
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = self._clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, max_wait: float = None):
+        """Toma un token, esperando lo necesario. Levanta RateLimitError si la espera supera max_wait."""
+        with self._lock:
+            self._refill()
+            self._tokens -= 1  # reserva el token aunque haya que esperarlo (orden de llegada)
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+            if max_wait is not None and wait > max_wait:
+                self._tokens += 1
+                raise RateLimitError(f"Cuota de IA agotada (espera estimada {wait:.0f} s)")
+        if wait:
+            self._sleep(wait)
+
+    @property
+    def available(self) -> float:
+        with self._lock:
+            self._refill()
+            return max(0.0, self._tokens)
+
+
+class CircuitBreaker:
+    """
+    closed: llamadas normales. Tras failure_threshold fallas seguidas pasa a open y
+    rechaza todo durante reset_timeout. Después (half_open) deja pasar una llamada de
+    prueba: si sale bien se cierra, si falla vuelve a abrirse.
+    """
+
+    def __init__(self, failure_threshold: int, reset_timeout: float, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state()
+
+    def _state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if self._clock() - self._opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def before_call(self):
+        with self._lock:
+            state = self._state()
+            if state == "open" or (state == "half_open" and self._probing):
+                raise CircuitOpenError(max(0.0, self.reset_timeout - (self._clock() - self._opened_at)))
+            if state == "half_open":
+                self._probing = True
+
+    def release_probe(self):
+        """La llamada de prueba terminó sin resultado que contar (error no transitorio): libera el turno."""
+        with self._lock:
+            self._probing = False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._probing = False
+            if self._opened_at is not None or self._failures >= self.failure_threshold:
+                if self._opened_at is None:
+                    logger.error(f"🔌 Circuit breaker abierto tras {self._failures} fallas seguidas")
+                self._opened_at = self._clock()
+
+
+class ResilientExtractor(Extractor):
+    """Backend + token bucket + reintentos con backoff exponencial + circuit breaker."""
+
+    def __init__(
+        self,
+        backend: Extractor,
+        limiter: TokenBucket,
+        breaker: CircuitBreaker,
+        max_retries: int = 3,
+        backoff_base: float = 1.0,
+        backoff_max: float = 20.0,
+        deadline: float = 120.0,
+        sleep=time.sleep,
+    ):
+        self.backend = backend
+        self.name = backend.name
+        self.limiter = limiter
+        self.breaker = breaker
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.deadline = deadline
+        self._sleep = sleep
+        self.calls = 0
+        self.retries = 0
+        self.failures = 0
+
+    def warm(self):
+        self.backend.warm()
+
+    def extract(self, files_data, timeout: float = None) -> dict:
+        return self._call(self.backend.extract, files_data, timeout or self.deadline)
+
+    def extract_stream(self, files_data, timeout: float = None):
+        """Solo se reintenta hasta recibir el primer fragmento: después ya se entregó texto."""
+        def open_stream(files_data, timeout):
+            stream = iter(self.backend.extract_stream(files_data, timeout=timeout))
+            return next(stream, ""), stream
+
+        first, stream = self._call(open_stream, files_data, timeout or self.deadline)
+        yield first
+        yield from stream
+
+    def _call(self, fn, files_data, deadline: float):
+        """
+        Cada intento recibe como timeout lo que queda del plazo total: la llamada al proveedor
+        se corta a tiempo y libera el hilo del pool aunque quien espera ya haya desistido.
+        """
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            # La cuota se toma antes de ocupar el turno de prueba del breaker: si falta cuota
+            # (RateLimitError) el breaker no queda esperando un resultado que nunca llega
+            remaining = deadline - (time.monotonic() - started)
+            self.limiter.acquire(max_wait=max(0.0, remaining))
+            self.breaker.before_call()
+            self.calls += 1
+            recorded = False
+            try:
+                result = fn(files_data, timeout=max(1.0, deadline - (time.monotonic() - started)))
+            except Exception as e:
+                if not is_transient(e):
+                    # Error del documento o de la respuesta, no del proveedor: no cuenta para el breaker
+                    raise
+                self.breaker.record_failure()
+                recorded = True
+                delay = min(self.backoff_max, self.backoff_base * 2 ** attempt) * random.uniform(0.5, 1.0)
+                elapsed = time.monotonic() - started
+                if attempt >= self.max_retries or elapsed + delay >= deadline:
+                    self.failures += 1
+                    raise
+                attempt += 1
+                self.retries += 1
+                logger.warning(f"🔁 Error transitorio de {self.name} ({e}); reintento {attempt} en {delay:.1f} s")
+                self._sleep(delay)
+                continue
+            else:
+                self.breaker.record_success()
+                recorded = True
+            finally:
+                if not recorded:
+                    self.breaker.release_probe()
+            return result
+
+    def stats(self) -> dict:
+        return {
+            "backend": self.name,
+            "circuit": self.breaker.state,
+            "tokens_available": round(self.limiter.available, 2),
+            "rate_per_minute": round(self.limiter.rate * 60, 2),
+            "calls": self.calls,
+            "retries": self.retries,
+            "failures": self.failures,
+        }
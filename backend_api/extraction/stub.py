@@ -0,0 +1,88 @@
+import datetime
+import hashlib
+import json
+import os
+import time
+
+import httpx
+
+from extraction.base import Extractor
+
+# --- Extractores de prueba ---
+# Reemplazan a Gemini en tests y pruebas de carga:
+# - EXTRACTOR_BACKEND=stub: en el mismo proceso.
+# - EXTRACTOR_BACKEND=http_stub: contra extraction/stub_server.py (latencia y errores de red reales).
+# Son determinísticos: los mismos archivos devuelven siempre los mismos valores.
+
+EXTRACTOR_STUB_DELAY = float(os.getenv("EXTRACTOR_STUB_DELAY", "0"))
+EXTRACTOR_STUB_URL = os.getenv("EXTRACTOR_STUB_URL", "http://127.0.0.1:8090")
+
+
+def stub_extract(files_data) -> dict:
+    if EXTRACTOR_STUB_DELAY:
+        time.sleep(EXTRACTOR_STUB_DELAY)
+
+    h = hashlib.sha256()
+    for content, mime in files_data:
+        h.update(hashlib.sha256(content).digest())
+    seed = int.from_bytes(h.digest()[:4], "big")
+
+    return {
+        "simulated": True,
+        "date": datetime.date.today().isoformat(),
+        "type": "laboratorio",
+        "title": f"Documento de prueba ({len(files_data)} archivos)",
+        "description": "Resultado generado por el extractor local de prueba.",
+        "antecedents": {"hta": bool(seed & 1), "diabetes": bool(seed & 2), "dyslipidemia": bool(seed & 4)},
+        "labs": {
+            "ldl": {"value": 70 + seed % 120, "unit": "mg/dL"},
+            "creatinine": {"value": round(0.6 + (seed % 80) / 100, 2), "unit": "mg/dL"},
+        },
+        "historical_data": [],
+        "medications": ["Atorvastatina 20 mg"] if seed & 4 else [],
+        "global_timeline_events": [],
+        "raw_text": f"Texto de prueba {seed}",
+        "lab_table_full": [],
+        "imaging_findings": [],
+        "procedures": [],
+        "vital_signs": None,
+        "medication_changes": [],
+        "document_metadata": {"institution": "Stub"},
+        "digital_report_draft": {"format": "markdown", "content": f"# Informe de prueba\n\nSemilla: {seed}"},
+    }
+
+
+class StubExtractor(Extractor):
+    name = "stub"
+    stream_chunk_size = 64
+
+    def extract(self, files_data, timeout: float = None) -> dict:
+        return stub_extract(files_data)
+
+    def extract_stream(self, files_data, timeout: float = None):
+        # Como el modelo: el JSON llega en fragmentos que cortan claves y valores
+        text = "```json\n" + json.dumps(stub_extract(files_data), ensure_ascii=False, indent=2) + "\n```"
+        for i in range(0, len(text), self.stream_chunk_size):
+            yield text[i:i + self.stream_chunk_size]
+
+
+class HttpStubExtractor(Extractor):
+    """Cliente del stub HTTP (uvicorn extraction.stub_server:app --port 8090)."""
+
+    name = "http_stub"
+
+    def __init__(self, url: str = EXTRACTOR_STUB_URL, timeout: float = 120.0):
+        self.url = url
+        self.timeout = timeout
+        self._client = None
+
+    def warm(self):
+        if self._client is None:
+            self._client = httpx.Client(base_url=self.url, timeout=self.timeout)
+
+    def extract(self, files_data, timeout: float = None) -> dict:
+        self.warm()
+        files = [("files", (f"doc{i}", bytes(content), mime)) for i, (content, mime) in enumerate(files_data)]
+        response = self._client.post("/extract", files=files, timeout=timeout or self.timeout)
+        response.raise_for_status()
+        return response.json()
@@ -0,0 +1,30 @@
+import os
+import random
+import time
+from typing import List
+
+from fastapi import FastAPI, File, HTTPException, UploadFile
+
+from extraction.stub import stub_extract
+
+# --- Stub HTTP del proveedor de IA (pruebas de carga) ---
+# uvicorn extraction.stub_server:app --port 8090
+# STUB_SERVER_DELAY: latencia por llamada (s). STUB_SERVER_ERROR_RATE: fracción de
+# respuestas 503 y STUB_SERVER_QUOTA_RATE: fracción de 429, para probar reintentos y breaker.
+
+STUB_SERVER_DELAY = float(os.getenv("STUB_SERVER_DELAY", "1.0"))
+STUB_SERVER_ERROR_RATE = float(os.getenv("STUB_SERVER_ERROR_RATE", "0"))
+STUB_SERVER_QUOTA_RATE = float(os.getenv("STUB_SERVER_QUOTA_RATE", "0"))
+
+app = FastAPI(title="HCE Vision - Stub de extracción")
+
+
+@app.post("/extract")
+def extract(files: List[UploadFile] = File(...)):
+    time.sleep(STUB_SERVER_DELAY)
+    roll = random.random()
+    if roll < STUB_SERVER_QUOTA_RATE:
+        raise HTTPException(status_code=429, detail="Cuota excedida (simulada)")
+    if roll < STUB_SERVER_QUOTA_RATE + STUB_SERVER_ERROR_RATE:
+        raise HTTPException(status_code=503, detail="Servicio no disponible (simulado)")
+    return stub_extract([(f.file.read(), f.content_type) for f in files])
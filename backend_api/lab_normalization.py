@@ -0,0 +1,102 @@
+import re
+import unicodedata
+
+import numpy as np
+
+# --- Normalización de laboratorios ---
+# Los labs llegan con nombres ("ldl", "LDL-C", "colesterol LDL") y unidades (mg/dL,
+# mmol/L) heterogéneos. Acá se mapean a una clave canónica y a la unidad canónica del
+# analito. Los nombres se resuelven con un diccionario de sinónimos armado una sola vez;
+# la conversión (valor * factor + offset) se aplica con NumPy a todo el lote junto.
+
+# clave canónica: (unidad canónica, sinónimos, {unidad: factor o (factor, offset)})
+ANALYTES = {
+    "ldl": ("mg/dL", ["ldl c", "c ldl", "colesterol ldl", "ldl colesterol", "cldl", "ldl cholesterol"],
+            {"mmol/l": 38.67}),
+    "hdl": ("mg/dL", ["hdl c", "c hdl", "colesterol hdl", "hdl colesterol", "chdl", "hdl cholesterol"],
+            {"mmol/l": 38.67}),
+    "total_cholesterol": ("mg/dL", ["colesterol total", "colesterol", "ct", "cholesterol", "total cholesterol"],
+                          {"mmol/l": 38.67}),
+    "non_hdl": ("mg/dL", ["colesterol no hdl", "no hdl", "non hdl"], {"mmol/l": 38.67}),
+    "triglycerides": ("mg/dL", ["trigliceridos", "tg", "tag", "triglyceride"], {"mmol/l": 88.57}),
+    "glucose": ("mg/dL", ["glucemia", "glucosa", "glu", "glucemia en ayunas", "glucose"], {"mmol/l": 18.016}),
+    "hba1c": ("%", ["hemoglobina glicosilada", "hemoglobina glicada", "a1c", "hb a1c", "hemoglobin a1c"],
+              {"mmol/mol": (0.09148, 2.152)}),
+    "creatinine": ("mg/dL", ["creatinina", "creat", "cr", "creatinina serica"], {"umol/l": 0.01131}),
+    "urea": ("mg/dL", ["uremia", "urea plasmatica"], {"mmol/l": 6.006}),
+    "potassium": ("mEq/L", ["potasio", "k", "kalemia", "k+"], {"mmol/l": 1.0}),
+    "sodium": ("mEq/L", ["sodio", "na", "natremia", "na+"], {"mmol/l": 1.0}),
+    "hemoglobin": ("g/dL", ["hemoglobina", "hb", "hgb"], {"g/l": 0.1, "mmol/l": 1.611}),
+    "troponin": ("ng/L", ["troponina", "troponina t", "troponina i", "tnt", "tni", "hs tn", "troponina us"],
+                 {"ng/ml": 1000.0, "pg/ml": 1.0, "ug/l": 1000.0}),
+    "ntprobnp": ("pg/mL", ["nt probnp", "nt pro bnp", "pro bnp", "probnp"], {"ng/l": 1.0, "pmol/l": 8.457}),
+    "bnp": ("pg/mL", ["peptido natriuretico", "peptido natriuretico b"], {"ng/l": 1.0, "pmol/l": 3.46}),
+    "tsh": ("mUI/L", ["tirotrofina"], {"uui/ml": 1.0, "miu/l": 1.0, "uiu/ml": 1.0}),
+    "lpa": ("mg/dL", ["lp a", "lipoproteina a", "lipoproteina pequena a"], {}),
+    "egfr": ("mL/min/1.73m2", ["filtrado glomerular", "tfg", "ckd epi", "fge", "tfge"], {}),
+}
+
+_PARENS_RE = re.compile(r"\(.*?\)")
+_NON_ALNUM_RE = re.compile(r"[^a-z0-9+]+")
+
+
+def _fold(text: str) -> str:
+    """Minúsculas sin acentos y con los separadores colapsados a un espacio."""
+    text = unicodedata.normalize("NFKD", str(text)).encode("ascii", "ignore").decode("ascii").lower()
+    return _NON_ALNUM_RE.sub(" ", text).strip()
+
+
+def normalize_unit(unit) -> str:
+    if not unit:
+        return ""
+    unit = str(unit).replace("µ", "u").replace("μ", "u")
+    return re.sub(r"\s+", "", unit).lower()
+
+
+# Precompilados: nombre plegado -> clave; (clave, unidad normalizada) -> (factor, offset)
+_SYNONYMS = {}
+_CONVERSIONS = {}
+for _key, (_unit, _synonyms, _factors) in ANALYTES.items():
+    for _name in [_key, *_synonyms]:
+        _SYNONYMS[_fold(_name)] = _key
+    _CONVERSIONS[(_key, normalize_unit(_unit))] = (1.0, 0.0)
+    for _from, _factor in _factors.items():
+        _CONVERSIONS[(_key, normalize_unit(_from))] = _factor if isinstance(_factor, tuple) else (_factor, 0.0)
+
+
+def canonical_analyte(name: str) -> str:
+    """Clave canónica del analito; los desconocidos quedan en minúsculas con '_' ('Ácido úrico' -> 'acido_urico')."""
+    folded = _fold(name)
+    key = _SYNONYMS.get(folded)
+    if key is None:
+        # "Colesterol LDL (calculado)" -> "colesterol ldl"
+        key = _SYNONYMS.get(_fold(_PARENS_RE.sub(" ", str(name))))
+    return key or folded.replace(" ", "_")
+
+
+def normalize_batch(names, values, units):
+    """
+    Normaliza un lote de filas de laboratorio.
+    names/units: listas de str; values: secuencia de floats.
+    Devuelve (claves, valores: np.ndarray, unidades). Si la unidad no tiene conversión
+    conocida el valor y la unidad quedan como vinieron (solo cambia la clave).
+    """
+    keys = [canonical_analyte(name) for name in names]
+    values = np.asarray(values, dtype=np.float64)
+    factors = np.ones(len(keys))
+    offsets = np.zeros(len(keys))
+    converted = np.zeros(len(keys), dtype=bool)
+    out_units = list(units)
+    for i, (key, unit) in enumerate(zip(keys, units)):
+        conversion = _CONVERSIONS.get((key, normalize_unit(unit)))
+        if conversion is not None:
+            factors[i], offsets[i] = conversion
+            converted[i] = conversion != (1.0, 0.0)
+            out_units[i] = ANALYTES[key][0]
+        elif not unit and key in ANALYTES:
+            out_units[i] = ANALYTES[key][0]  # sin unidad: se asume la canónica
+
+    result = values * factors + offsets
+    # Redondear solo lo convertido (evita 129.99999 vs 130 al detectar duplicados)
+    result = np.where(converted, np.round(result, 3), values)
+    return keys, result, out_units
@@ -0,0 +1,112 @@
+import logging
+from typing import Optional
+
+import numpy as np
+
+logger = logging.getLogger("hce_vision_backend.lab_series")
+
+# --- Series de laboratorio para gráficos ---
+# Las filas de un analito (lab_results) se pasan a arrays de NumPy: x en días desde
+# 1970-01-01 e y el valor. Sobre esos arrays se reduce la serie a N puntos (LTTB o
+# min/max por bucket) y se calculan las estadísticas del resumen.
+
+
+def to_arrays(rows):
+    """
+    (fechas, x_días, valores, unidad) desde [(fecha, valor, unidad), ...].
+    Descarta filas sin fecha, con fecha inválida (o NaT) y valores no finitos: un solo
+    NaN en x/y arruina la selección de LTTB y la pendiente.
+    """
+    rows = [row for row in rows if row[1] is not None and isinstance(row[0], str) and row[0].strip()]
+    dates = [row[0] for row in rows]
+    values = np.array([row[1] for row in rows], dtype=np.float64)
+    unit = next((row[2] for row in reversed(rows) if row[2]), "")
+    try:
+        days = np.array(dates, dtype="datetime64[D]")
+    except ValueError:
+        # Alguna fecha no es ISO: se descartan solo esas
+        parsed = []
+        for date in dates:
+            try:
+                parsed.append(np.datetime64(date, "D"))
+            except ValueError:
+                logger.warning(f"⚠️ Fecha de laboratorio inválida descartada: {date!r}")
+                parsed.append(np.datetime64("NaT", "D"))
+        days = np.array(parsed, dtype="datetime64[D]")
+    valid = ~np.isnat(days) & np.isfinite(values)
+    if not valid.all():
+        dates = [date for date, ok in zip(dates, valid) if ok]
+        days, values = days[valid], values[valid]
+    return dates, days.astype(np.int64).astype(np.float64), values, unit
+
+
+def lttb(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """Índices elegidos por Largest-Triangle-Three-Buckets (conserva la forma visual de la serie)."""
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    # Buckets del medio (el primer y el último punto siempre quedan)
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        next_start, next_end = edges[i + 1], (edges[i + 2] if i + 2 < len(edges) else n)
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+        # Área del triángulo (a, candidato, promedio del bucket siguiente), vectorizada
+        area = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(area.argmax())
+        selected[i + 1] = a
+    return selected
+
+
+def minmax_buckets(y: np.ndarray, threshold: int) -> np.ndarray:
+    """Índices del mínimo y el máximo de cada bucket (threshold // 2 buckets), en orden."""
+    n = len(y)
+    if threshold >= n or threshold < 2:
+        return np.arange(n)
+    edges = np.linspace(0, n, threshold // 2 + 1).astype(np.int64)
+    selected = []
+    for start, end in zip(edges[:-1], edges[1:]):
+        if end > start:
+            bucket = y[start:end]
+            selected.extend({start + int(bucket.argmin()), start + int(bucket.argmax())})
+    return np.unique(np.array(selected, dtype=np.int64))
+
+
+def series_stats(dates, x: np.ndarray, y: np.ndarray) -> Optional[dict]:
+    """last/min/max (con su fecha), promedio y pendiente (unidades por año, mínimos cuadrados)."""
+    if not len(y):
+        return None
+    i_min, i_max = int(y.argmin()), int(y.argmax())
+    slope = None
+    if len(y) >= 2 and np.ptp(x) > 0:
+        slope = float(np.polyfit(x, y, 1)[0] * 365.25)
+    return {
+        "count": int(len(y)),
+        "last": {"date": dates[-1], "value": float(y[-1])},
+        "min": {"date": dates[i_min], "value": float(y[i_min])},
+        "max": {"date": dates[i_max], "value": float(y[i_max])},
+        "mean": float(y.mean()),
+        "slope_per_year": slope,
+    }
+
+
+def build_lab_series(rows, points: int = None, method: str = "lttb", stats: bool = False) -> dict:
+    """Serie lista para el gráfico: fechas/valores reducidos a `points` y, opcionalmente, estadísticas."""
+    dates, x, y, unit = to_arrays(rows)
+    if points and len(y) > points:
+        idx = lttb(x, y, points) if method == "lttb" else minmax_buckets(y, points)
+        out_dates, out_values = [dates[i] for i in idx], y[idx]
+    else:
+        out_dates, out_values = dates, y
+    return {
+        "unit": unit,
+        "total_points": len(y),
+        "dates": out_dates,
+        "values": out_values.tolist(),
+        "stats": series_stats(dates, x, y) if stats else None,
+    }
@@ -0,0 +1,145 @@
+import bisect
+import logging
+import math
+import re
+from typing import Dict, List, Optional, Tuple
+
+from pydantic import ValidationError
+
+from lab_normalization import normalize_batch
+from models import LabResult
+
+logger = logging.getLogger("hce_vision_backend.lab_trends")
+
+# --- Tendencias de laboratorio ---
+# Inserta valores nuevos en summary.lab_trends (en el lugar) manteniendo cada analito
+# ordenado por fecha. Un índice (fecha, valor) por analito detecta duplicados en O(1)
+# y la inserción usa bisect, así que un submit con muchas columnas históricas es lineal
+# en la cantidad de valores nuevos. Antes de insertar, los nombres y unidades se
+# normalizan por lote (lab_normalization.py): un mismo analito queda en una sola clave.
+
+_NUMBER_RE = re.compile(r"[-+]?\d*\.\d+|\d+")
+
+
+def _decimal_point(text: str) -> str:
+    """Coma decimal a punto: "5,4" -> "5.4"; con ambos separadores el último es el decimal."""
+    if "," not in text:
+        return text
+    if "." in text and text.rfind(".") > text.rfind(","):
+        return text.replace(",", "")  # 1,234.5
+    return text.replace(".", "").replace(",", ".")  # 1.234,5
+
+
+def parse_lab_value(lab_data) -> Tuple[Optional[float], str]:
+    """
+    (valor, unidad) de un lab tal como lo devuelve el modelo:
+    {"value": 5.4, "unit": "%"}, un número, o un texto como "5,4 %" / "< 0.5".
+    Devuelve (None, "") si no hay valor numérico.
+    """
+    if isinstance(lab_data, dict) and "value" in lab_data:
+        return parse_lab_value(lab_data["value"])[0], str(lab_data.get("unit") or "")
+    if isinstance(lab_data, (int, float)):
+        return float(lab_data), ""
+    if isinstance(lab_data, str):
+        match = _NUMBER_RE.search(_decimal_point(lab_data))
+        if match:
+            return float(match.group()), ""
+    return None, ""
+
+
+def _by_date(result: LabResult) -> str:
+    return result.date
+
+
+class LabTrendStore:
+    def __init__(self, lab_trends: Dict[str, List[LabResult]]):
+        self.trends = lab_trends
+        self._index = {}  # analito -> {(fecha, valor)}, se arma la primera vez que se usa
+        self._pending = []  # (nombre, fecha, valor, unidad) sin normalizar
+        self.added = 0
+        self.duplicates = 0
+
+    def _trend(self, analyte: str):
+        trend = self.trends.get(analyte)
+        if trend is None:
+            trend = self.trends[analyte] = []
+        if analyte not in self._index:
+            # Las tendencias editadas a mano pueden venir desordenadas
+            if any(trend[i].date > trend[i + 1].date for i in range(len(trend) - 1)):
+                trend.sort(key=_by_date)
+            self._index[analyte] = {(r.date, r.value) for r in trend}
+        return trend, self._index[analyte]
+
+    def add(self, analyte: str, date: str, value: float, unit: str = "") -> bool:
+        """Inserta el valor en orden de fecha. False si ya existía la misma fecha y valor o si es inválido."""
+        try:
+            result = LabResult(date=date, value=value, unit=str(unit or ""))
+        except ValidationError as e:
+            logger.warning(f"⚠️ Lab inválido {analyte} ({date}): {e.errors()[0]['msg']}")
+            return False
+        trend, index = self._trend(analyte)
+        if (result.date, result.value) in index:
+            self.duplicates += 1
+            return False
+        index.add((result.date, result.value))
+        bisect.insort_right(trend, result, key=_by_date)
+        self.added += 1
+        return True
+
+    def add_labs(self, date: str, labs: dict):
+        """Encola los labs de una fecha (valores no numéricos o inválidos se saltean)."""
+        for lab_name, lab_data in (labs or {}).items():
+            try:
+                value, unit = parse_lab_value(lab_data)
+            except (TypeError, ValueError) as e:
+                logger.warning(f"⚠️ Error procesando lab {lab_name} ({date}): {e}")
+                continue
+            self._queue(lab_name, date, value, unit)
+
+    def add_table(self, date: str, rows):
+        """
+        Encola las filas de lab_table_full (tabla completa del informe) con la fecha del documento.
+        value puede venir como texto ("<0.5", "5,4"): se interpreta igual que value_raw.
+        """
+        for row in rows or []:
+            name = row.get("normalized_test_name") or row.get("test_name_raw")
+            if not name:
+                continue
+            try:
+                value = parse_lab_value(row.get("value"))[0]
+                if value is None:
+                    value = parse_lab_value(row.get("value_raw"))[0]
+            except (TypeError, ValueError):
+                continue
+            self._queue(name, date, value, row.get("unit"))
+
+    def _queue(self, name, date, value, unit):
+        """Valida la fila antes de encolarla: una fila mala no debe tirar el lote completo."""
+        if value is None:
+            return
+        if not name or not isinstance(date, str) or not date or not math.isfinite(value):
+            logger.warning(f"⚠️ Lab inválido {name!r} ({date!r}): {value!r}")
+            return
+        self._pending.append((str(name), date, float(value), str(unit or "")))
+
+    def flush(self):
+        """Normaliza todo lo encolado de una vez e inserta en orden de llegada."""
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, []
+        names, dates, values, units = zip(*pending)
+        try:
+            keys, values, units = normalize_batch(names, values, units)
+            rows = zip(keys, dates, values.tolist(), units)
+        except Exception as e:
+            # No debería pasar con filas ya validadas; por las dudas se normaliza de a una
+            logger.warning(f"⚠️ Normalización por lote fallida ({e}); se procesa fila por fila.")
+            rows = []
+            for name, date, value, unit in pending:
+                try:
+                    key, value, unit = normalize_batch([name], [value], [unit])
+                    rows.append((key[0], date, float(value[0]), unit[0]))
+                except Exception as row_error:
+                    logger.warning(f"⚠️ Lab {name!r} ({date}) descartado: {row_error}")
+        for key, date, value, unit in rows:
+            self.add(key, date, value, unit)
@@ -1,18 +1,21 @@
+import asyncio
 import datetime
 import os
 import json
 import logging
 import sys
 from typing import List, Dict, Optional, Any
-from fastapi import FastAPI, File, UploadFile, Form, HTTPException, Depends, Request
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, File, UploadFile, Form, HTTPException, Depends, Request, Response, Query
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy.orm import Session
 import uvicorn
 import google.generativeai as genai
 
 from models import (
     PatientSummary, 
+    PatientListItem,
+    LabSeries,
     ClinicalEvent, 
     Demographics, 
     RiskScores, 
@@ -20,6 +23,8 @@ from models import (
     ScoreDetail, 
     ClinicalEventResponse,
     ExtractedData,
+    ExtractionJob,
+    BatchIngestRequest,
     SubmitAnalysisRequest,
     CreatePatientRequest,
     LipidManagement,
@@ -28,7 +33,43 @@ from models import (
     UpdatePatientRequest,
     DigitalReport
 )
-from database import init_db, get_db, save_patient_db, get_patient_db, get_all_patients_db, delete_patient_db
+from patient_cache import patient_cache
+from serialization import default_response_class
+from bulk import export_ndjson_stream, import_ndjson_file
+from lab_series import build_lab_series
+from lab_normalization import canonical_analyte
+from scoring import RegistryRescorer, score_cache_stats, score_inputs, scores_for_inputs
+from analysis import apply_analysis, build_extracted_data, propose_risk_scores
+from batch_ingest import BatchIngestor, load_manifest
+from uploads import UploadLimitMiddleware, UploadTooLargeError, check_upload_sizes, upload_buffers
+from extraction.executor import EXTRACTION_MAX_CONCURRENCY, ExtractionTimeoutError
+from extraction.backends import get_extractor_backend
+from extraction.resilience import CircuitOpenError, ExtractionProviderError, RateLimitError
+from extraction.cache import extraction_cache
+from extraction.pipeline import DocumentExtractionError, extract_documents, stream_extraction
+from extraction.preprocess import preprocess_stats
+from extraction.jobs import ExtractionJobQueue
+import serialization
+from database import (
+    init_db,
+    SessionLocal,
+    get_async_db,
+    load_patient_summary,
+    save_patient_db_async,
+    load_patient_summary_async,
+    get_patient_json_db_async,
+    delete_patient_db_async,
+    list_patients_page_db_async,
+    create_patient_db_async,
+    find_patient_by_name_db_async,
+    load_event_payloads_async,
+    load_lab_series_db_async,
+    expand_event_fields_async,
+    DuplicatePatientNameError,
+    HEAVY_EVENT_FIELDS,
+    PATIENT_LIST_PAGE_SIZE,
+    timeline_row_keys,
+)
 
 # ... (rest of imports and config)
 
@@ -45,11 +86,14 @@ logger = logging.getLogger("hce_vision_backend")
 from diagnostics.error_logger import ErrorLoggingMiddleware
 from diagnostics.client_error_logger import router as client_error_router
 
-app = FastAPI(title="HCE Vision API", version="2.1.0")
+app = FastAPI(title="HCE Vision API", version="2.1.0", default_response_class=default_response_class())
 
 # --- Middleware de Diagnóstico (MDIE) ---
 app.add_middleware(ErrorLoggingMiddleware)
 
+# --- Límite de tamaño de las subidas (413 temprano) ---
+app.add_middleware(UploadLimitMiddleware)
+
 # --- Rutas de Diagnóstico ---
 app.include_router(client_error_router)
 
@@ -60,6 +104,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"], 
     allow_headers=["*"], 
+    expose_headers=["X-Next-Cursor"],
 )
 
 # --- Manejo Global de Errores ---
@@ -77,8 +122,12 @@ async def http_exception_handler(request: Request, exc: HTTPException):
     return JSONResponse(
         status_code=exc.status_code,
         content={"detail": exc.detail},
+        headers=getattr(exc, "headers", None),
     )
 
+# Con HCE_VALIDATE_READS=1 el summary siempre pasa por Pydantic (depuración)
+VALIDATE_READS = os.environ.get("HCE_VALIDATE_READS", "0").lower() in ("1", "true", "yes")
+
 # --- Configuración Gemini ---
 GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY")
 if GEMINI_API_KEY:
@@ -86,7 +135,7 @@ if GEMINI_API_KEY:
 
 # --- Inicialización ---
 @app.on_event("startup")
-def on_startup():
+async def on_startup():
     logger.info("🚀 Iniciando HCE Vision API v2.1 (Multi-Imagen + Historia Global)...")
     init_db()
     
@@ -97,328 +146,49 @@ def on_startup():
     else:
         logger.warning("⚠️ GEMINI_API_KEY no encontrada. La IA funcionará en modo simulado.")
 
-# --- Lógica de Negocio ---
-
-def fake_llm_extract(text: str) -> dict:
-    logger.info("🤖 Usando Extracción Simulada (Fallback)")
-    return {
-        "date": datetime.date.today().isoformat(),
-        "type": "laboratorio",
-        "title": "Análisis Simulado (Fallback)",
-        "description": "No se pudo conectar con la IA real. Se muestran datos de ejemplo.",
-        "antecedents": {"hta": True, "diabetes": False},
-        "labs": {},
-        "medications": [],
-        "global_timeline_events": [],
-        # Simulación de nuevos campos
-        "raw_text": "Texto simulado del informe...",
-        "lab_table_full": [],
-        "imaging_findings": [],
-        "procedures": [],
-        "vital_signs": None,
-        "medication_changes": [],
-        "document_metadata": {"institution": "Simulated Hospital"},
-        "digital_report_draft": {
-            "format": "markdown",
-            "content": "# Informe Simulado\n\nEste es un informe generado porque no hay conexión con IA."
-        }
-    }
-
-def analyze_images_with_gemini(files_data: List[tuple[bytes, str]]) -> dict:
-    """
-    Envía MÚLTIPLES documentos (imágenes o PDFs) a Gemini 1.5 Flash para extracción estructurada.
-    files_data: Lista de tuplas (contenido_bytes, mime_type)
-    """
-    api_key = os.environ.get("GEMINI_API_KEY")
-    if not api_key:
-        return fake_llm_extract("simulated")
+    # Crear el cliente del backend de IA antes del primer request
+    await run_in_threadpool(get_extractor_backend().warm)
+    await extraction_jobs.start()
 
-    try:
-        model_name = 'models/gemini-flash-latest'
-        logger.info(f"🧠 Enviando {len(files_data)} documentos a Gemini ({model_name})...")
-        
-        model = genai.GenerativeModel(model_name)
-        
-        prompt = """
-        Eres un modelo clínico experto en cardiología e internista. Tu tarea es extraer datos de DOCUMENTOS MÉDICOS para una Historia Clínica Electrónica.
-        
-        🚨 INSTRUCCIÓN CRÍTICA: DIGITALIZACIÓN COMPLETA 🚨
-        Tu objetivo no es solo extraer un resumen, sino CAPTURAR TODA la información del documento para crear una versión digital fidedigna y estructurada.
-        
-        Debes devolver un JSON VÁLIDO con la siguiente estructura COMPLETA:
-
-        {
-            "date": "YYYY-MM-DD", // Fecha del documento. Usar null si no se encuentra.
-            "type": "laboratorio" | "imagen" | "medicacion" | "epicrisis" | "procedimiento" | "consulta" | "otro",
-            "title": "Título descriptivo del documento",
-            "description": "Resumen clínico conciso del contenido.",
-
-            "antecedents": {
-                "hta": boolean, "diabetes": boolean, "heart_failure": boolean, "atrial_fibrillation": boolean,
-                "acs_history": boolean, "stroke": boolean, "vascular_disease": boolean, "renal_disease": boolean,
-                "liver_disease": boolean, "bleeding_history": boolean, "labile_inr": boolean, "alcohol_drugs": boolean,
-                "smoking": boolean, "obesity": boolean, "sedentary": boolean, "dyslipidemia": boolean
-            },
-
-            "labs": { 
-                // AQUÍ SOLO VA LA COLUMNA MÁS RECIENTE DETECTADA
-                "ldl": { "value": number, "unit": "mg/dL" },
-                // ... (resto de laboratorios igual que antes)
-                "creatinine": { "value": number, "unit": "mg/dL" },
-                # INCLUIR TODOS LOS LABS PREVIOS: bnp, ntprobnp, troponin, hemoglobin, hba1c, glucose, potassium, sodium, etc.
-            },
-
-            "historical_data": [
-                 { "date": "YYYY-MM-DD", "labs": { ... } } // Columnas anteriores de tablas evolutivas
-            ],
-
-            "medications": [ "Nombre medicamento 1", "Nombre medicamento 2" ],
-
-            // --- NUEVOS CAMPOS DE DIGITALIZACIÓN COMPLETA ---
-            
-            "raw_text": "TEXTO CRUDO COMPLETO DEL INFORME (OCR)",
-
-            "lab_table_full": [
-                {
-                    "row_raw": "texto completo de la fila",
-                    "test_name_raw": "nombre original",
-                    "normalized_test_name": "nombre estandarizado si es posible",
-                    "value_raw": "valor tal como aparece",
-                    "value": number | null,
-                    "unit": "unidades",
-                    "reference_range_raw": "rango de referencia si aparece",
-                    "flag_raw": "indicador H/L/*"
-                }
-            ],
-
-            "diagnostics_detected": [
-                 { "label_raw": "texto hallazgo", "category": "diagnostico_principal | secundario | hallazgo" }
-            ],
-
-            "imaging_findings": [
-                 { 
-                    "section": "Sección (ej: VI)", 
-                    "text": "Hallazgo textual",
-                    "structured": { "lvef": number, "severity": "leve|mod|sev" }
-                 }
-            ],
-
-            "procedures": [
-                 { "date": "YYYY-MM-DD", "type": "...", "description": "..." }
-            ],
-
-            "vital_signs": {
-                 "blood_pressure": { "systolic": number, "diastolic": number, "unit": "mmHg" },
-                 "heart_rate": { "value": number, "unit": "lpm" },
-                 "weight": { "value": number, "unit": "kg" },
-                 "height": { "value": number, "unit": "cm" },
-                 "bmi": number
-            },
-
-            "medication_changes": [
-                 { "name_raw": "...", "action": "iniciar|suspender|ajustar", "dose_raw": "..." }
-            ],
-
-            "document_metadata": {
-                 "institution": "...", "service": "...", "physician": "..."
-            },
-
-            "digital_report_draft": {
-                "format": "markdown",
-                "content": "Genera aquí un reporte LEGIBLE en Markdown que replique el informe original. \nEstructura SUGERIDA:\n# [Institución] - [Tipo de Informe]\n**Fecha:** [Fecha] | **Paciente:** [Nombre si hay]\n\n## Resumen / Motivo\n...\n\n## Hallazgos / Laboratorio\n(Tabla o lista bonita)\n\n## Conclusiones\n...\n\nRecrea el formato visual del papel lo mejor posible usando Markdown."
-            }
-        }
-
-        REGLAS:
-        1. SOLO JSON VÁLIDO.
-        2. Si hay tablas evolutivas, usa 'historical_data'.
-        3. 'raw_text' debe contener todo el texto extraído.
-        4. Sé exhaustivo con 'lab_table_full' para capturar valores que no encajan en 'labs'.
-        """
-
-        # Construir el payload con Prompt + Todos los archivos (con su mime type)
-        content_parts = [prompt]
-        for content, mime in files_data:
-            content_parts.append({'mime_type': mime, 'data': content})
-
-        response = model.generate_content(content_parts)
-        
-        text_response = response.text.strip()
-        if text_response.startswith("```json"):
-            text_response = text_response[7:]
-        if text_response.endswith("```"):
-            text_response = text_response[:-3]
-            
-        logger.info("✅ Respuesta de Gemini recibida y parseada.")
-        return json.loads(text_response)
-
-    except Exception as e:
-        logger.error(f"❌ Error llamando a Gemini: {e}", exc_info=True)
-        return fake_llm_extract("error_fallback")
-
-def safe_float(value: Any) -> Optional[float]:
-    if value is None:
-        return None
-    try:
-        return float(value)
-    except (ValueError, TypeError):
-        return None
-
-def safe_bool(value: Any) -> bool:
-    if isinstance(value, bool):
-        return value
-    if isinstance(value, str):
-        return value.lower() in ('true', '1', 't', 'y', 'yes')
-    return bool(value)
-
-def calculate_lipid_management(age: int, antecedents: dict, ldl_val: Optional[float]) -> Optional[LipidManagement]:
-    """Calcula metas de LDL y recomendación de estatinas según riesgo cardiovascular (ESC Guidelines)."""
-    if ldl_val is None:
-        return None
-
-    # 1. Determinar Categoría de Riesgo
-    risk_cat = "Bajo"
-    target = 116.0
-    
-    # Definiciones simplificadas
-    has_acs = safe_bool(antecedents.get("acs_history"))
-    has_stroke = safe_bool(antecedents.get("stroke"))
-    has_cvd = safe_bool(antecedents.get("vascular_disease")) or has_acs or has_stroke
-    has_dm = safe_bool(antecedents.get("diabetes"))
-    has_ckd = safe_bool(antecedents.get("renal_disease"))
-    has_fh = safe_bool(antecedents.get("dyslipidemia")) 
-    
-    # Lógica de Riesgo
-    if has_acs and (has_dm or has_ckd or safe_bool(antecedents.get("smoking"))):
-         risk_cat = "Extremo"
-         target = 40.0
-    elif has_cvd:
-        risk_cat = "Muy Alto"
-        target = 55.0
-    elif has_dm or has_ckd or has_fh:
-        risk_cat = "Alto"
-        target = 70.0
-    elif age > 50 and (safe_bool(antecedents.get("hta")) or safe_bool(antecedents.get("smoking")) or safe_bool(antecedents.get("obesity"))):
-        risk_cat = "Moderado"
-        target = 100.0
-    
-    # 2. Calcular reducción necesaria
-    reduction_pct = 0.0
-    if ldl_val > target:
-        reduction_pct = ((ldl_val - target) / ldl_val) * 100
-    
-    # 3. Estrategia Terapéutica (Estatinas)
-    recommendation = "Estilo de vida saludable."
-    
-    if reduction_pct > 0:
-        if reduction_pct >= 50:
-            recommendation = "Estatina Alta Potencia:\n• Atorvastatina 40-80 mg\n• Rosuvastatina 20-40 mg\n(Considerar Ezetimibe si no alcanza meta)"
-        elif reduction_pct >= 30:
-            recommendation = "Estatina Moderada Potencia:\n• Atorvastatina 10-20 mg\n• Rosuvastatina 5-10 mg"
-        else:
-            recommendation = "Estatina Baja-Moderada Potencia."
-            
-    if ldl_val <= target:
-        recommendation = "Meta alcanzada. Mantener tratamiento actual."
-
-    return LipidManagement(
-        ldl_current=ldl_val,
-        risk_category=risk_cat,
-        ldl_target=target,
-        reduction_needed_pct=round(reduction_pct, 1),
-        recommendation=recommendation
-    )
+@app.on_event("shutdown")
+async def on_shutdown():
+    await extraction_jobs.stop()
 
-def calculate_scores(age: int, sex: str, antecedents: dict, labs: dict = {}) -> Dict[str, Any]:
-    """Calcula scores condicionales según patología."""
-    
-    scores = {}
-    details = {}
-
-    # --- 1. Fibrilación Auricular (CHA2DS2-VASc & HAS-BLED) ---
-    if safe_bool(antecedents.get("atrial_fibrillation")):
-        # CHA2DS2-VASc
-        cha = 0
-        if safe_bool(antecedents.get("heart_failure")): cha += 1
-        if safe_bool(antecedents.get("hta")): cha += 1
-        if age >= 75: cha += 2
-        elif age >= 65: cha += 1
-        if safe_bool(antecedents.get("diabetes")): cha += 1
-        if safe_bool(antecedents.get("stroke")): cha += 2
-        if safe_bool(antecedents.get("vascular_disease")): cha += 1
-        if sex == 'F': cha += 1
-        
-        risk_txt = "Alto Riesgo (Anticoagular)" if cha >= 2 else ("Considerar Anticoagulación" if cha == 1 else "Bajo Riesgo")
-        scores["chads2vasc"] = cha
-        details["CHA2DS2-VASc"] = ScoreDetail(value=cha, risk=risk_txt)
-
-        # HAS-BLED
-        hb = 0
-        if safe_bool(antecedents.get("hta")): hb += 1
-        if safe_bool(antecedents.get("renal_disease")): hb += 1
-        if safe_bool(antecedents.get("liver_disease")): hb += 1
-        if safe_bool(antecedents.get("stroke")): hb += 1
-        if safe_bool(antecedents.get("bleeding_history")): hb += 1
-        if safe_bool(antecedents.get("labile_inr")): hb += 1
-        if age > 65: hb += 1
-        if safe_bool(antecedents.get("alcohol_drugs")): hb += 1
-        
-        hb_risk = "Alto Riesgo Sangrado" if hb >= 3 else "Bajo Riesgo Sangrado"
-        scores["has_bled"] = hb
-        details["HAS-BLED"] = ScoreDetail(value=hb, risk=hb_risk)
-
-    # --- 2. Prevención Primaria (SCORE2) ---
-    score2_val = None
-    if 40 <= age <= 69: 
-        base_risk = 1.0
-        if safe_bool(antecedents.get("smoking")): base_risk *= 2.0
-        if safe_bool(antecedents.get("diabetes")): base_risk *= 1.5
-        if safe_bool(antecedents.get("hta")): base_risk *= 1.3
-        
-        age_factor = (age - 40) / 10.0
-        score2_val = round(base_risk * (1 + age_factor), 1)
-        
-        risk_label = "Bajo"
-        if score2_val >= 10: risk_label = "Muy Alto"
-        elif score2_val >= 5: risk_label = "Alto"
-        elif score2_val >= 2.5: risk_label = "Moderado"
-        
-        scores["score2"] = score2_val
-        details["SCORE2"] = ScoreDetail(value=score2_val, risk=risk_label)
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
 
-    # --- 3. Manejo de Lípidos ---
-    ldl_data = labs.get("ldl")
-    ldl_val = None
-    
-    if isinstance(ldl_data, dict) and "value" in ldl_data:
-        ldl_val = safe_float(ldl_data["value"])
-    elif isinstance(ldl_data, (int, float, str)):
-        ldl_val = safe_float(ldl_data)
-        
-    lipid_mgmt = calculate_lipid_management(age, antecedents, ldl_val)
-    if lipid_mgmt:
-        scores["lipid_management"] = lipid_mgmt
+def sse_event(event: str, payload) -> str:
+    """Un mensaje Server-Sent Events con el payload en JSON."""
+    return f"event: {event}\ndata: {serialization.dumps_text(payload)}\n\n"
 
-    return {
-        "scores": scores,
-        "details": details
-    }
+async def run_extraction_job(patient_id: str, files_data, options: dict) -> dict:
+    """Handler de la cola de trabajos: misma extracción que /extract_data, en segundo plano."""
+    db = SessionLocal()
+    try:
+        summary = await run_in_threadpool(load_patient_summary, db, patient_id)
+    finally:
+        db.close()
+    if not summary:
+        raise HTTPException(status_code=404, detail="Paciente no encontrado")
+    raw_data = await extract_documents(
+        files_data, bypass_cache=options.get("bypass_cache", False), mode=options.get("mode")
+    )
+    return build_extracted_data(summary, raw_data, options.get("filenames")).dict()
+
+extraction_jobs = ExtractionJobQueue(run_extraction_job)
 
 # --- Endpoints ---
 
 @app.post("/patients", response_model=PatientSummary)
-async def create_patient(data: CreatePatientRequest, db: Session = Depends(get_db)):
+async def create_patient(data: CreatePatientRequest, db = Depends(get_async_db)):
     """
     Crea un nuevo paciente o devuelve uno existente si el nombre coincide.
     """
     logger.info(f"👤 Solicitud de creación de paciente: {data.name}")
     
-    all_patients = get_all_patients_db(db)
-    for p_data in all_patients.values():
-        p = PatientSummary(**p_data)
-        if p.demographics.name.lower().strip() == data.name.lower().strip():
-            logger.info(f"✅ Paciente existente encontrado: {p.patient_id}")
-            return p
+    existing = await find_patient_by_name_db_async(db, data.name)
+    if existing:
+        logger.info(f"✅ Paciente existente encontrado: {existing['patient_id']}")
+        return PatientSummary(**existing)
 
     import uuid
     new_id = str(uuid.uuid4())
@@ -437,7 +207,12 @@ async def create_patient(data: CreatePatientRequest, db: Session = Depends(get_d
         alerts=[]
     )
     
-    save_patient_db(db, new_summary)
+    existing = await create_patient_db_async(db, new_summary)
+    if existing:
+        # Otro request creó el mismo paciente mientras tanto
+        logger.info(f"✅ Paciente creado en paralelo: {existing['patient_id']}")
+        return PatientSummary(**existing)
+
     logger.info(f"✅ Nuevo paciente creado: {new_id}")
     return new_summary
 
@@ -445,322 +220,380 @@ async def create_patient(data: CreatePatientRequest, db: Session = Depends(get_d
 async def extract_data(
     patient_id: str = Form(...),
     files: List[UploadFile] = File(...), # AHORA ACEPTA LISTA DE ARCHIVOS
-    db: Session = Depends(get_db)
+    bypass_cache: bool = Form(False),
+    mode: Optional[str] = Form(None, pattern="^(single|per_document)$"),
+    db = Depends(get_async_db)
 ):
     """
     Paso 1: Analiza MÚLTIPLES documentos (imágenes/PDFs) y devuelve los datos PROPUESTOS.
+    Los mismos archivos ya analizados se sirven desde la caché (bypass_cache=true para forzar).
+    mode=per_document analiza cada archivo por separado y reporta los que fallen en document_errors.
     """
     logger.info(f"📤 Recibida solicitud de análisis. Paciente: {patient_id}, Archivos: {len(files)}")
+    try:
+        check_upload_sizes(files)
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
     
-    summary_data = get_patient_db(db, patient_id)
-    if not summary_data:
+    summary = await load_patient_summary_async(db, patient_id)
+    if not summary:
         logger.warning(f"❌ Paciente {patient_id} no encontrado durante extracción.")
         raise HTTPException(status_code=404, detail="Paciente no encontrado")
-    summary = PatientSummary(**summary_data)
 
-    # Leer todos los archivos y sus tipos MIME
-    files_data = []
-    for file in files:
-        content = await file.read()
-        files_data.append((content, file.content_type))
+    # Los archivos se pasan como mmap/memoryview sobre los temporales de la subida (sin copias)
+    # y se analizan con IA en el pool de extracción para no bloquear el event loop
+    with upload_buffers(files) as files_data:
+        try:
+            raw_data = await extract_documents(files_data, bypass_cache=bypass_cache, mode=mode)
+        except ExtractionTimeoutError as e:
+            raise HTTPException(status_code=504, detail=str(e))
+        except CircuitOpenError as e:
+            raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(int(e.retry_after) + 1)})
+        except RateLimitError as e:
+            raise HTTPException(status_code=503, detail=str(e))
+        except ExtractionProviderError as e:
+            raise HTTPException(status_code=503 if e.transient else 502, detail=str(e))
+        except DocumentExtractionError as e:
+            raise HTTPException(status_code=502, detail={"message": str(e), "document_errors": e.errors})
+    
+    return build_extracted_data(summary, raw_data, [file.filename for file in files])
+
+@app.post("/extract_data/stream")
+async def extract_data_stream(
+    patient_id: str = Form(...),
+    files: List[UploadFile] = File(...),
+    bypass_cache: bool = Form(False),
+    mode: Optional[str] = Form(None, pattern="^(single|per_document)$"),
+    db = Depends(get_async_db)
+):
+    """
+    Como /extract_data (mismos parámetros, incluido mode), pero responde con Server-Sent
+    Events mientras el modelo escribe:
+    - section: cada sección del JSON (title, antecedents, labs, ...) apenas se completa.
+    - risk_scores: los scores propuestos, en cuanto hay antecedentes y laboratorio.
+    - result: el ExtractedData final (igual al de /extract_data).
+    - error: si la extracción falla (la conexión se cierra después).
+    """
+    logger.info(f"📤 Análisis en streaming. Paciente: {patient_id}, Archivos: {len(files)}")
+    try:
+        check_upload_sizes(files)
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    summary = await load_patient_summary_async(db, patient_id)
+    if not summary:
+        raise HTTPException(status_code=404, detail="Paciente no encontrado")
+    filenames = [file.filename for file in files]
+
+    async def events():
+        sections = {}
+        scores_sent = False
+        try:
+            with upload_buffers(files) as files_data:
+                async for name, value in stream_extraction(files_data, bypass_cache=bypass_cache, mode=mode):
+                    sections[name] = value
+                    yield sse_event("section", {"name": name, "value": value})
+                    if not scores_sent and "antecedents" in sections and "labs" in sections:
+                        scores_sent = True
+                        scores = await run_in_threadpool(
+                            propose_risk_scores, summary, sections["antecedents"], sections["labs"]
+                        )
+                        yield sse_event("risk_scores", scores.dict())
+            yield sse_event("result", build_extracted_data(summary, sections, filenames).dict())
+        except Exception as e:
+            logger.error(f"❌ Error en la extracción en streaming: {e}", exc_info=True)
+            yield sse_event("error", {"detail": str(e) or type(e).__name__})
 
-    # Analizar con IA (Multi-archivo)
-    raw_data = analyze_images_with_gemini(files_data)
-    
-    # Crear evento temporal principal (Cardio)
-    # Crear evento temporal principal (Cardio)
-    temp_event = ClinicalEvent(
-        id="temp_id", 
-        date=raw_data["date"] or datetime.date.today().isoformat(),
-        type=raw_data["type"] or "otro",
-        title=raw_data["title"] or "Documentos Analizados",
-        description=raw_data["description"] or "",
-        labs=raw_data["labs"],
-        diagnostics=[d.get("normalized_name") or d.get("label_raw") for d in raw_data.get("diagnostics_detected", [])],
-        source="IA (Pendiente)",
-        # Nuevos campos
-        raw_text=raw_data.get("raw_text"),
-        lab_table_full=raw_data.get("lab_table_full"),
-        imaging_findings=raw_data.get("imaging_findings"),
-        procedures=raw_data.get("procedures"),
-        vital_signs=raw_data.get("vital_signs"),
-        medication_changes=raw_data.get("medication_changes"),
-        document_metadata=raw_data.get("document_metadata"),
-        digital_report_draft=raw_data.get("digital_report_draft")
-    )
+    return StreamingResponse(events(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+@app.post("/extract_jobs", response_model=ExtractionJob, status_code=202)
+async def submit_extraction_job(
+    patient_id: str = Form(...),
+    files: List[UploadFile] = File(...),
+    bypass_cache: bool = Form(False),
+    mode: Optional[str] = Form(None, pattern="^(single|per_document)$"),
+    db = Depends(get_async_db)
+):
+    """
+    Versión asíncrona de /extract_data: encola la extracción y devuelve el job_id al instante.
+    El resultado se consulta en GET /extract_jobs/{job_id} o se sigue por SSE en .../events.
+    """
+    logger.info(f"📤 Trabajo de extracción solicitado. Paciente: {patient_id}, Archivos: {len(files)}")
+    try:
+        check_upload_sizes(files)
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    if not await load_patient_summary_async(db, patient_id):
+        raise HTTPException(status_code=404, detail="Paciente no encontrado")
 
-    # Calcular scores cardio
+    with upload_buffers(files) as files_data:
+        options = {"bypass_cache": bypass_cache, "mode": mode, "filenames": [file.filename for file in files]}
+        return await extraction_jobs.submit(patient_id, files_data, options)
+
+@app.get("/extract_jobs/{job_id}", response_model=ExtractionJob)
+async def get_extraction_job(job_id: str):
+    """Estado de un trabajo de extracción (y el ExtractedData cuando status == 'done')."""
+    job = await extraction_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado")
+    return job
+
+@app.get("/extract_jobs/{job_id}/events")
+async def stream_extraction_job(job_id: str):
+    """Server-Sent Events con cada cambio de estado del trabajo; se cierra al terminar."""
+    if await extraction_jobs.get(job_id) is None:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado")
+
+    async def events():
+        async for job in extraction_jobs.watch(job_id):
+            yield sse_event(job["status"], ExtractionJob(**job).dict())
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+# Ingesta por lotes: solo archivos dentro de este directorio del servidor (sin él, deshabilitada)
+BATCH_INGEST_ROOT = os.environ.get("BATCH_INGEST_ROOT")
+batch_runs: Dict[str, BatchIngestor] = {}
+_batch_tasks = set()
+
+@app.post("/batch_ingest", status_code=202)
+async def start_batch_ingest(request: BatchIngestRequest):
+    """
+    Lanza en segundo plano la ingesta de un directorio o manifiesto (ver batch_ingest.py).
+    El progreso queda en <source>.ckpt.jsonl: relanzar el mismo source retoma donde quedó.
+    """
+    if not BATCH_INGEST_ROOT:
+        raise HTTPException(status_code=403, detail="Ingesta por lotes deshabilitada (BATCH_INGEST_ROOT)")
+    root = os.path.realpath(BATCH_INGEST_ROOT)
+    source = os.path.realpath(os.path.join(root, request.source))
+    if not source.startswith(root + os.sep):
+        raise HTTPException(status_code=400, detail="El origen debe estar dentro de BATCH_INGEST_ROOT")
     try:
-        scores_data = calculate_scores(
-            summary.demographics.age, 
-            summary.demographics.sex, 
-            raw_data["antecedents"] or {},
-            raw_data["labs"] or {}
-        )
-        
-        proposed_scores = RiskScores(
-            chads2vasc=scores_data["scores"].get("chads2vasc"),
-            has_bled=scores_data["scores"].get("has_bled"),
-            score2=scores_data["scores"].get("score2"),
-            details=scores_data["details"],
-            lipid_management=scores_data["scores"].get("lipid_management")
-        )
-    except Exception as e:
-        logger.error(f"⚠️ Error calculando scores: {e}", exc_info=True)
-        proposed_scores = RiskScores()
-
-    # NOTA: raw_data["global_timeline_events"] contiene la historia global.
-    # Por ahora la devolvemos dentro de 'historical_data' o podríamos extender el modelo ExtractedData.
-    # Para simplificar sin romper el frontend, lo meteremos en 'historical_data' con una marca especial
-    # o simplemente confiamos en que el frontend lo manejará si actualizamos el modelo.
-    # Vamos a inyectarlo en 'historical_data' adaptado por ahora.
-    
-    global_events = []
-    if "global_timeline_events" in raw_data:
-        for evt in raw_data["global_timeline_events"]:
-            # Adaptar al formato que espera el frontend (o actualizar frontend luego)
-            # Por ahora lo dejamos pasar, pero idealmente ExtractedData debería tener este campo explícito.
-            pass
-
-    logger.info("✅ Extracción multi-imagen completada.")
-    
-    # Hack temporal: Devolver los eventos globales dentro de una estructura que el frontend pueda leer
-    # O mejor, actualizaremos models.py en el siguiente paso para soportarlo oficialmente.
-    
-    # Sanitize antecedents to ensure all values are booleans
-    sanitized_antecedents = {}
-    if raw_data.get("antecedents"):
-        for k, v in raw_data["antecedents"].items():
-            sanitized_antecedents[k] = safe_bool(v)
-
-    return ExtractedData(
-        event=temp_event,
-        medications=raw_data["medications"] or [],
-        antecedents=sanitized_antecedents,
-        risk_scores=proposed_scores,
-        historical_data=raw_data.get("historical_data", []) 
-        # TODO: Enviar global_timeline_events al frontend
+        entries = await run_in_threadpool(load_manifest, source)
+    except (OSError, ValueError, KeyError) as e:
+        raise HTTPException(status_code=400, detail=f"Manifiesto inválido: {e}")
+    if any(not os.path.realpath(path).startswith(root + os.sep) for entry in entries for path in entry["files"]):
+        raise HTTPException(status_code=400, detail="Todos los archivos deben estar dentro de BATCH_INGEST_ROOT")
+
+    checkpoint = source.rstrip(os.sep) + ".ckpt.jsonl"
+    if any(run.checkpoint == checkpoint and run.stats()["running"] for run in batch_runs.values()):
+        raise HTTPException(status_code=409, detail="Ya hay una ingesta en curso para ese origen")
+
+    import uuid
+    batch_id = str(uuid.uuid4())
+    ingestor = BatchIngestor(
+        entries,
+        checkpoint=checkpoint,
+        concurrency=request.concurrency or EXTRACTION_MAX_CONCURRENCY,
+        auto_submit=request.auto_submit,
+        output_dir=source.rstrip(os.sep) + ".review",
+        mode=request.mode,
+        retry_failed=request.retry_failed,
     )
+    batch_runs[batch_id] = ingestor
+    task = asyncio.create_task(ingestor.run())
+    _batch_tasks.add(task)
+    task.add_done_callback(_batch_tasks.discard)
+    logger.info(f"🚚 Ingesta por lotes {batch_id} lanzada ({len(entries)} entradas).")
+    return {"batch_id": batch_id, **ingestor.stats()}
+
+@app.get("/batch_ingest/{batch_id}")
+async def get_batch_ingest(batch_id: str):
+    """Progreso de una ingesta por lotes (conteos por estado y documentos por minuto)."""
+    ingestor = batch_runs.get(batch_id)
+    if ingestor is None:
+        raise HTTPException(status_code=404, detail="Ingesta no encontrada")
+    return {"batch_id": batch_id, **ingestor.stats()}
+
+# Recálculo de scores del registro completo (ver scoring.py). Reescribe todo el registro:
+# solo se monta con ADMIN_API_ENABLED=1 (sin él responde 404). El CLI no depende de esto.
+ADMIN_API_ENABLED = os.environ.get("ADMIN_API_ENABLED", "0").lower() in ("1", "true", "yes")
+SCORE_RUNS_KEPT = 10 # recálculos terminados que se siguen pudiendo consultar
+score_runs: Dict[str, RegistryRescorer] = {}
+
+def require_admin_api():
+    if not ADMIN_API_ENABLED:
+        raise HTTPException(status_code=404, detail="Not Found")
+
+def _evict_finished_score_runs():
+    finished = [run_id for run_id, run in score_runs.items() if run.finished_at is not None]
+    for run_id in finished[:max(0, len(finished) - SCORE_RUNS_KEPT)]:
+        del score_runs[run_id]
+
+@app.post("/admin/recompute_scores", status_code=202, dependencies=[Depends(require_admin_api)])
+async def start_recompute_scores(
+    batch_size: int = Query(2000, ge=100, le=20000),
+    overwrite_manual: bool = False,
+):
+    """
+    Recalcula en segundo plano risk_scores y alertas de todos los pacientes
+    (edades actualizadas, cambios de guías). El progreso se consulta por run_id.
+    Los scores editados a mano se conservan salvo con overwrite_manual=true.
+    """
+    if any(run.finished_at is None for run in score_runs.values()):
+        raise HTTPException(status_code=409, detail="Ya hay un recálculo de scores en curso")
+    _evict_finished_score_runs()
+
+    import uuid
+    run_id = str(uuid.uuid4())
+    rescorer = RegistryRescorer(batch_size=batch_size, overwrite_manual=overwrite_manual)
+    score_runs[run_id] = rescorer
+    task = asyncio.create_task(run_in_threadpool(rescorer.run))
+    _batch_tasks.add(task)
+    task.add_done_callback(_batch_tasks.discard)
+    logger.info(f"🧮 Recálculo de scores {run_id} lanzado.")
+    return {"run_id": run_id, **rescorer.stats()}
+
+@app.get("/admin/recompute_scores/{run_id}", dependencies=[Depends(require_admin_api)])
+async def get_recompute_scores(run_id: str):
+    """Progreso de un recálculo de scores (procesados, actualizados, pacientes por segundo)."""
+    rescorer = score_runs.get(run_id)
+    if rescorer is None:
+        raise HTTPException(status_code=404, detail="Recálculo no encontrado")
+    return {"run_id": run_id, **rescorer.stats()}
 
 @app.post("/submit_analysis", response_model=PatientSummary)
-async def submit_analysis(data: SubmitAnalysisRequest, db: Session = Depends(get_db)):
+async def submit_analysis(data: SubmitAnalysisRequest, db = Depends(get_async_db)):
     """
     Paso 2: Recibe los datos CONFIRMADOS/EDITADOS por el usuario y actualiza el estado.
     """
     logger.info(f"💾 Guardando análisis confirmado para paciente: {data.patient_id}")
     
-    summary_data = get_patient_db(db, data.patient_id)
-    if not summary_data:
+    summary = await load_patient_summary_async(db, data.patient_id)
+    if not summary:
         raise HTTPException(status_code=404, detail="Paciente no encontrado")
-    summary = PatientSummary(**summary_data)
-    
-    new_event = data.event
-    new_event.id = str(datetime.datetime.now().timestamp())
-    new_event.source = "IA + Revisión Médica"
-    
-    summary.timeline.insert(0, new_event)
-    
-    # Actualizar Medicaciones
-    existing_meds = {m.name.lower() for m in summary.medications}
-    for med_name in data.medications:
-        if med_name.lower() not in existing_meds:
-            summary.medications.append(Medication(name=med_name))
-            
-    # Calcular scores finales
-    scores_data = calculate_scores(
-        summary.demographics.age, 
-        summary.demographics.sex, 
-        data.antecedents,
-        new_event.labs or {}
-    )
-    
-    scores_values = scores_data["scores"]
-    
-    summary.risk_scores = RiskScores(
-        chads2vasc=scores_values.get("chads2vasc"),
-        has_bled=scores_values.get("has_bled"),
-        score2=scores_values.get("score2"),
-        details=scores_data["details"],
-        lipid_management=scores_values.get("lipid_management")
-    )
-    
-    summary.antecedents = data.antecedents
-    
-    # --- ACTUALIZAR TENDENCIAS DE LABORATORIO ---
-    # --- ACTUALIZAR TENDENCIAS DE LABORATORIO ---
     
-    # Debug Payload
-    logger.info(f"📦 Submit Payload received. Historical Data count: {len(data.historical_data)}")
-    # logger.info(f"Payload content: {data.json()}") # Uncomment for full verbose log
-
-    # 1. Procesar datos históricos extraídos (tablas, múltiples fechas)
-    if data.historical_data:
-        for hist_item in data.historical_data:
-            hist_date = hist_item.date
-            logger.info(f"   🗓️ Procesando histórico fecha: {hist_date}")
-            
-            for lab_name, lab_data in hist_item.labs.items():
-                try:
-                    val_float = None
-                    unit_str = ""
-                    
-                    if isinstance(lab_data, dict) and 'value' in lab_data:
-                        val_float = float(lab_data['value']) if lab_data['value'] is not None else None
-                        unit_str = lab_data.get('unit', "")
-                    elif isinstance(lab_data, (int, float)):
-                        val_float = float(lab_data)
-                    elif isinstance(lab_data, str):
-                        import re
-                        match = re.search(r"[-+]?\d*\.\d+|\d+", lab_data)
-                        if match:
-                            val_float = float(match.group())
-
-                    if val_float is not None:
-                        if lab_name not in summary.lab_trends:
-                            summary.lab_trends[lab_name] = []
-                        
-                        # RELAXED DUPLICATE CHECK FOR DEBUGGING
-                        # Solo evitar si es EXACTAMENTE la misma fecha y valor
-                        exists = any(
-                            r.date == hist_date and r.value == val_float
-                            for r in summary.lab_trends[lab_name]
-                        )
-                        
-                        if not exists:
-                            logger.info(f"      ✅ Insertando {lab_name}: {val_float} {unit_str} ({hist_date})")
-                            summary.lab_trends[lab_name].append(LabResult(
-                                date=hist_date,
-                                value=val_float,
-                                unit=unit_str
-                            ))
-                        else:
-                            logger.info(f"      ⚠️ Duplicado exacto encontrado para {lab_name} en {hist_date}, saltando.")
-                            
-                except Exception as e:
-                    logger.warning(f"⚠️ Error procesando histórico {lab_name} ({hist_date}): {e}")
-
-    # 2. Procesar el evento actual (fecha principal)
-    if new_event.labs:
-        logger.info(f"   📍 Procesando evento actual: {new_event.date}")
-        for lab_name, lab_data in new_event.labs.items():
-            try:
-                val_float = None
-                unit_str = ""
-                
-                if isinstance(lab_data, dict) and 'value' in lab_data:
-                    val_float = float(lab_data['value']) if lab_data['value'] is not None else None
-                    unit_str = lab_data.get('unit', "")
-                elif isinstance(lab_data, (int, float)):
-                    val_float = float(lab_data)
-                elif isinstance(lab_data, str):
-                    import re
-                    match = re.search(r"[-+]?\d*\.\d+|\d+", lab_data)
-                    if match:
-                        val_float = float(match.group())
-
-                if val_float is not None:
-                    if lab_name not in summary.lab_trends:
-                        summary.lab_trends[lab_name] = []
-                    
-                    # Evitar duplicados con lo que acabamos de insertar de historical_data
-                    exists = any(
-                        r.date == new_event.date and r.value == val_float
-                        for r in summary.lab_trends[lab_name]
-                    )
-                    
-                    if not exists:
-                        logger.info(f"      ✅ Insertando actual {lab_name}: {val_float} {unit_str}")
-                        summary.lab_trends[lab_name].append(LabResult(
-                            date=new_event.date,
-                            value=val_float,
-                            unit=unit_str
-                        ))
-                    else:
-                        logger.info(f"      ⚠️ Duplicado actual encontrado para {lab_name}, saltando.")
-
-            except Exception as e:
-                logger.warning(f"⚠️ Error procesando lab actual {lab_name}: {e}")
-
-    # 3. Ordenar todas las tendencias por fecha
-    for lab_name in summary.lab_trends:
-        summary.lab_trends[lab_name].sort(key=lambda x: x.date)
-        logger.info(f"📈 Tendencia final {lab_name}: {len(summary.lab_trends[lab_name])} puntos")
-
-    # Alertas
-    summary.alerts = [] 
-    if scores_values.get("chads2vasc", 0) >= 2 and data.antecedents.get("atrial_fibrillation"):
-        summary.alerts.append("Alto riesgo de ACV (FA) - Considerar Anticoagulación")
-        
-    lipid_mgmt = scores_values.get("lipid_management")
-    if lipid_mgmt and lipid_mgmt.risk_category in ["Alto", "Muy Alto", "Extremo"]:
-        summary.alerts.append(f"Dislipidemia de Riesgo {lipid_mgmt.risk_category}")
-
-    summary.clinical_summary = f"Paciente con {len(summary.timeline)} eventos. Último: {new_event.title}."
+    apply_analysis(summary, data)
 
-    save_patient_db(db, summary)
+    try:
+        await save_patient_db_async(db, summary)
+    except DuplicatePatientNameError as e:
+        raise HTTPException(status_code=409, detail=str(e))
     logger.info("✅ Datos guardados exitosamente.")
     return summary
 
 @app.get("/patients/{patient_id}/summary", response_model=PatientSummary)
-async def get_patient_summary(patient_id: str, db: Session = Depends(get_db)):
+async def get_patient_summary(
+    patient_id: str,
+    expand: Optional[str] = None,
+    validate: bool = False,
+    db = Depends(get_async_db)
+):
     """
     Devuelve el estado completo (PatientSummary) de un paciente.
+    Los campos pesados de cada evento (raw_text, lab_table_full, digital_report_draft)
+    vienen solo como referencia en 'detached_fields'; con ?expand=all o
+    ?expand=raw_text,digital_report_draft se incluyen en la respuesta.
+    Sin expand, los bytes JSON guardados se envían tal cual (sin parsear ni revalidar);
+    ?validate=true o HCE_VALIDATE_READS=1 fuerzan el camino validado.
     """
     logger.info(f"🔍 Consultando summary de paciente: {patient_id}")
-    data = get_patient_db(db, patient_id)
-    if not data:
+    if not expand and not (validate or VALIDATE_READS):
+        content = await get_patient_json_db_async(db, patient_id)
+        if content is None:
+            logger.warning(f"❌ Paciente {patient_id} no encontrado.")
+            raise HTTPException(status_code=404, detail="Paciente no encontrado")
+        return Response(content=content, media_type="application/json")
+
+    summary = await load_patient_summary_async(db, patient_id)
+    if not summary:
         logger.warning(f"❌ Paciente {patient_id} no encontrado.")
         raise HTTPException(status_code=404, detail="Paciente no encontrado")
-    return PatientSummary(**data)
+    if expand:
+        fields = HEAVY_EVENT_FIELDS if expand == "all" else [f.strip() for f in expand.split(",")]
+        await expand_event_fields_async(db, summary, fields)
+    return summary
 
-@app.get("/patients", response_model=List[PatientSummary])
-async def list_patients(db: Session = Depends(get_db)):
+@app.get("/patients/{patient_id}/labs/{analyte}", response_model=LabSeries)
+async def get_lab_series(
+    patient_id: str,
+    analyte: str,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    points: Optional[int] = Query(None, ge=3, le=5000),
+    method: str = Query("lttb", pattern="^(lttb|minmax)$"),
+    stats: bool = False,
+    db = Depends(get_async_db)
+):
+    """
+    Serie de un analito para gráficos, sin bajar el summary completo.
+    date_from/date_to (YYYY-MM-DD) filtran el rango; points reduce la serie en el servidor
+    (LTTB o min/max por bucket); stats agrega último, mínimo, máximo, promedio y pendiente.
+    """
+    # Las tendencias se guardan con la clave canónica ("LDL-C" -> "ldl"); las cargadas a mano
+    # por PATCH pueden tener otra clave, así que si la canónica no tiene datos se prueba la pedida
+    canonical = canonical_analyte(analyte)
+    rows = await load_lab_series_db_async(db, patient_id, canonical, date_from, date_to)
+    if rows == [] and canonical != analyte:
+        rows = await load_lab_series_db_async(db, patient_id, analyte, date_from, date_to)
+        canonical = analyte if rows else canonical
+    if rows is None:
+        raise HTTPException(status_code=404, detail="Paciente no encontrado")
+    series = await run_in_threadpool(build_lab_series, rows, points, method, stats)
+    return {"analyte": canonical, **series}
+
+@app.get("/patients", response_model=List[PatientListItem])
+async def list_patients(
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=500),
+    cursor: Optional[str] = None,
+    sort: str = Query("name", pattern="^(name|age|last_event_date)$"),
+    order: str = Query("asc", pattern="^(asc|desc)$"),
+    db = Depends(get_async_db)
+):
     """
-    Devuelve la lista de todos los pacientes registrados en la BD.
+    Devuelve el listado de pacientes (nombre, edad, sexo, alertas, último evento).
+    Con limit (o cursor) pagina: la siguiente página se pide con el cursor del header
+    X-Next-Cursor. Sin ninguno de los dos devuelve todos, como antes (los clientes móvil
+    y web todavía no siguen el cursor).
     """
-    logger.info("📋 Listando todos los pacientes...")
-    all_data = get_all_patients_db(db)
-    logger.info(f"✅ Se encontraron {len(all_data)} pacientes.")
-    return [PatientSummary(**data) for data in all_data.values()]
+    if limit is None and cursor:
+        limit = PATIENT_LIST_PAGE_SIZE
+    logger.info(f"📋 Listando pacientes (sort={sort}, order={order}, limit={limit})...")
+    try:
+        items, next_cursor = await list_patients_page_db_async(db, limit=limit, cursor=cursor, sort=sort, order=order)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    logger.info(f"✅ Se devolvieron {len(items)} pacientes.")
+    return items
     
 @app.delete("/patients/{patient_id}")
-async def delete_patient(patient_id: str, db: Session = Depends(get_db)):
+async def delete_patient(patient_id: str, db = Depends(get_async_db)):
     """Elimina un paciente de la base de datos."""
     logger.info(f"🗑️ Eliminando paciente: {patient_id}")
-    success = delete_patient_db(db, patient_id)
+    success = await delete_patient_db_async(db, patient_id)
     if not success:
         raise HTTPException(status_code=404, detail="Paciente no encontrado")
     return {"message": "Paciente eliminado"}
 
 @app.post("/patients/{patient_id}/blood_pressure", response_model=PatientSummary)
-async def add_blood_pressure(patient_id: str, record: BloodPressureRecord, db: Session = Depends(get_db)):
+async def add_blood_pressure(patient_id: str, record: BloodPressureRecord, db = Depends(get_async_db)):
     """Agrega un registro de presión arterial al historial del paciente."""
     logger.info(f"❤️ Agregando TA para paciente {patient_id}: {record}")
     
-    summary_data = get_patient_db(db, patient_id)
-    if not summary_data:
+    summary = await load_patient_summary_async(db, patient_id)
+    if not summary:
         raise HTTPException(status_code=404, detail="Paciente no encontrado")
-    summary = PatientSummary(**summary_data)
     
     summary.blood_pressure_history.append(record)
     # Ordenar por fecha y hora descendente (más reciente primero)
     summary.blood_pressure_history.sort(key=lambda x: f"{x.date} {x.time}", reverse=True)
     
-    save_patient_db(db, summary)
+    await save_patient_db_async(db, summary)
     return summary
 
 @app.patch("/patients/{patient_id}", response_model=PatientSummary)
-async def update_patient_manual(patient_id: str, update_data: UpdatePatientRequest, db: Session = Depends(get_db)):
+async def update_patient_manual(patient_id: str, update_data: UpdatePatientRequest, db = Depends(get_async_db)):
     """
     Actualiza manualmente datos del paciente (edición por usuario).
     Permite modificar demografía, antecedentes, scores, medicación, etc.
     """
     logger.info(f"✏️ Actualización manual para paciente {patient_id}")
     
-    summary_data = get_patient_db(db, patient_id)
-    if not summary_data:
+    summary = await load_patient_summary_async(db, patient_id)
+    if not summary:
         raise HTTPException(status_code=404, detail="Paciente no encontrado")
-    summary = PatientSummary(**summary_data)
+    inputs_before = score_inputs(summary)
     
     # Aplicar actualizaciones parciales
     if update_data.demographics:
@@ -768,12 +601,9 @@ async def update_patient_manual(patient_id: str, update_data: UpdatePatientReque
         
     if update_data.antecedents:
         summary.antecedents = update_data.antecedents
-        # Recalcular scores si cambian antecedentes? 
-        # Por ahora confiamos en que el usuario edita lo que quiere, 
-        # o podríamos disparar un recálculo opcional.
         
     if update_data.risk_scores:
-        summary.risk_scores = update_data.risk_scores
+        summary.risk_scores = update_data.risk_scores.copy(update={"manual": True})
         
     if update_data.medications is not None:
         summary.medications = update_data.medications
@@ -792,31 +622,95 @@ async def update_patient_manual(patient_id: str, update_data: UpdatePatientReque
 
     if update_data.global_timeline is not None:
         summary.global_timeline = update_data.global_timeline
+
+    # Recalcular scores y alertas solo si cambió algo de lo que dependen (edad, sexo,
+    # antecedentes, último LDL) y el usuario no los editó a mano en este mismo PATCH
+    inputs_after = score_inputs(summary)
+    if update_data.risk_scores is None and inputs_after != inputs_before:
+        previous = summary.risk_scores
+        summary.risk_scores, summary.alerts = scores_for_inputs(inputs_after)
+        summary.risk_scores.grace = previous.grace
+        summary.risk_scores.crusade = previous.crusade
+        logger.info("🧮 Scores recalculados por cambio en sus datos de entrada.")
         
-    save_patient_db(db, summary)
+    try:
+        await save_patient_db_async(db, summary)
+    except DuplicatePatientNameError as e:
+        raise HTTPException(status_code=409, detail=str(e))
     logger.info("✅ Paciente actualizado manualmente.")
     return summary
 
+# Exportación/importación masiva por HTTP: expone o pisa toda la base de pacientes, así que
+# solo se monta con BULK_API_ENABLED=1 (sin él responde 404). El CLI (bulk.py) no depende de esto.
+BULK_API_ENABLED = os.environ.get("BULK_API_ENABLED", "0").lower() in ("1", "true", "yes")
+
+def require_bulk_api():
+    if not BULK_API_ENABLED:
+        raise HTTPException(status_code=404, detail="Not Found")
+
+@app.get("/export/patients.ndjson", dependencies=[Depends(require_bulk_api)])
+async def export_patients(batch_size: int = Query(200, ge=1, le=5000)):
+    """Exporta todos los pacientes como NDJSON (una línea por PatientSummary), en streaming."""
+    logger.info("📦 Exportando pacientes (NDJSON)...")
+    return StreamingResponse(export_ndjson_stream(batch_size), media_type="application/x-ndjson")
+
+@app.post("/import/patients", dependencies=[Depends(require_bulk_api)])
+async def import_patients(file: UploadFile = File(...), batch_size: int = Form(500)):
+    """Importa pacientes desde un NDJSON, validando e insertando por lotes (una transacción por lote)."""
+    logger.info(f"📥 Importando pacientes desde {file.filename} (lotes de {batch_size})...")
+    stats = await run_in_threadpool(import_ndjson_file, file.file, batch_size)
+    logger.info(f"✅ Importación: {stats['imported']} ok, {len(stats['failed'])} con error.")
+    return stats
+
+@app.get("/diagnostics/patient_cache")
+async def patient_cache_stats():
+    """Métricas de la caché de PatientSummary (hits, misses, tamaño)."""
+    return patient_cache.stats()
+
+@app.get("/diagnostics/score_cache")
+async def score_cache_diagnostics():
+    """Métricas de la memoización de scores (hits, misses, tamaño)."""
+    return score_cache_stats()
+
+@app.get("/diagnostics/extraction_cache")
+async def extraction_cache_stats():
+    """Métricas de la caché de extracciones (hits, misses, bytes en disco)."""
+    return extraction_cache.stats()
+
+@app.get("/diagnostics/extractor")
+async def extractor_stats():
+    """Estado del backend de IA: circuit breaker, cuota disponible, reintentos."""
+    return get_extractor_backend().stats()
+
+@app.get("/diagnostics/image_preprocessing")
+async def image_preprocessing_stats():
+    """Bytes ahorrados y latencia agregada por el preprocesamiento (imágenes y PDFs con texto)."""
+    return preprocess_stats.stats()
+
 @app.get("/patients/{patient_id}/events/{event_id}/digital_report", response_model=DigitalReport)
-async def get_digital_report(patient_id: str, event_id: str, db: Session = Depends(get_db)):
+async def get_digital_report(patient_id: str, event_id: str, db = Depends(get_async_db)):
     """
     Recupera el informe digital (Markdown/HTML) de un evento específico.
     Si no existe el borrador guardado, intenta generarlo al vuelo con los datos estructurados.
     """
-    summary_data = get_patient_db(db, patient_id)
-    if not summary_data:
+    summary = await load_patient_summary_async(db, patient_id)
+    if not summary:
         raise HTTPException(status_code=404, detail="Paciente no encontrado")
-    summary = PatientSummary(**summary_data)
 
-    target_event = None
-    for evt in summary.timeline:
+    target_event, target_key = None, None
+    for evt, key in zip(summary.timeline, timeline_row_keys(e.id for e in summary.timeline)):
         if evt.id == event_id:
-            target_event = evt
+            target_event, target_key = evt, key
             break
     
     if not target_event:
         raise HTTPException(status_code=404, detail="Evento no encontrado")
 
+    # Los campos pesados viven fuera de línea: cargar solo los de este evento
+    payloads = await load_event_payloads_async(db, patient_id, ["digital_report_draft", "raw_text"], [target_key])
+    for field, value in payloads.get(target_key, {}).items():
+        setattr(target_event, field, value)
+
     # 1. Si ya tiene el reporte guardado, devolverlo
     if target_event.digital_report_draft:
         return DigitalReport(**target_event.digital_report_draft)
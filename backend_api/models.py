@@ -1,5 +1,5 @@
-from typing import List, Dict, Optional, Any
-from pydantic import BaseModel
+from typing import List, Dict, Optional, Any, Literal
+from pydantic import BaseModel, Field
 
 class ScoreDetail(BaseModel):
     value: float
@@ -35,6 +35,9 @@ class ClinicalEvent(BaseModel):
     document_metadata: Optional[Dict[str, Any]] = None
     digital_report_draft: Optional[Dict[str, Any]] = None
 
+    # Campos pesados guardados fuera de línea (se piden con ?expand=...)
+    detached_fields: Optional[List[str]] = None
+
 class GlobalEvent(BaseModel):
     """Eventos para la historia clínica global (no cardiológica)."""
     date: str
@@ -50,6 +53,26 @@ class LabTrend(BaseModel):
     name: str # ej: "LDL", "Creatinina", "BNP"
     history: List[LabResult]
 
+class LabPoint(BaseModel):
+    date: str
+    value: float
+
+class LabSeriesStats(BaseModel):
+    count: int
+    last: LabPoint
+    min: LabPoint
+    max: LabPoint
+    mean: float
+    slope_per_year: Optional[float] = None # unidades por año (regresión lineal)
+
+class LabSeries(BaseModel):
+    analyte: str
+    unit: str
+    total_points: int # puntos en el rango antes de reducir
+    dates: List[str]
+    values: List[float]
+    stats: Optional[LabSeriesStats] = None
+
 class LipidManagement(BaseModel):
     ldl_current: Optional[float] = None
     risk_category: str # "Bajo", "Moderado", "Alto", "Muy Alto", "Extremo"
@@ -65,6 +88,7 @@ class RiskScores(BaseModel):
     crusade: Optional[float] = None # Riesgo sangrado en SCA
     details: Optional[Dict[str, ScoreDetail]] = None
     lipid_management: Optional[LipidManagement] = None
+    manual: bool = False # Editados por el usuario: el recálculo masivo no los pisa
 
 class Demographics(BaseModel):
     name: str
@@ -92,6 +116,14 @@ class PatientSummary(BaseModel):
     clinical_summary: str
     alerts: List[str]
 
+class PatientListItem(BaseModel):
+    """Proyección liviana para el listado de pacientes."""
+    patient_id: str
+    demographics: Demographics
+    alerts: List[str] = []
+    risk_scores: RiskScores = RiskScores() # solo chads2vasc, has_bled y score2
+    last_event_date: Optional[str] = None
+
 class ClinicalEventResponse(BaseModel):
     date: str
     type: str
@@ -105,6 +137,11 @@ class HistoricalLab(BaseModel):
     date: str
     labs: Dict[str, Any]
 
+class DocumentError(BaseModel):
+    index: int # posición del archivo en la subida
+    filename: Optional[str] = None
+    error: str
+
 class ExtractedData(BaseModel):
     event: ClinicalEvent
     medications: List[str]
@@ -112,6 +149,23 @@ class ExtractedData(BaseModel):
     risk_scores: RiskScores
     historical_data: List[HistoricalLab] = [] 
     global_timeline_events: List[GlobalEvent] = [] # NUEVO
+    document_errors: List[DocumentError] = [] # Archivos que fallaron (modo por documento)
+
+class ExtractionJob(BaseModel):
+    job_id: str
+    patient_id: str
+    status: str # queued | running | done | failed
+    created_at: str
+    updated_at: str
+    error: Optional[str] = None
+    result: Optional[ExtractedData] = None
+
+class BatchIngestRequest(BaseModel):
+    source: str # directorio o manifiesto, relativo a BATCH_INGEST_ROOT
+    auto_submit: bool = False
+    concurrency: Optional[int] = Field(None, ge=1, le=32) # acotado: cada worker es una llamada al proveedor de IA
+    mode: Optional[Literal["single", "per_document"]] = None
+    retry_failed: bool = False
 
 class SubmitAnalysisRequest(BaseModel):
     patient_id: str
@@ -0,0 +1,74 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# --- Caché en memoria de PatientSummary validados ---
+# Evita repetir lectura + json.loads + validación Pydantic en cada endpoint.
+# Cada entrada guarda la versión de la fila (patients.version); si en la BD
+# hay una versión distinta (otro worker guardó), la entrada se descarta.
+
+PATIENT_CACHE_SIZE = int(os.getenv("PATIENT_CACHE_SIZE", "256"))
+PATIENT_CACHE_TTL = float(os.getenv("PATIENT_CACHE_TTL", "300"))
+
+
+class PatientCache:
+    """LRU acotado con TTL, seguro entre hilos."""
+
+    def __init__(self, maxsize: int = PATIENT_CACHE_SIZE, ttl: float = PATIENT_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()  # patient_id -> (version, expires_at, summary)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, patient_id: str, version: int):
+        with self._lock:
+            entry = self._entries.get(patient_id)
+            if entry is None:
+                self.misses += 1
+                return None
+            cached_version, expires_at, summary = entry
+            if cached_version != version or expires_at < time.monotonic():
+                del self._entries[patient_id]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(patient_id)
+            self.hits += 1
+            return summary
+
+    def put(self, patient_id: str, version: int, summary):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[patient_id] = (version, time.monotonic() + self.ttl, summary)
+            self._entries.move_to_end(patient_id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, patient_id: str):
+        with self._lock:
+            self._entries.pop(patient_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / total, 3) if total else 0.0,
+            }
+
+
+patient_cache = PatientCache()
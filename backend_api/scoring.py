@@ -0,0 +1,531 @@
+"""
+Scores de riesgo (CHA2DS2-VASc, HAS-BLED, SCORE2) y metas de LDL.
+
+calculate_scores evalúa un paciente (submit_analysis, propuesta de la extracción).
+compute_scores_batch hace el mismo cálculo por columnas con NumPy para recalcular
+todo el registro (las edades cambian y las guías se actualizan): RegistryRescorer
+lo recorre por lotes y escribe los resultados en bloque.
+
+Uso (CLI, respeta DATABASE_URL):
+    python scoring.py --batch-size 2000
+"""
+import argparse
+import functools
+import logging
+import os
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from database import SessionLocal, count_scorable_patients_db, init_db, iter_score_inputs_db, write_risk_scores_db
+from models import LipidManagement, RiskScores, ScoreDetail
+
+logger = logging.getLogger("hce_vision_backend.scoring")
+
+RESCORE_BATCH_SIZE = 2000
+# Resultados memoizados por (edad, sexo, antecedentes, LDL): el espacio es chico y se repite mucho
+SCORE_CACHE_SIZE = int(os.getenv("SCORE_CACHE_SIZE", "4096"))
+
+# Categorías de riesgo lipídico (ESC) en orden de prioridad y su meta de LDL (mg/dL)
+LIPID_CATEGORIES = (
+    ("Extremo", 40.0),
+    ("Muy Alto", 55.0),
+    ("Alto", 70.0),
+    ("Moderado", 100.0),
+    ("Bajo", 116.0),
+)
+ALERT_LIPID_CATEGORIES = ("Alto", "Muy Alto", "Extremo")
+
+RECOMMENDATION_LIFESTYLE = "Estilo de vida saludable."
+RECOMMENDATION_HIGH = "Estatina Alta Potencia:\n• Atorvastatina 40-80 mg\n• Rosuvastatina 20-40 mg\n(Considerar Ezetimibe si no alcanza meta)"
+RECOMMENDATION_MODERATE = "Estatina Moderada Potencia:\n• Atorvastatina 10-20 mg\n• Rosuvastatina 5-10 mg"
+RECOMMENDATION_LOW = "Estatina Baja-Moderada Potencia."
+RECOMMENDATION_AT_TARGET = "Meta alcanzada. Mantener tratamiento actual."
+# Índices de compute_scores_batch()["recommendation"]
+RECOMMENDATIONS = (
+    RECOMMENDATION_AT_TARGET,
+    RECOMMENDATION_HIGH,
+    RECOMMENDATION_MODERATE,
+    RECOMMENDATION_LOW,
+    RECOMMENDATION_LIFESTYLE,
+)
+
+# Antecedentes que intervienen en algún score (columnas de antecedent_matrix)
+SCORE_FLAGS = (
+    "atrial_fibrillation",
+    "heart_failure",
+    "hta",
+    "diabetes",
+    "stroke",
+    "vascular_disease",
+    "renal_disease",
+    "liver_disease",
+    "bleeding_history",
+    "labile_inr",
+    "alcohol_drugs",
+    "smoking",
+    "acs_history",
+    "dyslipidemia",
+    "obesity",
+)
+_FLAG_INDEX = {name: i for i, name in enumerate(SCORE_FLAGS)}
+
+
+def safe_float(value: Any) -> Optional[float]:
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except (ValueError, TypeError):
+        return None
+
+def safe_bool(value: Any) -> bool:
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, str):
+        return value.lower() in ('true', '1', 't', 'y', 'yes')
+    return bool(value)
+
+def calculate_lipid_management(age: int, antecedents: dict, ldl_val: Optional[float]) -> Optional[LipidManagement]:
+    """Calcula metas de LDL y recomendación de estatinas según riesgo cardiovascular (ESC Guidelines)."""
+    if ldl_val is None:
+        return None
+
+    # 1. Determinar Categoría de Riesgo
+    risk_cat = "Bajo"
+    target = 116.0
+
+    # Definiciones simplificadas
+    has_acs = safe_bool(antecedents.get("acs_history"))
+    has_stroke = safe_bool(antecedents.get("stroke"))
+    has_cvd = safe_bool(antecedents.get("vascular_disease")) or has_acs or has_stroke
+    has_dm = safe_bool(antecedents.get("diabetes"))
+    has_ckd = safe_bool(antecedents.get("renal_disease"))
+    has_fh = safe_bool(antecedents.get("dyslipidemia"))
+
+    # Lógica de Riesgo
+    if has_acs and (has_dm or has_ckd or safe_bool(antecedents.get("smoking"))):
+         risk_cat = "Extremo"
+         target = 40.0
+    elif has_cvd:
+        risk_cat = "Muy Alto"
+        target = 55.0
+    elif has_dm or has_ckd or has_fh:
+        risk_cat = "Alto"
+        target = 70.0
+    elif age > 50 and (safe_bool(antecedents.get("hta")) or safe_bool(antecedents.get("smoking")) or safe_bool(antecedents.get("obesity"))):
+        risk_cat = "Moderado"
+        target = 100.0
+
+    # 2. Calcular reducción necesaria
+    reduction_pct = 0.0
+    if ldl_val > target:
+        reduction_pct = ((ldl_val - target) / ldl_val) * 100
+
+    # 3. Estrategia Terapéutica (Estatinas)
+    recommendation = RECOMMENDATION_LIFESTYLE
+
+    if reduction_pct > 0:
+        if reduction_pct >= 50:
+            recommendation = RECOMMENDATION_HIGH
+        elif reduction_pct >= 30:
+            recommendation = RECOMMENDATION_MODERATE
+        else:
+            recommendation = RECOMMENDATION_LOW
+
+    if ldl_val <= target:
+        recommendation = RECOMMENDATION_AT_TARGET
+
+    return LipidManagement(
+        ldl_current=ldl_val,
+        risk_category=risk_cat,
+        ldl_target=target,
+        reduction_needed_pct=round(reduction_pct, 1),
+        recommendation=recommendation
+    )
+
+def cha2ds2vasc_risk(value: float) -> str:
+    return "Alto Riesgo (Anticoagular)" if value >= 2 else ("Considerar Anticoagulación" if value == 1 else "Bajo Riesgo")
+
+def has_bled_risk(value: float) -> str:
+    return "Alto Riesgo Sangrado" if value >= 3 else "Bajo Riesgo Sangrado"
+
+def score2_risk(value: float) -> str:
+    if value >= 10: return "Muy Alto"
+    if value >= 5: return "Alto"
+    if value >= 2.5: return "Moderado"
+    return "Bajo"
+
+def calculate_scores(age: int, sex: str, antecedents: dict, labs: dict = {}) -> Dict[str, Any]:
+    """Calcula scores condicionales según patología."""
+
+    scores = {}
+    details = {}
+
+    # --- 1. Fibrilación Auricular (CHA2DS2-VASc & HAS-BLED) ---
+    if safe_bool(antecedents.get("atrial_fibrillation")):
+        # CHA2DS2-VASc
+        cha = 0
+        if safe_bool(antecedents.get("heart_failure")): cha += 1
+        if safe_bool(antecedents.get("hta")): cha += 1
+        if age >= 75: cha += 2
+        elif age >= 65: cha += 1
+        if safe_bool(antecedents.get("diabetes")): cha += 1
+        if safe_bool(antecedents.get("stroke")): cha += 2
+        if safe_bool(antecedents.get("vascular_disease")): cha += 1
+        if sex == 'F': cha += 1
+
+        scores["chads2vasc"] = cha
+        details["CHA2DS2-VASc"] = ScoreDetail(value=cha, risk=cha2ds2vasc_risk(cha))
+
+        # HAS-BLED
+        hb = 0
+        if safe_bool(antecedents.get("hta")): hb += 1
+        if safe_bool(antecedents.get("renal_disease")): hb += 1
+        if safe_bool(antecedents.get("liver_disease")): hb += 1
+        if safe_bool(antecedents.get("stroke")): hb += 1
+        if safe_bool(antecedents.get("bleeding_history")): hb += 1
+        if safe_bool(antecedents.get("labile_inr")): hb += 1
+        if age > 65: hb += 1
+        if safe_bool(antecedents.get("alcohol_drugs")): hb += 1
+
+        scores["has_bled"] = hb
+        details["HAS-BLED"] = ScoreDetail(value=hb, risk=has_bled_risk(hb))
+
+    # --- 2. Prevención Primaria (SCORE2) ---
+    score2_val = None
+    if 40 <= age <= 69:
+        base_risk = 1.0
+        if safe_bool(antecedents.get("smoking")): base_risk *= 2.0
+        if safe_bool(antecedents.get("diabetes")): base_risk *= 1.5
+        if safe_bool(antecedents.get("hta")): base_risk *= 1.3
+
+        age_factor = (age - 40) / 10.0
+        score2_val = round(base_risk * (1 + age_factor), 1)
+
+        scores["score2"] = score2_val
+        details["SCORE2"] = ScoreDetail(value=score2_val, risk=score2_risk(score2_val))
+
+    # --- 3. Manejo de Lípidos ---
+    ldl_data = labs.get("ldl")
+    ldl_val = None
+
+    if isinstance(ldl_data, dict) and "value" in ldl_data:
+        ldl_val = safe_float(ldl_data["value"])
+    elif isinstance(ldl_data, (int, float, str)):
+        ldl_val = safe_float(ldl_data)
+
+    lipid_mgmt = calculate_lipid_management(age, antecedents, ldl_val)
+    if lipid_mgmt:
+        scores["lipid_management"] = lipid_mgmt
+
+    return {
+        "scores": scores,
+        "details": details
+    }
+
+def score_alerts(chads2vasc: Optional[float], lipid_category: Optional[str]) -> List[str]:
+    """Alertas derivadas de los scores (CHA2DS2-VASc solo existe si hay FA)."""
+    alerts = []
+    if chads2vasc is not None and chads2vasc >= 2:
+        alerts.append("Alto riesgo de ACV (FA) - Considerar Anticoagulación")
+    if lipid_category in ALERT_LIPID_CATEGORIES:
+        alerts.append(f"Dislipidemia de Riesgo {lipid_category}")
+    return alerts
+
+# --- Recálculo incremental (edición manual) ---
+
+def antecedent_bitmask(antecedents: Optional[dict]) -> int:
+    """Antecedentes que afectan a los scores como máscara de bits (orden de SCORE_FLAGS)."""
+    mask = 0
+    for name, value in (antecedents or {}).items():
+        col = _FLAG_INDEX.get(name)
+        if col is not None and safe_bool(value):
+            mask |= 1 << col
+    return mask
+
+def score_inputs(summary) -> tuple:
+    """Clave de la memoización: todo lo que lee calculate_scores de un paciente (LDL = el último de la tendencia)."""
+    ldl_trend = summary.lab_trends.get("ldl") or []
+    latest = max(reversed(ldl_trend), key=lambda lab: lab.date, default=None)
+    return (
+        summary.demographics.age,
+        summary.demographics.sex,
+        antecedent_bitmask(summary.antecedents),
+        latest.value if latest else None,
+    )
+
+@functools.lru_cache(maxsize=SCORE_CACHE_SIZE)
+def _scores_for_inputs(age: int, sex: str, mask: int, ldl: Optional[float]):
+    antecedents = {name: True for i, name in enumerate(SCORE_FLAGS) if mask >> i & 1}
+    scores_data = calculate_scores(age, sex, antecedents, {"ldl": ldl} if ldl is not None else {})
+    scores = scores_data["scores"]
+    risk_scores = RiskScores(
+        chads2vasc=scores.get("chads2vasc"),
+        has_bled=scores.get("has_bled"),
+        score2=scores.get("score2"),
+        details=scores_data["details"],
+        lipid_management=scores.get("lipid_management"),
+    )
+    lipid = scores.get("lipid_management")
+    return risk_scores, tuple(score_alerts(scores.get("chads2vasc"), lipid.risk_category if lipid else None))
+
+def scores_for_inputs(inputs: tuple):
+    """(RiskScores, alertas) para una clave de score_inputs(); copia propia del resultado memoizado."""
+    risk_scores, alerts = _scores_for_inputs(*inputs)
+    return risk_scores.copy(deep=True), list(alerts)
+
+def score_cache_stats() -> dict:
+    info = _scores_for_inputs.cache_info()
+    total = info.hits + info.misses
+    return {
+        "size": info.currsize,
+        "maxsize": info.maxsize,
+        "hits": info.hits,
+        "misses": info.misses,
+        "hit_rate": round(info.hits / total, 3) if total else 0.0,
+    }
+
+# --- Cálculo por columnas (registro completo) ---
+
+def antecedent_matrix(antecedents_list) -> np.ndarray:
+    """Matriz booleana (pacientes x SCORE_FLAGS) con la misma lectura que safe_bool."""
+    matrix = np.zeros((len(antecedents_list), len(SCORE_FLAGS)), dtype=bool)
+    for row, antecedents in enumerate(antecedents_list):
+        for name, value in (antecedents or {}).items():
+            col = _FLAG_INDEX.get(name)
+            if col is not None and safe_bool(value):
+                matrix[row, col] = True
+    return matrix
+
+def compute_scores_batch(ages, sexes, flags: np.ndarray, ldl) -> Dict[str, np.ndarray]:
+    """
+    Mismos scores que calculate_scores para N pacientes a la vez.
+    ages: enteros; sexes: "M"/"F"; flags: antecedent_matrix(); ldl: float (NaN = sin dato).
+    Devuelve arrays por score; los que no aplican quedan en NaN (y -1 en lipid_category).
+    El redondeo a 1 decimal se hace al armar cada resultado (risk_scores_row), con round()
+    de Python, para coincidir exactamente con el cálculo individual.
+    """
+    age = np.asarray(ages, dtype=np.int64)
+    female = np.asarray(sexes, dtype=object) == "F"
+    ldl = np.asarray(ldl, dtype=np.float64)
+    counts = flags.astype(np.int64)
+    flag = {name: flags[:, i] for i, name in enumerate(SCORE_FLAGS)}
+    count = {name: counts[:, i] for i, name in enumerate(SCORE_FLAGS)}
+
+    # --- Fibrilación auricular ---
+    af = flag["atrial_fibrillation"]
+    cha = (
+        count["heart_failure"] + count["hta"] + np.where(age >= 75, 2, np.where(age >= 65, 1, 0))
+        + count["diabetes"] + 2 * count["stroke"] + count["vascular_disease"] + female
+    )
+    has_bled = (
+        count["hta"] + count["renal_disease"] + count["liver_disease"] + count["stroke"]
+        + count["bleeding_history"] + count["labile_inr"] + (age > 65) + count["alcohol_drugs"]
+    )
+
+    # --- SCORE2 (40-69 años); mismo orden de productos que el cálculo individual ---
+    base = np.ones(len(age))
+    base = np.where(flag["smoking"], base * 2.0, base)
+    base = np.where(flag["diabetes"], base * 1.5, base)
+    base = np.where(flag["hta"], base * 1.3, base)
+    score2 = np.where((age >= 40) & (age <= 69), base * (1 + (age - 40) / 10.0), np.nan)
+
+    # --- Lípidos ---
+    acs, dm, ckd, smoking = flag["acs_history"], flag["diabetes"], flag["renal_disease"], flag["smoking"]
+    cvd = flag["vascular_disease"] | acs | flag["stroke"]
+    category = np.select(
+        [
+            acs & (dm | ckd | smoking),
+            cvd,
+            dm | ckd | flag["dyslipidemia"],
+            (age > 50) & (flag["hta"] | smoking | flag["obesity"]),
+        ],
+        [0, 1, 2, 3],
+        default=4,
+    )
+    target = np.array([t for _, t in LIPID_CATEGORIES])[category]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        reduction = np.where(ldl > target, ((ldl - target) / ldl) * 100, 0.0)
+    recommendation = np.select(
+        [ldl <= target, reduction >= 50, reduction >= 30, reduction > 0],
+        [0, 1, 2, 3],
+        default=4,
+    )
+    has_ldl = ~np.isnan(ldl)
+
+    return {
+        "chads2vasc": np.where(af, cha, np.nan),
+        "has_bled": np.where(af, has_bled, np.nan),
+        "score2": score2,
+        "ldl": ldl,
+        "lipid_category": np.where(has_ldl, category, -1),
+        "ldl_target": target,
+        "ldl_reduction_pct": reduction,
+        "recommendation": recommendation,
+    }
+
+def risk_scores_row(batch: Dict[str, np.ndarray], i: int) -> dict:
+    """RiskScores (como dict, igual a RiskScores(...).dict()) del paciente i de compute_scores_batch."""
+    details = {}
+    chads2vasc = has_bled = score2 = lipid = None
+    if not np.isnan(batch["chads2vasc"][i]):
+        chads2vasc = float(batch["chads2vasc"][i])
+        has_bled = float(batch["has_bled"][i])
+        details["CHA2DS2-VASc"] = {"value": chads2vasc, "risk": cha2ds2vasc_risk(chads2vasc)}
+        details["HAS-BLED"] = {"value": has_bled, "risk": has_bled_risk(has_bled)}
+    if not np.isnan(batch["score2"][i]):
+        score2 = round(float(batch["score2"][i]), 1)
+        details["SCORE2"] = {"value": score2, "risk": score2_risk(score2)}
+    category = int(batch["lipid_category"][i])
+    if category >= 0:
+        lipid = {
+            "ldl_current": float(batch["ldl"][i]),
+            "risk_category": LIPID_CATEGORIES[category][0],
+            "ldl_target": float(batch["ldl_target"][i]),
+            "reduction_needed_pct": round(float(batch["ldl_reduction_pct"][i]), 1),
+            "recommendation": RECOMMENDATIONS[int(batch["recommendation"][i])],
+        }
+    return {
+        "chads2vasc": chads2vasc,
+        "has_bled": has_bled,
+        "score2": score2,
+        "grace": None,
+        "crusade": None,
+        "details": details,
+        "lipid_management": lipid,
+    }
+
+# --- Recálculo del registro ---
+
+class RegistryRescorer:
+    """
+    Recalcula risk_scores y alertas de todos los pacientes por lotes: lee edad, sexo,
+    antecedentes y el último LDL, calcula con compute_scores_batch y escribe en bloque
+    solo los que cambiaron. stats() expone el progreso (endpoint y CLI).
+    Los scores editados a mano (risk_scores.manual) se conservan salvo con overwrite_manual.
+    """
+
+    def __init__(self, batch_size: int = RESCORE_BATCH_SIZE, overwrite_manual: bool = False):
+        self.batch_size = batch_size
+        self.overwrite_manual = overwrite_manual
+        self.total = 0
+        self.processed = 0
+        self.updated = 0
+        self.unchanged = 0
+        self.skipped = 0
+        self.manual = 0
+        self.conflicts = 0
+        self.error: Optional[str] = None
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+    @property
+    def patients_per_second(self) -> float:
+        if not self.started_at:
+            return 0.0
+        elapsed = (self.finished_at or time.monotonic()) - self.started_at
+        return round(self.processed / elapsed, 1) if elapsed > 0 else 0.0
+
+    def stats(self) -> dict:
+        return {
+            "total": self.total,
+            "processed": self.processed,
+            "updated": self.updated,
+            "unchanged": self.unchanged,
+            "skipped": self.skipped,
+            "manual": self.manual,
+            "conflicts": self.conflicts,
+            "patients_per_second": self.patients_per_second,
+            "running": self.started_at is not None and self.finished_at is None,
+            "error": self.error,
+        }
+
+    def rescore(self, rows) -> List[tuple]:
+        """
+        rows: [(id, versión, core, ldl)] de iter_score_inputs_db.
+        Devuelve las actualizaciones [(id, versión, core, alertas)] de los que cambiaron.
+        """
+        valid = []
+        for row in rows:
+            if not self.overwrite_manual and (row[2].get("risk_scores") or {}).get("manual"):
+                self.manual += 1
+                continue
+            demographics = row[2].get("demographics") or {}
+            if isinstance(demographics.get("age"), int):
+                valid.append(row)
+            else:
+                self.skipped += 1
+        if not valid:
+            return []
+
+        batch = compute_scores_batch(
+            [row[2]["demographics"]["age"] for row in valid],
+            [row[2]["demographics"].get("sex") for row in valid],
+            antecedent_matrix([row[2].get("antecedents") for row in valid]),
+            [np.nan if row[3] is None else row[3] for row in valid],
+        )
+        updates = []
+        for i, (patient_id, version, core, _) in enumerate(valid):
+            previous = core.get("risk_scores") or {}
+            risk_scores = risk_scores_row(batch, i)
+            # GRACE y CRUSADE no se calculan acá: se conservan
+            risk_scores["grace"] = previous.get("grace")
+            risk_scores["crusade"] = previous.get("crusade")
+            risk_scores["manual"] = False
+            lipid = risk_scores["lipid_management"]
+            alerts = score_alerts(risk_scores["chads2vasc"], lipid["risk_category"] if lipid else None)
+            if risk_scores == previous and alerts == core.get("alerts", []):
+                self.unchanged += 1
+                continue
+            updates.append((patient_id, version, {**core, "risk_scores": risk_scores, "alerts": alerts}, alerts))
+        return updates
+
+    def run(self) -> dict:
+        """Recorre el registro completo (síncrono: en la API se lanza en un hilo)."""
+        self.started_at = time.monotonic()
+        db = SessionLocal()
+        try:
+            self.total = count_scorable_patients_db(db)
+            logger.info(f"🧮 Recálculo de scores: {self.total} pacientes (lotes de {self.batch_size}).")
+            for rows in iter_score_inputs_db(db, self.batch_size):
+                updates = self.rescore(rows)
+                written = write_risk_scores_db(db, updates) if updates else 0
+                self.updated += written
+                self.conflicts += len(updates) - written
+                self.processed += len(rows)
+                logger.info(
+                    f"🧮 [{self.processed}/{self.total}] {self.updated} actualizados, "
+                    f"{self.unchanged} sin cambios ({self.patients_per_second} pacientes/s)"
+                )
+        except Exception as e:
+            self.error = str(e)
+            logger.error(f"❌ Recálculo de scores interrumpido: {e}", exc_info=True)
+        finally:
+            db.close()
+            self.finished_at = time.monotonic()
+        return self.stats()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Recalcula scores de riesgo y alertas de todo el registro")
+    parser.add_argument("--batch-size", type=int, default=RESCORE_BATCH_SIZE)
+    parser.add_argument("--overwrite-manual", action="store_true", help="Recalcular también los scores editados a mano")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    init_db()
+    stats = RegistryRescorer(batch_size=args.batch_size, overwrite_manual=args.overwrite_manual).run()
+    print(
+        f"✅ {stats['processed']} pacientes ({stats['patients_per_second']} pacientes/s): "
+        f"{stats['updated']} actualizados, {stats['unchanged']} sin cambios, "
+        f"{stats['skipped']} sin edad válida, {stats['manual']} editados a mano, {stats['conflicts']} modificados durante el recálculo.",
+        file=sys.stderr,
+    )
+    return 1 if stats["error"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,50 @@
+import json
+
+try:
+    import orjson
+except ImportError:  # orjson es opcional; sin él se usa la librería estándar
+    orjson = None
+
+# --- Serialización JSON rápida (almacenamiento y respuestas) ---
+# orjson trabaja bytes-in/bytes-out y es varias veces más rápido que json.
+
+
+def dumps(obj) -> bytes:
+    """Serializa a JSON compacto (UTF-8)."""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def dumps_text(obj) -> str:
+    """Igual que dumps() pero como str (para columnas Text)."""
+    if orjson is not None:
+        return orjson.dumps(obj).decode("utf-8")
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+
+def loads(data):
+    """Acepta str, bytes o memoryview."""
+    if orjson is not None:
+        return orjson.loads(data)
+    if isinstance(data, memoryview):
+        data = data.tobytes()
+    return json.loads(data)
+
+
+def default_response_class():
+    """
+    Clase de respuesta por defecto para FastAPI.
+    Las versiones nuevas de FastAPI ya serializan los response_model directo a bytes
+    con pydantic-core (y marcan ORJSONResponse como deprecada): ahí no se cambia nada.
+    En versiones anteriores se usa ORJSONResponse si orjson está instalado.
+    """
+    from fastapi.datastructures import Default
+    from fastapi.responses import JSONResponse
+    if orjson is None:
+        return Default(JSONResponse)
+    from fastapi.responses import ORJSONResponse
+    if getattr(ORJSONResponse, "__deprecated__", None):
+        # Default(...) conserva el camino rápido de FastAPI (pasar la clase explícita lo desactiva)
+        return Default(JSONResponse)
+    return ORJSONResponse
@@ -0,0 +1,17 @@
+import os
+import tempfile
+
+import pytest
+
+# Base de datos aislada para los tests (no tocar hce_vision.db del repo)
+_TEST_DB_DIR = tempfile.mkdtemp(prefix="hce_vision_tests_")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_TEST_DB_DIR, 'test.db')}"
+os.environ["EXTRACTION_JOBS_DIR"] = os.path.join(_TEST_DB_DIR, "job_files")
+
+import database
+
+
+@pytest.fixture(scope="session", autouse=True)
+def _init_test_db():
+    database.init_db()
+    yield
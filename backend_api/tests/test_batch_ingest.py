@@ -0,0 +1,115 @@
+import asyncio
+import json
+import uuid
+
+import batch_ingest
+from batch_ingest import BatchIngestor, load_checkpoint, load_manifest, validate_extraction
+from database import SessionLocal, create_patient_db, load_patient_summary
+from extraction.stub import stub_extract
+from models import Demographics, PatientSummary, RiskScores
+
+
+def _create_patient(name: str) -> str:
+    pid = str(uuid.uuid4())
+    db = SessionLocal()
+    try:
+        create_patient_db(db, PatientSummary(
+            patient_id=pid, demographics=Demographics(name=name, age=58, sex="F"), timeline=[],
+            medications=[], risk_scores=RiskScores(), clinical_summary="Paciente registrado.", alerts=[],
+        ))
+    finally:
+        db.close()
+    return pid
+
+
+def test_batch_ingest_directory_auto_submit_and_resume(tmp_path, monkeypatch):
+    async def fake_extract(files_data, bypass_cache=False, mode=None):
+        raw = stub_extract(files_data)
+        raw.pop("simulated")
+        return raw
+
+    monkeypatch.setattr(batch_ingest, "extract_documents", fake_extract)
+    pid = _create_patient(f"Lote {uuid.uuid4()}")
+    for patient_id in (pid, "no-existe"):
+        (tmp_path / "scans" / patient_id).mkdir(parents=True)
+        (tmp_path / "scans" / patient_id / "hoja1.jpg").write_bytes(b"hoja 1 " + patient_id.encode())
+        (tmp_path / "scans" / patient_id / "hoja2.pdf").write_bytes(b"hoja 2")
+
+    entries = load_manifest(str(tmp_path / "scans"))
+    assert [e["patient_id"] for e in entries] == sorted([pid, "no-existe"])
+    checkpoint = str(tmp_path / "scans.ckpt.jsonl")
+
+    stats = asyncio.run(BatchIngestor(entries, checkpoint=checkpoint, concurrency=2, auto_submit=True).run())
+    assert stats["submitted"] == 1 and stats["failed"] == 1 and stats["documents"] == 2
+    assert stats["docs_per_minute"] > 0
+
+    db = SessionLocal()
+    try:
+        summary = load_patient_summary(db, pid)
+    finally:
+        db.close()
+    assert len(summary.timeline) == 1 and summary.timeline[0].source == batch_ingest.BATCH_SOURCE
+
+    # Al relanzar con el mismo checkpoint no se repite nada; --retry-failed solo reintenta el fallido
+    assert BatchIngestor(entries, checkpoint=checkpoint).entries == []
+    retry = BatchIngestor(entries, checkpoint=checkpoint, retry_failed=True)
+    assert [e["patient_id"] for e in retry.entries] == ["no-existe"]
+    assert {r["status"] for r in load_checkpoint(checkpoint).values()} == {"submitted", "failed"}
+
+    # Crash entre el guardado y el checkpoint: se repite la entrada sin duplicar el evento
+    entry = next(e for e in entries if e["patient_id"] == pid)
+    batch_ingest._append_line(checkpoint, json.dumps({"id": entry["id"], "status": batch_ingest.SUBMITTING}) + "\n")
+    again = BatchIngestor(entries, checkpoint=checkpoint, auto_submit=True)
+    assert again.entries == [entry]
+    assert asyncio.run(again.run())["submitted"] == 1
+    db = SessionLocal()
+    try:
+        timeline = load_patient_summary(db, pid).timeline
+    finally:
+        db.close()
+    assert [e.id for e in timeline] == [batch_ingest.batch_event_id(entry)]
+
+
+def test_batch_ingest_records_simulated_extractions_as_failed(tmp_path, monkeypatch):
+    async def simulated(files_data, bypass_cache=False, mode=None):
+        return stub_extract(files_data)
+
+    monkeypatch.setattr(batch_ingest, "extract_documents", simulated)
+    pid = _create_patient(f"Lote {uuid.uuid4()}")
+    (tmp_path / "scan.jpg").write_bytes(b"scan")
+    entries = [batch_ingest._entry(pid, [str(tmp_path / "scan.jpg")])]
+    stats = asyncio.run(BatchIngestor(entries, auto_submit=True, output_dir=str(tmp_path / "review")).run())
+    assert stats["failed"] == 1 and stats["needs_review"] == 0
+
+
+def test_manifest_priorities_and_validation(tmp_path):
+    (tmp_path / "a.jpg").write_bytes(b"a")
+    (tmp_path / "manifest.jsonl").write_text(
+        '{"patient_id": "p1", "files": ["a.jpg"]}\n{"patient_id": "p2", "files": ["a.jpg"], "priority": 5}\n'
+    )
+    entries = load_manifest(str(tmp_path / "manifest.jsonl"))
+    assert entries[1]["priority"] == 5 and entries[0]["files"] == [str(tmp_path / "a.jpg")]
+
+    raw = stub_extract([(b"a", "image/jpeg")])
+    assert validate_extraction(raw) == ["datos simulados (IA no disponible)"]
+    raw.pop("simulated")
+    assert validate_extraction(raw) == []
+    assert "fecha del documento ausente o inválida" in validate_extraction({**raw, "date": None})
+
+
+def test_batch_request_validation_and_no_app_import():
+    import subprocess
+    import sys
+
+    import pytest
+    from pydantic import ValidationError
+    from models import BatchIngestRequest
+
+    assert BatchIngestRequest(source="x", mode="per_document", concurrency=4).concurrency == 4
+    for bad in ({"mode": "todo"}, {"concurrency": 0}, {"concurrency": 1000}):
+        with pytest.raises(ValidationError):
+            BatchIngestRequest(source="x", **bad)
+
+    # La ingesta (CLI) no debe cargar la app FastAPI
+    code = "import sys, batch_ingest; sys.exit('main' in sys.modules)"
+    assert subprocess.run([sys.executable, "-c", code]).returncode == 0
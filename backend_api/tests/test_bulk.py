@@ -0,0 +1,47 @@
+import uuid
+
+import serialization
+from bulk import export_ndjson, import_ndjson
+from database import SessionLocal, save_patient_db, get_patient_db, delete_patient_db
+from models import PatientSummary, Demographics, RiskScores, ClinicalEvent
+
+
+def test_export_then_import_roundtrip():
+    db = SessionLocal()
+    try:
+        patient_id = str(uuid.uuid4())
+        summary = PatientSummary(
+            patient_id=patient_id,
+            demographics=Demographics(name=f"Bulk {patient_id}", age=70, sex="M"),
+            timeline=[ClinicalEvent(id="e1", date="2024-03-01", type="laboratorio", title="Lab", description="", raw_text="OCR completo")],
+            medications=[],
+            risk_scores=RiskScores(),
+            clinical_summary="",
+            alerts=[],
+        )
+        save_patient_db(db, summary)
+
+        lines = [line for line in export_ndjson(db, batch_size=2) if patient_id.encode() in line]
+        assert len(lines) == 1
+        assert serialization.loads(lines[0])["timeline"][0]["raw_text"] == "OCR completo"
+
+        delete_patient_db(db, patient_id)
+        stats = import_ndjson(db, lines + [b"{no es json", b""], batch_size=1)
+        assert stats["imported"] == 1
+        assert [f["line"] for f in stats["failed"]] == [2]
+        assert get_patient_db(db, patient_id)["demographics"]["age"] == 70
+    finally:
+        db.close()
+
+
+def test_bulk_http_endpoints_are_disabled_unless_enabled(monkeypatch):
+    from fastapi.testclient import TestClient
+    import main
+
+    client = TestClient(main.app)
+    assert client.get("/export/patients.ndjson").status_code == 404
+    assert client.post("/import/patients", files={"file": ("p.ndjson", b"", "application/x-ndjson")}).status_code == 404
+
+    monkeypatch.setattr(main, "BULK_API_ENABLED", True)
+    assert client.get("/export/patients.ndjson").status_code == 200
+    assert client.post("/import/patients", files={"file": ("p.ndjson", b"", "application/x-ndjson")}).json()["imported"] == 0
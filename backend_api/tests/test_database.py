@@ -0,0 +1,346 @@
+import asyncio
+import json
+import uuid
+
+from sqlalchemy import text
+
+from database import (
+    engine,
+    SQLITE_PRAGMAS,
+    SessionLocal,
+    PatientDB,
+    BloodPressureDB,
+    TimelineEventDB,
+    save_patient_db,
+    get_patient_db,
+    delete_patient_db,
+    list_patients_page_db,
+    create_patient_db,
+    find_patient_by_name_db,
+    load_patient_summary,
+    expand_event_fields,
+    get_patient_json_db,
+    get_async_db,
+    save_patient_db_async,
+    load_patient_summary_async,
+    expand_event_fields_async,
+)
+from patient_cache import patient_cache
+from models import PatientSummary, Demographics, RiskScores, ClinicalEvent, BloodPressureRecord, LabResult
+
+
+def _summary(patient_id):
+    return PatientSummary(
+        patient_id=patient_id,
+        demographics=Demographics(name=f"Paciente {patient_id}", age=60, sex="F"),
+        timeline=[ClinicalEvent(id="e1", date="2024-01-01", type="laboratorio", title="Lab", description="", raw_text="OCR")],
+        medications=[],
+        risk_scores=RiskScores(),
+        lab_trends={"ldl": [LabResult(date="2024-01-01", value=130, unit="mg/dL")]},
+        clinical_summary="Paciente registrado.",
+        alerts=[],
+    )
+
+
+def test_normalized_roundtrip_and_incremental_write():
+    """Guardar un cambio pequeño no debe reescribir las filas que no cambiaron."""
+    patient_id = str(uuid.uuid4())
+    db = SessionLocal()
+    try:
+        summary = _summary(patient_id)
+        save_patient_db(db, summary)
+        event_row_id = db.query(TimelineEventDB.id).filter(TimelineEventDB.patient_id == patient_id).scalar()
+
+        summary.blood_pressure_history.insert(0, BloodPressureRecord(date="2024-02-01", time="08:00", systolic=130, diastolic=80))
+        summary.timeline.insert(0, ClinicalEvent(id="e2", date="2024-02-01", type="consulta", title="Control", description=""))
+        save_patient_db(db, summary)
+
+        stored = expand_event_fields(db, PatientSummary(**get_patient_db(db, patient_id)))
+        assert stored == summary
+        assert [e.id for e in stored.timeline] == ["e2", "e1"]
+        # La fila del evento original se conserva (no se borró y reinsertó)
+        assert db.query(TimelineEventDB.id).filter(TimelineEventDB.event_id == "e1", TimelineEventDB.patient_id == patient_id).scalar() == event_row_id
+
+        assert delete_patient_db(db, patient_id)
+        assert get_patient_db(db, patient_id) is None
+        assert db.query(BloodPressureDB).filter(BloodPressureDB.patient_id == patient_id).count() == 0
+    finally:
+        db.close()
+
+
+def test_patient_list_keyset_pagination():
+    db = SessionLocal()
+    try:
+        ids = [str(uuid.uuid4()) for _ in range(3)]
+        for patient_id in ids:
+            save_patient_db(db, _summary(patient_id))
+        save_patient_db(db, _summary(ids[0]).copy(update={"risk_scores": RiskScores(chads2vasc=3, score2=4.5)}))
+
+        seen, cursor = [], None
+        while True:
+            items, cursor = list_patients_page_db(db, limit=2, cursor=cursor, sort="last_event_date", order="desc")
+            seen.extend(items)
+            if cursor is None:
+                break
+
+        listed = [item["patient_id"] for item in seen]
+        assert len(listed) == len(set(listed))
+        assert set(ids) <= set(listed)
+        item = next(i for i in seen if i["patient_id"] == ids[0])
+        assert item["last_event_date"] == "2024-01-01"
+        assert item["demographics"]["age"] == 60
+        assert item["risk_scores"] == {"chads2vasc": 3, "has_bled": None, "score2": 4.5}
+    finally:
+        db.close()
+
+
+def test_create_patient_dedupes_by_normalized_name():
+    db = SessionLocal()
+    try:
+        first = _summary(str(uuid.uuid4()))
+        assert create_patient_db(db, first) is None
+
+        twin = _summary(str(uuid.uuid4()))
+        twin.demographics.name = f"  {first.demographics.name.upper()} "
+        existing = create_patient_db(db, twin)
+        assert existing["patient_id"] == first.patient_id
+        assert find_patient_by_name_db(db, twin.demographics.name)["patient_id"] == first.patient_id
+        assert get_patient_db(db, twin.patient_id) is None
+    finally:
+        db.close()
+
+
+def test_summary_cache_hits_and_version_invalidation():
+    db = SessionLocal()
+    try:
+        summary = _summary(str(uuid.uuid4()))
+        save_patient_db(db, summary)
+        patient_cache.invalidate(summary.patient_id)
+
+        hits = patient_cache.hits
+        first = load_patient_summary(db, summary.patient_id)
+        second = load_patient_summary(db, summary.patient_id)
+        assert patient_cache.hits == hits + 1
+        assert first == second and first is not second
+
+        # Un guardado desde otra sesión (otro worker) sube la versión
+        db.query(PatientDB).filter(PatientDB.id == summary.patient_id).update({PatientDB.version: PatientDB.version + 1})
+        db.commit()
+        misses = patient_cache.misses
+        load_patient_summary(db, summary.patient_id)
+        assert patient_cache.misses == misses + 1
+
+        delete_patient_db(db, summary.patient_id)
+        assert load_patient_summary(db, summary.patient_id) is None
+    finally:
+        db.close()
+
+
+def test_async_helpers_roundtrip():
+    summary = _summary(str(uuid.uuid4()))
+
+    async def scenario():
+        async for db in get_async_db():
+            await save_patient_db_async(db, summary)
+            patient_cache.invalidate(summary.patient_id)
+            stored = await load_patient_summary_async(db, summary.patient_id)
+            return await expand_event_fields_async(db, stored)
+
+    assert asyncio.run(scenario()) == summary
+
+
+def test_sqlite_profile_pragmas_applied():
+    with engine.connect() as conn:
+        assert conn.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+        assert conn.execute(text("PRAGMA busy_timeout")).scalar() == SQLITE_PRAGMAS["busy_timeout"]
+
+
+def test_heavy_event_fields_stored_out_of_line():
+    db = SessionLocal()
+    try:
+        summary = _summary(str(uuid.uuid4()))
+        summary.timeline[0].digital_report_draft = {"format": "markdown", "content": "# Informe\n" * 200}
+        save_patient_db(db, summary)
+
+        light = PatientSummary(**get_patient_db(db, summary.patient_id))
+        event = light.timeline[0]
+        assert event.raw_text is None and event.digital_report_draft is None
+        assert event.detached_fields == ["raw_text", "digital_report_draft"]
+
+        # Guardar el summary liviano no pierde los campos pesados
+        light.alerts = ["Nueva alerta"]
+        save_patient_db(db, light)
+        expand_event_fields(db, light)
+        assert light.timeline[0].raw_text == "OCR"
+        assert light.timeline[0].digital_report_draft == summary.timeline[0].digital_report_draft
+        assert light.timeline[0].detached_fields is None
+    finally:
+        db.close()
+
+
+def test_event_payloads_follow_detached_marker_and_duplicate_ids():
+    db = SessionLocal()
+    try:
+        summary = _summary(str(uuid.uuid4()))
+        twin = summary.timeline[0].copy(update={"raw_text": "OCR gemelo"})
+        summary.timeline.append(twin)  # mismo id "e1"
+        save_patient_db(db, summary)
+
+        light = PatientSummary(**get_patient_db(db, summary.patient_id))
+        expand_event_fields(db, light)
+        assert [e.raw_text for e in light.timeline] == ["OCR", "OCR gemelo"]
+
+        # Un None sin la marca detached_fields borra el campo; con la marca se conserva
+        light = PatientSummary(**get_patient_db(db, summary.patient_id))
+        light.timeline[0].detached_fields = None
+        save_patient_db(db, light)
+        reloaded = PatientSummary(**get_patient_db(db, summary.patient_id))
+        assert [e.detached_fields for e in reloaded.timeline] == [None, ["raw_text"]]
+        expand_event_fields(db, reloaded)
+        assert [e.raw_text for e in reloaded.timeline] == [None, "OCR gemelo"]
+    finally:
+        db.close()
+
+
+def test_raw_summary_json_matches_validated_summary():
+    db = SessionLocal()
+    try:
+        summary = _summary(str(uuid.uuid4()))
+        summary.blood_pressure_history.append(BloodPressureRecord(date="2024-02-01", time="08:00", systolic=120, diastolic=75))
+        save_patient_db(db, summary)
+
+        raw = get_patient_json_db(db, summary.patient_id)
+        assert PatientSummary(**json.loads(raw)) == PatientSummary(**get_patient_db(db, summary.patient_id))
+        assert get_patient_json_db(db, "no-existe") is None
+
+        # Fila legacy sin migrar (blob con campos viejos y sin los nuevos)
+        legacy = {**json.loads(_summary("x").json()), "patient_id": str(uuid.uuid4()), "risk_factors": []}
+        del legacy["risk_scores"]["grace"]
+        db.add(PatientDB(id=legacy["patient_id"], name="Legacy", data=json.dumps(legacy)))
+        db.commit()
+        raw = json.loads(get_patient_json_db(db, legacy["patient_id"]))
+        assert raw == json.loads(load_patient_summary(db, legacy["patient_id"]).json())
+        delete_patient_db(db, legacy["patient_id"])
+    finally:
+        db.close()
+
+
+def test_only_normalized_name_violations_are_duplicate_names():
+    from sqlalchemy.exc import IntegrityError
+    from database import _is_duplicate_name
+
+    def error(message):
+        return IntegrityError("INSERT ...", {}, Exception(message))
+
+    assert _is_duplicate_name(error("UNIQUE constraint failed: patients.normalized_name"))
+    assert _is_duplicate_name(error('duplicate key value violates unique constraint "ix_patients_normalized_name"'))
+    assert not _is_duplicate_name(error("UNIQUE constraint failed: lab_results.patient_id, lab_results.row_key"))
+    assert not _is_duplicate_name(error("NOT NULL constraint failed: patients.id"))
+
+
+def test_patient_list_endpoint_is_unpaged_without_limit_or_cursor():
+    from fastapi.testclient import TestClient
+    from main import app
+
+    db = SessionLocal()
+    try:
+        for _ in range(3):
+            save_patient_db(db, _summary(str(uuid.uuid4())))
+        total = db.query(PatientDB).filter(PatientDB.core.isnot(None)).count()
+    finally:
+        db.close()
+
+    client = TestClient(app)
+    response = client.get("/patients")
+    assert len(response.json()) == total and "X-Next-Cursor" not in response.headers
+
+    response = client.get("/patients", params={"limit": 2})
+    assert len(response.json()) == 2 and response.headers["X-Next-Cursor"]
+    cursor = response.headers["X-Next-Cursor"]
+    assert len(client.get("/patients", params={"cursor": cursor}).json()) == min(total - 2, 100)
+
+
+def test_concurrent_saves_get_distinct_versions():
+    from concurrent.futures import ThreadPoolExecutor
+
+    summary = _summary(str(uuid.uuid4()))
+    db = SessionLocal()
+    try:
+        start = save_patient_db(db, summary).version
+    finally:
+        db.close()
+
+    def save(i):
+        session = SessionLocal()
+        try:
+            save_patient_db(session, summary.copy(update={"clinical_summary": f"Guardado {i}"}))
+        finally:
+            session.close()
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        list(pool.map(save, range(8)))
+
+    db = SessionLocal()
+    try:
+        assert db.get(PatientDB, summary.patient_id).version == start + 8
+        # La caché nunca guarda un contenido con la versión de otro guardado
+        served = load_patient_summary(db, summary.patient_id)
+        patient_cache.invalidate(summary.patient_id)
+        assert served == load_patient_summary(db, summary.patient_id)
+    finally:
+        db.close()
+
+
+def test_init_db_migrates_baseline_shaped_databases(tmp_path, monkeypatch):
+    import sqlite3
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    import database
+
+    legacy = {
+        "patient_id": "legacy-1",
+        "demographics": {"name": "Juan Pérez", "age": 65, "sex": "M"},
+        "timeline": [{"id": "e1", "date": "2024-02-01", "type": "laboratorio", "title": "Lab",
+                      "description": "", "raw_text": "OCR"}],
+        "medications": [],
+        "risk_scores": {"chads2vasc": None, "has_bled": None, "score2": None},
+        "lab_trends": {},
+        "risk_factors": [],  # campo que ya no existe
+        "clinical_summary": "Paciente nuevo registrado.",
+        "alerts": [],
+    }
+    schemas = {
+        # Esquema del ORM original y el de la primera versión (data NOT NULL)
+        "orm.db": "CREATE TABLE patients (id VARCHAR NOT NULL, name VARCHAR, data TEXT, PRIMARY KEY (id))",
+        "not_null.db": "CREATE TABLE patients (id TEXT PRIMARY KEY, data TEXT NOT NULL)",
+    }
+    for filename, schema in schemas.items():
+        path = tmp_path / filename
+        conn = sqlite3.connect(path)
+        conn.execute(schema)
+        conn.execute("INSERT INTO patients (id, data) VALUES (?, ?)", ("legacy-1", json.dumps(legacy)))
+        conn.commit()
+        conn.close()
+
+        legacy_engine = create_engine(f"sqlite:///{path}")
+        monkeypatch.setattr(database, "engine", legacy_engine)
+        monkeypatch.setattr(database, "SessionLocal", sessionmaker(autocommit=False, autoflush=False, bind=legacy_engine))
+        database.init_db()
+
+        db = database.SessionLocal()
+        try:
+            row = db.get(PatientDB, "legacy-1")
+            assert row.core is not None and row.data == ""
+            patient_cache.invalidate("legacy-1")
+            summary = load_patient_summary(db, "legacy-1")
+            assert summary.demographics.name == "Juan Pérez" and summary.timeline[0].detached_fields == ["raw_text"]
+            # El JSON crudo (GET /summary) es el mismo que el validado
+            assert PatientSummary(**json.loads(get_patient_json_db(db, "legacy-1"))) == summary
+            assert json.loads(get_patient_json_db(db, "legacy-1")) == json.loads(summary.json())
+            # Pacientes nuevos se pueden guardar aunque data sea NOT NULL
+            save_patient_db(db, _summary("nuevo-" + filename))
+            assert load_patient_summary(db, "nuevo-" + filename) is not None
+        finally:
+            db.close()
+            patient_cache.clear()
+        legacy_engine.dispose()
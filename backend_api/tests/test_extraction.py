@@ -0,0 +1,424 @@
+import asyncio
+import os
+import time
+
+import pytest
+
+from extraction.executor import EXTRACTION_MAX_CONCURRENCY, run_extraction, ExtractionTimeoutError
+from extraction.cache import ExtractionCache, extraction_cache_key
+
+
+def test_run_extraction_keeps_event_loop_free_and_times_out():
+    ticks = []
+
+    async def heartbeat():
+        for _ in range(5):
+            ticks.append(time.monotonic())
+            await asyncio.sleep(0.01)
+
+    async def scenario():
+        result, _ = await asyncio.gather(run_extraction(lambda: time.sleep(0.1) or {"ok": True}), heartbeat())
+        assert result == {"ok": True}
+        with pytest.raises(ExtractionTimeoutError):
+            await run_extraction(time.sleep, 0.5, timeout=0.05)
+
+        # Las llamadas vencidas siguen ocupando su hilo: el timeout de la siguiente
+        # cuenta recién cuando un hilo la empieza a ejecutar
+        stuck = [run_extraction(time.sleep, 0.3, timeout=0.05) for _ in range(EXTRACTION_MAX_CONCURRENCY)]
+        results = await asyncio.gather(*stuck, return_exceptions=True)
+        assert all(isinstance(r, ExtractionTimeoutError) for r in results)
+        assert await run_extraction(lambda: time.sleep(0.05) or "ok", timeout=0.15) == "ok"
+
+    asyncio.run(scenario())
+    # El heartbeat corrió mientras la extracción bloqueaba su hilo
+    assert len(ticks) == 5 and ticks[-1] - ticks[0] < 0.1
+
+
+def test_extraction_cache_key_and_lru_eviction(tmp_path):
+    key = extraction_cache_key([(b"a", "image/jpeg"), (b"b", "application/pdf")])
+    assert key == extraction_cache_key([(b"b", "application/pdf"), (b"a", "image/jpeg")])
+    assert key != extraction_cache_key([(b"a", "image/jpeg")])
+    assert key != extraction_cache_key([(b"a", "image/jpeg"), (b"b", "application/pdf")], prompt_version="otra")
+
+    cache = ExtractionCache(directory=str(tmp_path), max_bytes=150)
+    cache.put("old", {"x": "a" * 60})
+    os.utime(tmp_path / "old.json", (0, 0))
+    cache.put("new", {"x": "b" * 60})
+    cache.put("newest", {"x": "c" * 60})
+    assert cache.get("old") is None
+    assert cache.get("newest") == {"x": "c" * 60}
+    assert cache.evictions == 1 and cache.hits == 1 and cache.misses == 1
+
+
+def test_extraction_job_queue_with_stub_backend(monkeypatch):
+    from fastapi.testclient import TestClient
+    from main import app
+
+    monkeypatch.setenv("EXTRACTOR_BACKEND", "stub")
+    with TestClient(app) as client:
+        patient = client.post("/patients", json={"name": "Paciente Cola", "age": 61, "sex": "M"}).json()
+        response = client.post(
+            "/extract_jobs",
+            data={"patient_id": patient["patient_id"]},
+            files=[("files", ("lab.jpg", b"contenido", "image/jpeg"))],
+        )
+        assert response.status_code == 202
+        job_id = response.json()["job_id"]
+
+        # El stream SSE termina cuando el trabajo termina
+        with client.stream("GET", f"/extract_jobs/{job_id}/events") as stream:
+            events = [line.split(": ", 1)[1] for line in stream.iter_lines() if line.startswith("event: ")]
+        assert events[-1] == "done"
+
+        job = client.get(f"/extract_jobs/{job_id}").json()
+        assert job["status"] == "done" and job["error"] is None
+        assert job["result"]["event"]["title"] == "Documento de prueba (1 archivos)"
+
+        assert client.get("/extract_jobs/no-existe").status_code == 404
+
+
+def test_preprocess_image_downscales_crops_and_strips_exif():
+    Image = pytest.importorskip("PIL.Image")
+    import io
+    from extraction.preprocess import preprocess_documents, preprocess_image
+
+    photo = Image.new("RGB", (4000, 3000), "white")
+    photo.paste(Image.new("RGB", (3000, 2000), (200, 30, 30)), (500, 500))
+    exif = Image.Exif()
+    exif[0x010F] = "CameraMaker"
+    buf = io.BytesIO()
+    photo.save(buf, format="JPEG", quality=95, exif=exif)
+    original = buf.getvalue()
+
+    processed = preprocess_image(original, max_dimension=1000)
+    with Image.open(io.BytesIO(processed)) as result:
+        assert result.mode == "L" and result.format == "JPEG"
+        assert max(result.size) == 1000 and abs(result.width / result.height - 1.5) < 0.02  # sin el borde blanco
+        assert not result.getexif()
+    assert len(processed) < len(original)
+
+    files_data = asyncio.run(preprocess_documents([(original, "image/jpeg"), (b"%PDF-1.4", "application/pdf")]))
+    assert files_data[0][1] == "image/jpeg" and len(files_data[0][0]) < len(original)
+    assert files_data[1] == (b"%PDF-1.4", "application/pdf")
+
+
+def test_split_pdf_sends_text_and_drops_empty_or_duplicate_pages():
+    pytest.importorskip("pypdf")
+    import io
+    from pypdf import PdfWriter
+    from pypdf.generic import DecodedStreamObject, DictionaryObject, NameObject
+    from extraction.pdf_text import split_pdf
+
+    writer = PdfWriter()
+    font = writer._add_object(DictionaryObject({
+        NameObject("/Type"): NameObject("/Font"),
+        NameObject("/Subtype"): NameObject("/Type1"),
+        NameObject("/BaseFont"): NameObject("/Helvetica"),
+    }))
+
+    def text_page(text):
+        page = writer.add_blank_page(612, 792)
+        page[NameObject("/Resources")] = DictionaryObject({
+            NameObject("/Font"): DictionaryObject({NameObject("/F1"): font}),
+        })
+        stream = DecodedStreamObject()
+        stream.set_data(f"BT /F1 12 Tf 72 720 Td ({text}) Tj ET".encode("latin-1"))
+        page[NameObject("/Contents")] = writer._add_object(stream)
+
+    text_page("Colesterol LDL 132 mg/dL - Laboratorio Central - Hoja 1")
+    text_page("Colesterol LDL 132 mg/dL - Laboratorio Central - Hoja 1")
+    writer.add_blank_page(612, 792)
+    text_page("Creatinina 1.1 mg/dL - Laboratorio Central - Hoja 2")
+    buf = io.BytesIO()
+    writer.write(buf)
+
+    parts, info = split_pdf(buf.getvalue())
+    assert info == {"pages": 4, "text_pages": 2, "dropped_pages": 2}
+    assert len(parts) == 1 and parts[0][1] == "text/plain"
+    text = parts[0][0].decode("utf-8")
+    assert "[Página 1]" in text and "[Página 4]" in text and "Creatinina 1.1" in text
+
+    # Una página con poco texto y sin imágenes no es una página vacía
+    writer = PdfWriter()
+    text_page("Troponina: 45 ng/L")
+    buf = io.BytesIO()
+    writer.write(buf)
+    parts, info = split_pdf(buf.getvalue())
+    assert info == {"pages": 1, "text_pages": 1, "dropped_pages": 0}
+    assert parts == [("[Página 1]\nTroponina: 45 ng/L".encode("utf-8"), "text/plain")]
+
+
+def test_per_document_extraction_merges_and_reports_failures(monkeypatch):
+    from extraction import pipeline
+    from extraction.merge import merge_extractions
+
+    docs = {
+        b"lab-marzo": {"date": "2024-03-01", "title": "Laboratorio", "labs": {"ldl": 150, "hdl": 40},
+                       "antecedents": {"hta": False}, "medications": ["Enalapril 10 mg"],
+                       "historical_data": [{"date": "2023-01-01", "labs": {"ldl": 170}}]},
+        b"lab-junio": {"date": "2024-06-01", "title": "Control", "labs": {"ldl": 110},
+                       "antecedents": {"hta": True}, "medications": ["enalapril 10 mg", "Aspirina"],
+                       "historical_data": [{"date": "2023-01-01", "labs": {"ldl": 170}}]},
+    }
+
+    def extractor(parts):
+        content = bytes(parts[0][0])
+        if content not in docs:
+            raise ValueError("respuesta inválida del modelo")
+        return docs[content]
+
+    monkeypatch.setattr(pipeline, "get_extractor", lambda strict=False: extractor)
+    files = [(b"lab-junio", "text/csv"), (b"roto", "text/csv"), (b"lab-marzo", "text/csv")]
+    raw = asyncio.run(pipeline.extract_documents(files, mode="per_document"))
+
+    assert raw["document_errors"] == [{"index": 1, "error": "respuesta inválida del modelo"}]
+    assert raw["labs"] == {"ldl": 110, "hdl": 40}  # el más reciente gana
+    assert raw["antecedents"] == {"hta": True}
+    assert raw["medications"] == ["enalapril 10 mg", "Aspirina"]
+    assert len(raw["historical_data"]) == 1
+    assert raw["title"] == "Control (+1 documentos)"
+
+    # El resultado no depende del orden en que terminan las llamadas
+    results = [(0, docs[b"lab-junio"]), (2, docs[b"lab-marzo"])]
+    assert merge_extractions(results) == merge_extractions(results[::-1])
+
+
+def test_resilient_extractor_rate_limit_retries_and_circuit_breaker():
+    from extraction.base import Extractor
+    from extraction.resilience import (
+        CircuitBreaker, CircuitOpenError, RateLimitError, ResilientExtractor, TokenBucket,
+    )
+
+    now = [0.0]
+    clock = lambda: now[0]
+
+    def advance(seconds):
+        now[0] += seconds
+
+    bucket = TokenBucket(rate=1.0, capacity=2, clock=clock, sleep=advance)
+    bucket.acquire()
+    bucket.acquire()
+    bucket.acquire()  # sin tokens: espera 1 s
+    assert now[0] == 1.0
+    with pytest.raises(RateLimitError):
+        bucket.acquire(max_wait=0.5)
+
+    class QuotaError(Exception):
+        code = 429
+
+    class Flaky(Extractor):
+        name = "flaky"
+
+        def __init__(self, errors):
+            self.errors = list(errors)
+            self.timeouts = []
+
+        def extract(self, files_data, timeout=None):
+            self.timeouts.append(timeout)
+            if self.errors:
+                raise self.errors.pop(0)
+            return {"ok": True}
+
+    def resilient(backend, breaker):
+        return ResilientExtractor(backend, TokenBucket(100, 100, clock=clock, sleep=advance), breaker,
+                                  max_retries=3, backoff_base=0.1, sleep=advance)
+
+    extractor = resilient(Flaky([QuotaError(), QuotaError()]), CircuitBreaker(5, 30, clock=clock))
+    assert extractor.extract([]) == {"ok": True}
+    assert extractor.retries == 2 and extractor.breaker.state == "closed"
+    # Cada intento recibe lo que queda del plazo como timeout de la llamada
+    timeouts = extractor.backend.timeouts
+    assert len(timeouts) == 3 and all(119 < t <= 120.0 for t in timeouts) and timeouts == sorted(timeouts, reverse=True)
+
+    # Un error no transitorio no se reintenta ni abre el circuito
+    extractor = resilient(Flaky([ValueError("JSON inválido")]), CircuitBreaker(1, 30, clock=clock))
+    with pytest.raises(ValueError):
+        extractor.extract([])
+    assert extractor.retries == 0 and extractor.breaker.state == "closed"
+
+    breaker = CircuitBreaker(2, 30, clock=clock)
+    extractor = resilient(Flaky([QuotaError()] * 10), breaker)
+    with pytest.raises(CircuitOpenError):
+        extractor.extract([])  # se abre a la segunda falla y el reintento falla rápido
+    assert breaker.state == "open" and extractor.calls == 2
+    advance(31)
+    assert breaker.state == "half_open"
+    extractor.backend.errors = []
+    assert extractor.extract([]) == {"ok": True} and breaker.state == "closed"
+
+    # La prueba en half_open no queda tomada si termina en error no transitorio o sin cuota
+    breaker = CircuitBreaker(1, 30, clock=clock)
+    extractor = resilient(Flaky([QuotaError(), ValueError("JSON inválido")]), breaker)
+    extractor.max_retries = 0
+    with pytest.raises(QuotaError):
+        extractor.extract([])
+    advance(31)
+    with pytest.raises(ValueError):
+        extractor.extract([])
+    assert breaker.state == "half_open"
+    extractor.limiter = TokenBucket(1.0, 0, clock=clock, sleep=advance)
+    with pytest.raises(RateLimitError):
+        extractor.deadline = 0.5
+        extractor.extract([])
+    extractor.limiter, extractor.deadline = TokenBucket(100, 100, clock=clock, sleep=advance), 120.0
+    assert extractor.extract([]) == {"ok": True} and breaker.state == "closed"
+
+
+def test_extract_data_stream_sends_sections_before_the_result(monkeypatch):
+    import json
+    from fastapi.testclient import TestClient
+    from main import app
+
+    monkeypatch.setenv("EXTRACTOR_BACKEND", "stub")
+    with TestClient(app) as client:
+        patient = client.post("/patients", json={"name": "Paciente Stream", "age": 70, "sex": "F"}).json()
+        with client.stream(
+            "POST", "/extract_data/stream",
+            data={"patient_id": patient["patient_id"]},
+            files=[("files", ("lab.pdf", b"%PDF-no-parseable", "application/pdf"))],
+        ) as response:
+            assert response.headers["content-type"].startswith("text/event-stream")
+            events = []
+            for line in response.iter_lines():
+                if line.startswith("event: "):
+                    events.append([line[7:], None])
+                elif line.startswith("data: "):
+                    events[-1][1] = json.loads(line[6:])
+
+    names = [e[0] if e[0] != "section" else e[1]["name"] for e in events]
+    assert names.index("title") < names.index("risk_scores") < names.index("raw_text") < names.index("result")
+    assert names[-1] == "result" and "error" not in names
+    assert events[-1][1]["event"]["title"] == "Documento de prueba (1 archivos)"
+
+
+def test_extract_data_stream_accepts_mode_and_upload_limit(monkeypatch):
+    from fastapi.testclient import TestClient
+    from main import app
+    from uploads import UPLOAD_PATHS
+
+    assert "/extract_data/stream" in UPLOAD_PATHS
+    monkeypatch.setenv("EXTRACTOR_BACKEND", "stub")
+    with TestClient(app) as client:
+        patient = client.post("/patients", json={"name": "Paciente Stream Modo", "age": 70, "sex": "F"}).json()
+        files = [("files", ("a.pdf", b"%PDF-a", "application/pdf")), ("files", ("b.pdf", b"%PDF-b", "application/pdf"))]
+        body = client.post("/extract_data/stream", data={"patient_id": patient["patient_id"], "mode": "per_document"}, files=files).text
+        assert "event: result" in body and "event: error" not in body
+        bad = client.post("/extract_data/stream", data={"patient_id": patient["patient_id"], "mode": "otro"}, files=files)
+        assert bad.status_code == 422
+
+
+def test_incremental_parser_yields_members_as_they_close():
+    import json
+    from extraction.incremental import IncrementalJSONObjectParser
+
+    doc = {"title": 'Lab "central", {sede} [2]', "labs": {"ldl": {"value": 130, "unit": "mg/dL"}},
+           "historical_data": [{"date": "2023-01-01", "labs": {"hdl": "45 ]"}}], "vital_signs": None}
+    text = "```json\n" + json.dumps(doc, indent=2) + "\n```"
+    for size in (1, 5, len(text)):
+        parser = IncrementalJSONObjectParser()
+        seen = []
+        for i in range(0, len(text), size):
+            seen.extend(parser.feed(text[i:i + size]))
+        assert seen == list(doc.items()) and parser.finished and parser.result == doc
+
+    parser = IncrementalJSONObjectParser()
+    assert parser.feed('{"title": "Ecocardiograma", "raw_text": "texto sin ter') == [("title", "Ecocardiograma")]
+    assert not parser.finished
+
+
+def test_extract_data_maps_provider_errors_instead_of_simulating(monkeypatch):
+    from fastapi.testclient import TestClient
+    from extraction import pipeline
+    from extraction.base import Extractor
+    from extraction.resilience import RateLimitError
+    from main import app
+
+    class Failing(Extractor):
+        name = "falla"
+        error = ValueError("respuesta inválida")
+
+        def extract(self, files_data):
+            raise self.error
+
+    class Unavailable(Exception):
+        code = 503
+
+    backend = Failing()
+    monkeypatch.setattr(pipeline, "get_extractor_backend", lambda: backend)
+    with TestClient(app) as client:
+        patient = client.post("/patients", json={"name": "Paciente Proveedor", "age": 60, "sex": "M"}).json()
+
+        def post():
+            return client.post(
+                "/extract_data",
+                data={"patient_id": patient["patient_id"], "bypass_cache": "true"},
+                files=[("files", ("lab.jpg", b"contenido", "image/jpeg"))],
+            )
+
+        assert post().status_code == 502
+        backend.error = Unavailable("caído")
+        assert post().status_code == 503
+        backend.error = RateLimitError("sin cuota")
+        assert post().status_code == 503
+
+
+def test_extraction_jobs_are_claimed_once_and_only_expired_leases_recovered(tmp_path):
+    from database import SessionLocal, claim_extraction_job_db, create_extraction_job_db, get_extraction_job_db
+    from extraction.jobs import ExtractionJobQueue
+
+    db = SessionLocal()
+    try:
+        create_extraction_job_db(db, "job-claim", "p1", [])
+        create_extraction_job_db(db, "job-vencido", "p1", [])
+        create_extraction_job_db(db, "job-vigente", "p1", [])
+        assert claim_extraction_job_db(db, "job-claim", "a", 60)["status"] == "running"
+        assert claim_extraction_job_db(db, "job-claim", "b", 60) is None
+        claim_extraction_job_db(db, "job-vencido", "muerto", -1)
+        claim_extraction_job_db(db, "job-vigente", "vivo", 60)
+    finally:
+        db.close()
+
+    handled = []
+
+    async def handler(patient_id, files_data, options):
+        handled.append(patient_id)
+        return {}
+
+    async def scenario():
+        queue = ExtractionJobQueue(handler, workers=1, directory=str(tmp_path))
+        await queue.start()
+        await queue._queue.join()
+        await queue.stop()
+
+    asyncio.run(scenario())
+    db = SessionLocal()
+    try:
+        assert get_extraction_job_db(db, "job-vencido")["status"] == "done"
+        assert get_extraction_job_db(db, "job-vigente")["status"] == "running"
+        assert get_extraction_job_db(db, "job-claim")["status"] == "running"
+    finally:
+        db.close()
+
+
+def test_per_document_extraction_fails_when_every_document_fails(monkeypatch):
+    from fastapi.testclient import TestClient
+    from extraction import pipeline
+    from main import app
+
+    def extractor(parts):
+        raise ValueError("respuesta inválida del modelo")
+
+    monkeypatch.setattr(pipeline, "get_extractor", lambda strict=False: extractor)
+    with pytest.raises(pipeline.DocumentExtractionError) as error:
+        asyncio.run(pipeline.extract_documents([(b"a", "text/csv"), (b"b", "text/csv")], mode="per_document"))
+    assert [e["index"] for e in error.value.errors] == [0, 1]
+
+    with TestClient(app) as client:
+        patient = client.post("/patients", json={"name": "Paciente Sin Documentos", "age": 60, "sex": "M"}).json()
+        response = client.post(
+            "/extract_data",
+            data={"patient_id": patient["patient_id"], "mode": "per_document", "bypass_cache": "true"},
+            files=[("files", ("a.csv", b"a", "text/csv")), ("files", ("b.csv", b"b", "text/csv"))],
+        )
+    assert response.status_code == 502
+    assert response.json()["detail"]["document_errors"] == error.value.errors
@@ -0,0 +1,64 @@
+import datetime
+import uuid
+
+import numpy as np
+from fastapi.testclient import TestClient
+
+from lab_series import build_lab_series, lttb, minmax_buckets
+from main import app
+
+client = TestClient(app)
+
+
+def test_downsampling_keeps_endpoints_and_extremes():
+    x = np.arange(1000, dtype=np.float64)
+    y = np.sin(x / 50)
+    y[500] = 10  # pico aislado
+
+    idx = lttb(x, y, 50)
+    assert len(idx) == 50 and idx[0] == 0 and idx[-1] == 999 and 500 in idx
+    assert np.all(np.diff(idx) > 0)
+
+    idx = minmax_buckets(y, 50)
+    assert len(idx) <= 50 and 500 in idx and y.argmin() in idx
+
+    rows = [("2024-01-01", 1.0, "mg/dL"), ("fecha mala", 2.0, "mg/dL"), ("2025-01-01", 3.0, "mg/dL")]
+    series = build_lab_series(rows, stats=True)
+    assert series["dates"] == ["2024-01-01", "2025-01-01"] and series["unit"] == "mg/dL"
+    assert abs(series["stats"]["slope_per_year"] - 2 * 365.25 / 366) < 1e-9
+
+    rows = [("2024-01-01", 10.0, "mg/dL"), ("", 11.0, "mg/dL"), (None, 12.0, "mg/dL"),
+            ("2025-01-01", float("nan"), "mg/dL"), ("NaT", 13.0, "mg/dL"), ("2026-01-01", 34.0, "mg/dL")]
+    series = build_lab_series(rows, points=3, stats=True)
+    assert series["dates"] == ["2024-01-01", "2026-01-01"] and series["values"] == [10.0, 34.0]
+    assert abs(series["stats"]["slope_per_year"] - 24 * 365.25 / 731) < 1e-9
+
+
+def test_lab_series_endpoint_filters_downsamples_and_summarizes():
+    patient = client.post("/patients", json={"name": f"Series {uuid.uuid4()}", "age": 66, "sex": "M"}).json()
+    start = datetime.date(2020, 1, 1)
+    trend = [{"date": (start + datetime.timedelta(days=7 * i)).isoformat(), "value": 100 + i % 30, "unit": "mg/dL"}
+             for i in range(300)]
+    client.patch(f"/patients/{patient['patient_id']}", json={"lab_trends": {"ldl": trend, "hdl": trend[:3]}})
+
+    url = f"/patients/{patient['patient_id']}/labs/ldl"
+    body = client.get(url, params={"date_from": "2022-01-01", "date_to": "2022-12-31", "stats": True}).json()
+    assert body["total_points"] == len(body["dates"]) == 52
+    assert all("2022-01-01" <= d <= "2022-12-31" for d in body["dates"])
+    assert body["stats"]["last"]["date"] == body["dates"][-1]
+    assert body["stats"]["min"]["value"] == min(body["values"])
+
+    body = client.get(url, params={"points": 40}).json()
+    assert body["total_points"] == 300 and len(body["values"]) == 40 and body["stats"] is None
+    assert body["dates"][0] == trend[0]["date"] and body["dates"][-1] == trend[-1]["date"]
+
+    assert client.get(f"/patients/{patient['patient_id']}/labs/glucosa").json()["total_points"] == 0
+    assert client.get("/patients/no-existe/labs/ldl").status_code == 404
+
+
+def test_lab_series_accepts_analyte_synonyms():
+    patient = client.post("/patients", json={"name": f"Series {uuid.uuid4()}", "age": 60, "sex": "F"}).json()
+    client.patch(f"/patients/{patient['patient_id']}", json={"lab_trends": {"ldl": [{"date": "2024-01-01", "value": 120, "unit": "mg/dL"}]}})
+    for name in ("LDL-C", "colesterol LDL", "ldl"):
+        body = client.get(f"/patients/{patient['patient_id']}/labs/{name}").json()
+        assert body["analyte"] == "ldl" and body["values"] == [120.0]
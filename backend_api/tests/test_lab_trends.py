@@ -0,0 +1,81 @@
+from lab_trends import LabTrendStore, parse_lab_value
+from models import LabResult
+
+
+def test_parse_lab_value_formats():
+    assert parse_lab_value({"value": "5.4", "unit": "%"}) == (5.4, "%")
+    assert parse_lab_value({"value": None, "unit": "%"}) == (None, "%")
+    assert parse_lab_value(130) == (130.0, "")
+    assert parse_lab_value("LDL: 132 mg/dL") == (132.0, "")
+    assert parse_lab_value("< 0.5") == (0.5, "")
+    assert parse_lab_value("5,4 %") == (5.4, "")
+    assert parse_lab_value({"value": "0,9", "unit": "mg/dL"}) == (0.9, "mg/dL")
+    assert parse_lab_value("1.234,5") == (1234.5, "") and parse_lab_value("1,234.5") == (1234.5, "")
+    assert parse_lab_value("negativo") == (None, "")
+    assert parse_lab_value({"unit": "mg/dL"}) == (None, "")
+
+
+def test_store_keeps_trends_sorted_and_skips_duplicates():
+    trends = {"ldl": [LabResult(date="2024-05-01", value=120, unit="mg/dL"),
+                      LabResult(date="2023-01-01", value=150, unit="mg/dL")]}
+    store = LabTrendStore(trends)
+
+    for year in range(2000, 2050):  # 50 columnas históricas
+        store.add_labs(f"{year}-06-01", {"ldl": {"value": 100 + year % 7, "unit": "mg/dL"}, "hdl": "45 mg/dL"})
+    store.add_labs("2024-05-01", {"ldl": 120, "glucosa": {"value": "no es número"}, "hba1c": None})
+    store.flush()
+
+    assert store.added == 100 and store.duplicates == 1
+    dates = [r.date for r in trends["ldl"]]
+    assert dates == sorted(dates) and len(dates) == 52
+    assert trends["hdl"][0] == LabResult(date="2000-06-01", value=45.0, unit="mg/dL")
+    assert "glucosa" not in trends and "hba1c" not in trends
+
+
+def test_synonyms_and_units_collapse_into_one_trend():
+    trends = {}
+    store = LabTrendStore(trends)
+    store.add_labs("2024-03-01", {"LDL-C": {"value": 3.36, "unit": "mmol/L"}, "Creatinina": {"value": 88.4, "unit": "µmol/L"}})
+    store.add_labs("2024-06-01", {"ldl": {"value": 110, "unit": "mg/dL"}})
+    store.add_table("2024-06-01", [
+        {"test_name_raw": "Colesterol LDL (calculado)", "value": 110, "unit": "mg/dl"},  # duplicado de labs
+        {"test_name_raw": "HbA1c", "value_raw": "48", "unit": "mmol/mol"},
+        {"test_name_raw": "Observaciones", "value_raw": "muestra hemolizada"},
+    ])
+    store.flush()
+
+    assert sorted(trends) == ["creatinine", "hba1c", "ldl"]
+    assert [(r.date, r.value, r.unit) for r in trends["ldl"]] == [("2024-03-01", 129.931, "mg/dL"), ("2024-06-01", 110.0, "mg/dL")]
+    assert trends["creatinine"][0].value == 1.0 and trends["hba1c"][0].unit == "%"
+    assert store.duplicates == 1
+
+
+def test_invalid_lab_values_are_skipped_not_fatal():
+    trends = {}
+    store = LabTrendStore(trends)
+    assert store.add("ldl", None, 100.0) is False  # fecha inválida: se saltea
+    store.add_labs("2024-01-01", {"ldl": {"value": 5, "unit": None}, "hdl": {"value": 40, "unit": 7}})
+    store.flush()
+    assert trends["ldl"][0].unit == "mg/dL" and trends["hdl"][0].unit == "7"
+
+
+def test_bad_rows_do_not_drop_the_rest_of_the_batch():
+    trends = {}
+    store = LabTrendStore(trends)
+    store.add_labs(None, {"ldl": 100})  # sin fecha
+    store.add_labs("2024-01-01", {"ldl": float("nan"), "hdl": 40})
+    store.add_table("2024-01-01", [{"test_name_raw": "Glucemia", "value": 95, "unit": {"raro": 1}}])
+    store.flush()
+    assert sorted(trends) == ["glucose", "hdl"] and trends["glucose"][0].unit == "{'raro': 1}"
+
+
+def test_table_values_given_as_text_are_kept():
+    trends = {}
+    store = LabTrendStore(trends)
+    store.add_table("2024-01-01", [
+        {"test_name_raw": "PCR", "value": "<0.5", "unit": "mg/dL"},
+        {"test_name_raw": "Creatinina", "value": "ver informe", "value_raw": "1,2 mg/dL", "unit": "mg/dL"},
+        {"test_name_raw": "Cultivo", "value": "negativo"},
+    ])
+    store.flush()
+    assert sorted(r.value for trend in trends.values() for r in trend) == [0.5, 1.2]
@@ -0,0 +1,136 @@
+import random
+import time
+import uuid
+
+import numpy as np
+from fastapi.testclient import TestClient
+
+from main import app
+from models import RiskScores
+from scoring import SCORE_FLAGS, RegistryRescorer, antecedent_matrix, calculate_scores, compute_scores_batch, risk_scores_row
+
+client = TestClient(app)
+
+
+def test_batch_scores_match_single_patient_scores():
+    rng = random.Random(7)
+    values = [True, False, "true", "no", 1, 0, None]
+    patients = []
+    for _ in range(2000):
+        antecedents = {flag: rng.choice(values) for flag in SCORE_FLAGS if rng.random() < 0.6}
+        ldl = rng.choice([None, rng.uniform(30, 250), 55.0, 116.0])
+        patients.append((rng.randint(18, 95), rng.choice(["M", "F"]), antecedents, ldl))
+
+    batch = compute_scores_batch(
+        [p[0] for p in patients],
+        [p[1] for p in patients],
+        antecedent_matrix([p[2] for p in patients]),
+        [np.nan if p[3] is None else p[3] for p in patients],
+    )
+    for i, (age, sex, antecedents, ldl) in enumerate(patients):
+        expected = calculate_scores(age, sex, antecedents, {"ldl": ldl} if ldl is not None else {})
+        scores = expected["scores"]
+        expected = RiskScores(
+            chads2vasc=scores.get("chads2vasc"),
+            has_bled=scores.get("has_bled"),
+            score2=scores.get("score2"),
+            details=expected["details"],
+            lipid_management=scores.get("lipid_management"),
+        )
+        assert RiskScores(**risk_scores_row(batch, i)) == expected, (age, sex, antecedents, ldl)
+
+
+def test_registry_rescore_writes_scores_alerts_and_is_idempotent():
+    patient = client.post("/patients", json={"name": f"Scores {uuid.uuid4()}", "age": 78, "sex": "F"}).json()
+    patient_id = patient["patient_id"]
+    client.patch(f"/patients/{patient_id}", json={
+        "antecedents": {"atrial_fibrillation": True, "hta": True, "acs_history": True, "smoking": True},
+        "lab_trends": {"ldl": [
+            {"date": "2023-01-01", "value": 90, "unit": "mg/dL"},
+            {"date": "2024-01-01", "value": 160, "unit": "mg/dL"},
+        ]},
+    })
+
+    stats = RegistryRescorer(batch_size=100).run()
+    assert stats["error"] is None and stats["processed"] == stats["total"] and stats["updated"] >= 1
+
+    summary = client.get(f"/patients/{patient_id}/summary").json()
+    scores = summary["risk_scores"]
+    assert scores["chads2vasc"] == 4 and scores["has_bled"] == 2 and scores["score2"] is None
+    assert scores["lipid_management"]["ldl_current"] == 160
+    assert scores["lipid_management"]["risk_category"] == "Extremo"
+    assert summary["alerts"] == [
+        "Alto riesgo de ACV (FA) - Considerar Anticoagulación",
+        "Dislipidemia de Riesgo Extremo",
+    ]
+    listed = client.get("/patients", params={"limit": 500}).json()
+    item = next(p for p in listed if p["patient_id"] == patient_id)
+    assert item["alerts"] == summary["alerts"]
+    assert (item["risk_scores"]["chads2vasc"], item["risk_scores"]["has_bled"]) == (4, 2)
+
+    again = RegistryRescorer(batch_size=100).run()
+    assert again["updated"] == 0 and again["unchanged"] == again["processed"] - again["skipped"]
+
+
+def test_manual_update_recomputes_scores_only_when_inputs_change():
+    patient_id = client.post("/patients", json={"name": f"Manual {uuid.uuid4()}", "age": 70, "sex": "M"}).json()["patient_id"]
+    url = f"/patients/{patient_id}"
+
+    body = client.patch(url, json={"antecedents": {"atrial_fibrillation": True, "hta": True}}).json()
+    assert body["risk_scores"]["chads2vasc"] == 2 and body["risk_scores"]["has_bled"] == 2
+    assert body["alerts"] == ["Alto riesgo de ACV (FA) - Considerar Anticoagulación"]
+
+    manual = {**body["risk_scores"], "chads2vasc": 9}
+    assert client.patch(url, json={"risk_scores": manual}).json()["risk_scores"]["chads2vasc"] == 9
+    # Sin cambios en edad/sexo/antecedentes/LDL no se pisa la edición manual
+    assert client.patch(url, json={"clinical_summary": "Control"}).json()["risk_scores"]["chads2vasc"] == 9
+
+    hits = client.get("/diagnostics/score_cache").json()["hits"]
+    body = client.patch(url, json={
+        "demographics": {"name": body["demographics"]["name"], "age": 70, "sex": "F"},
+        "lab_trends": {"ldl": [{"date": "2024-05-01", "value": 130, "unit": "mg/dL"}]},
+    }).json()
+    assert body["risk_scores"]["chads2vasc"] == 3
+    assert body["risk_scores"]["lipid_management"]["risk_category"] == "Moderado"
+
+    # Otro paciente con las mismas entradas sale de la memoización
+    other = client.post("/patients", json={"name": f"Manual {uuid.uuid4()}", "age": 70, "sex": "F"}).json()["patient_id"]
+    client.patch(f"/patients/{other}", json={
+        "antecedents": {"atrial_fibrillation": True, "hta": True},
+        "lab_trends": {"ldl": [{"date": "2024-05-01", "value": 130, "unit": "mg/dL"}]},
+    })
+    assert client.get("/diagnostics/score_cache").json()["hits"] > hits
+
+
+def test_recompute_scores_endpoint_is_gated_and_keeps_manual_scores(monkeypatch):
+    import main
+
+    assert client.post("/admin/recompute_scores").status_code == 404
+    monkeypatch.setattr(main, "ADMIN_API_ENABLED", True)
+
+    patient_id = client.post("/patients", json={"name": f"Admin {uuid.uuid4()}", "age": 80, "sex": "F"}).json()["patient_id"]
+    url = f"/patients/{patient_id}"
+    body = client.patch(url, json={"antecedents": {"atrial_fibrillation": True}}).json()
+    assert body["risk_scores"]["manual"] is False
+    body = client.patch(url, json={"risk_scores": {**body["risk_scores"], "chads2vasc": 9}}).json()
+    assert body["risk_scores"]["manual"] is True
+
+    stats = RegistryRescorer(batch_size=100).run()
+    assert stats["manual"] >= 1
+    assert client.get(f"{url}/summary").json()["risk_scores"]["chads2vasc"] == 9
+
+    response = client.post("/admin/recompute_scores", params={"batch_size": 100, "overwrite_manual": True})
+    assert response.status_code == 202
+    run_id = response.json()["run_id"]
+    while main.score_runs[run_id].finished_at is None:
+        time.sleep(0.01)
+    assert client.get(f"/admin/recompute_scores/{run_id}").json()["error"] is None
+    scores = client.get(f"{url}/summary").json()["risk_scores"]
+    assert scores["chads2vasc"] == 3 and scores["manual"] is False
+
+    # Los recálculos terminados no se acumulan
+    for run in range(main.SCORE_RUNS_KEPT + 2):
+        main.score_runs[f"viejo-{run}"] = RegistryRescorer()
+        main.score_runs[f"viejo-{run}"].finished_at = 0.0
+    main._evict_finished_score_runs()
+    assert len(main.score_runs) == main.SCORE_RUNS_KEPT
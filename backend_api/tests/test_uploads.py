@@ -0,0 +1,53 @@
+import tempfile
+
+import pytest
+from fastapi import FastAPI, File, UploadFile
+from fastapi.testclient import TestClient
+from starlette.datastructures import UploadFile as StarletteUploadFile
+
+from uploads import UploadLimitMiddleware, UploadTooLargeError, check_upload_sizes, upload_buffers
+
+
+def _upload(content: bytes, max_size: int) -> StarletteUploadFile:
+    spooled = tempfile.SpooledTemporaryFile(max_size=max_size)
+    spooled.write(content)
+    spooled.seek(0)
+    return StarletteUploadFile(spooled, size=len(content), filename="scan.jpg")
+
+
+def test_check_sizes_and_zero_copy_buffers():
+    in_memory, on_disk, empty = _upload(b"abc", 1024), _upload(b"x" * 2048, 1024), _upload(b"", 1024)
+    assert check_upload_sizes([in_memory, on_disk], max_file_bytes=4096, max_request_bytes=4096) == 2051
+    with pytest.raises(UploadTooLargeError):
+        check_upload_sizes([on_disk], max_file_bytes=1024)
+    with pytest.raises(UploadTooLargeError):
+        check_upload_sizes([on_disk, on_disk], max_file_bytes=4096, max_request_bytes=3000)
+
+    with upload_buffers([in_memory, on_disk, empty]) as files_data:
+        assert isinstance(files_data[0][0], memoryview) and bytes(files_data[0][0]) == b"abc"
+        assert files_data[1][0][:4] == b"xxxx" and len(files_data[1][0]) == 2048
+        assert files_data[2][0] == b""
+    # Los buffers se liberan al salir: el archivo se puede cerrar normalmente
+    in_memory.file.close()
+
+
+def test_upload_limit_middleware_rejects_large_requests():
+    app = FastAPI()
+    app.add_middleware(UploadLimitMiddleware, paths=("/upload",), max_bytes=1000)
+
+    @app.post("/upload")
+    async def upload(files: list[UploadFile] = File(...)):
+        return {"n": len(files)}
+
+    client = TestClient(app)
+    assert client.post("/upload", files=[("files", ("a.jpg", b"x" * 100, "image/jpeg"))]).json() == {"n": 1}
+    response = client.post("/upload", files=[("files", ("a.jpg", b"x" * 5000, "image/jpeg"))])
+    assert response.status_code == 413
+
+    # Sin Content-Length (chunked): se corta al contar los bytes recibidos
+    def chunks():
+        yield b"x" * 800
+        yield b"x" * 800
+
+    response = client.post("/upload", content=chunks(), headers={"Content-Type": "multipart/form-data; boundary=b"})
+    assert response.status_code == 413
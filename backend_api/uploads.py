@@ -0,0 +1,130 @@
+import contextlib
+import logging
+import mmap
+import os
+
+from fastapi.responses import JSONResponse
+
+logger = logging.getLogger("hce_vision_backend.uploads")
+
+# --- Subidas acotadas ---
+# Starlette ya vuelca cada archivo del multipart a un SpooledTemporaryFile (en memoria
+# hasta 1 MB, después a disco). Acá se agregan los límites de tamaño y la entrega de
+# los archivos al extractor sin copiarlos: mmap si están en disco, memoryview si no.
+
+MAX_UPLOAD_FILE_BYTES = int(os.getenv("MAX_UPLOAD_FILE_BYTES", str(25 * 1024 * 1024)))
+MAX_UPLOAD_REQUEST_BYTES = int(os.getenv("MAX_UPLOAD_REQUEST_BYTES", str(100 * 1024 * 1024)))
+UPLOAD_PATHS = ("/extract_data", "/extract_data/stream", "/extract_jobs")
+
+
+class UploadTooLargeError(ValueError):
+    """El archivo o el request superan el tamaño permitido (HTTP 413)."""
+
+
+def _mb(n: int) -> str:
+    return f"{n / (1024 * 1024):.0f} MB"
+
+
+def _file_size(f) -> int:
+    position = f.tell()
+    f.seek(0, os.SEEK_END)
+    size = f.tell()
+    f.seek(position)
+    return size
+
+
+def check_upload_sizes(files, max_file_bytes: int = MAX_UPLOAD_FILE_BYTES, max_request_bytes: int = MAX_UPLOAD_REQUEST_BYTES) -> int:
+    """Valida los límites por archivo y por request. Devuelve el total de bytes."""
+    total = 0
+    for upload in files:
+        size = upload.size if upload.size is not None else _file_size(upload.file)
+        if size > max_file_bytes:
+            raise UploadTooLargeError(f"El archivo '{upload.filename}' supera el máximo de {_mb(max_file_bytes)}")
+        total += size
+        if total > max_request_bytes:
+            raise UploadTooLargeError(f"Los archivos superan el máximo de {_mb(max_request_bytes)} por solicitud")
+    return total
+
+
+def _release(buffer):
+    # Si la extracción sigue leyendo el buffer (p. ej. tras un timeout) no se puede
+    # cerrar todavía: queda para el garbage collector.
+    try:
+        buffer.close() if isinstance(buffer, mmap.mmap) else buffer.release()
+    except BufferError:
+        pass
+
+
+def map_file(f, stack: contextlib.ExitStack):
+    """Buffer sobre un archivo abierto, sin copiar su contenido (los extractores solo lo leen)."""
+    if not getattr(f, "_rolled", True):
+        # SpooledTemporaryFile todavía en memoria (BytesIO)
+        buffer = f._file.getbuffer()
+    else:
+        if _file_size(f) == 0:
+            return b""
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    stack.callback(_release, buffer)
+    return buffer
+
+
+@contextlib.contextmanager
+def upload_buffers(files):
+    """files_data [(buffer, mime_type), ...] válido dentro del bloque with."""
+    with contextlib.ExitStack() as stack:
+        yield [(map_file(upload.file, stack), upload.content_type) for upload in files]
+
+
+class UploadLimitMiddleware:
+    """
+    Corta los requests de subida que superan MAX_UPLOAD_REQUEST_BYTES mientras llegan,
+    antes de que el multipart termine de parsearse (Content-Length o conteo de bytes).
+    """
+
+    def __init__(self, app, paths=UPLOAD_PATHS, max_bytes: int = MAX_UPLOAD_REQUEST_BYTES):
+        self.app = app
+        self.paths = paths
+        self.max_bytes = max_bytes
+
+    def _too_large(self):
+        detail = f"Los archivos superan el máximo de {_mb(self.max_bytes)} por solicitud"
+        logger.warning(f"⛔ Subida rechazada: {detail}")
+        return JSONResponse(status_code=413, content={"detail": detail})
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or scope["path"] not in self.paths:
+            return await self.app(scope, receive, send)
+
+        content_length = dict(scope["headers"]).get(b"content-length")
+        if content_length and content_length.isdigit() and int(content_length) > self.max_bytes:
+            return await self._too_large()(scope, receive, send)
+
+        received = 0
+        exceeded = False
+
+        async def limited_receive():
+            nonlocal received, exceeded
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    exceeded = True
+                    raise UploadTooLargeError("request demasiado grande")
+            return message
+
+        response_started = False
+
+        async def guarded_send(message):
+            nonlocal response_started
+            if exceeded:
+                return  # la respuesta de error la manda el middleware
+            response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except Exception:
+            if not exceeded:
+                raise
+        if exceeded and not response_started:
+            await self._too_large()(scope, receive, send)